@@ -42,6 +42,7 @@ def backgroundFalseNegErrors( coco_analyze, imgs_info, saveDir ):
     sorted_fns = sorted(fn_gts, key=lambda k: -k['num_keypoints'])
     sorted_fns = [fff for fff in sorted_fns if fff['num_keypoints']>0]
     show_fn = sorted_fns[0:4] + sorted_fns[-4:]
+    utilities.prefetch_images([imgs_info[t['image_id']] for t in show_fn])
     f.write("\nBackground False Negative Errors:\n")
     for tind, t in enumerate(show_fn):
         name    = 'bckd_false_neg_%d'%tind
@@ -40,6 +40,7 @@ def backgroundFalsePosErrors( coco_analyze, imgs_info, saveDir ):
 
     sorted_fps = sorted(fp_dts, key=lambda k: -k['score'])
     show_fp = sorted_fps[0:4] + sorted_fps[-4:]
+    utilities.prefetch_images([imgs_info[t['image_id']] for t in show_fp])
     f.write("\nBackground False Positive Errors:\n")
     for tind, t in enumerate(show_fp):
         name    = 'bckd_false_pos_%d'%tind
@@ -152,14 +152,19 @@ def localizationErrors( coco_analyze, imgs_info, saveDir ):
         plt.savefig(paths[path], bbox_extra_artists=(lgd,), bbox_inches='tight')
         plt.close()
 
+    top_errs = {}
     for err in ['miss','swap','inversion','jitter']:
-        f.write("\nTop errors of type [%s]:\n"%(err))
         err_dts = [d for d in coco_analyze.corrected_dts['all'] if err in d]
         top_err_dts = sorted(err_dts, key=lambda k: -k['score'])
-        top_err_dts = sorted(top_err_dts, key=lambda k: -sum(k[err]))
+        top_errs[err] = sorted(top_err_dts, key=lambda k: -sum(k[err]))
+        utilities.prefetch_images([imgs_info[t['image_id']] for t in top_errs[err][0:7]])
+
+    for err in ['miss','swap','inversion','jitter']:
+        f.write("\nTop errors of type [%s]:\n"%(err))
+        top_err_dts = top_errs[err]
 
         for tind, t in enumerate(top_err_dts[0:7]):
-            I = io.imread(imgs_info[t['image_id']]['coco_url'])
+            I = utilities.images.read(imgs_info[t['image_id']])
             plt.figure(figsize=(10,10)); plt.axis('off')
             plt.imshow(I)
             ax = plt.gca()
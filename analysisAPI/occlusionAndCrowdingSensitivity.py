@@ -27,18 +27,22 @@ def occlusionAndCrowdingSensitivity( coco_analyze, oks, saveDir ):
     coco_gt_ids     = coco_gt.getAnnIds()
 
     overlap_index   = {}; keypoints_index = {}
+    anns = []; offsets = [0]
     for img_id in image_ids:
         img_anns = coco_gt.loadAnns(coco_gt.getAnnIds(imgIds=img_id))
-        img_anns = [k for k in img_anns if 0**2 <= k['area'] < 1e5**2]
-
-        ious = utilities.compute_ious(img_anns)
-        eye  = np.eye(len(img_anns))
-        for aind, a in enumerate(img_anns):
-            num_overlaps  = sum((ious[aind,:]-eye[aind,:])>IOU_FOR_OVERLAP)
-            num_keypoints = a['num_keypoints']
-
-            overlap_index.setdefault(num_overlaps, []).append(a['id'])
-            keypoints_index.setdefault(num_keypoints, []).append(a['id'])
+        anns    += [k for k in img_anns if 0**2 <= k['area'] < 1e5**2]
+        offsets.append(len(anns))
+
+    # ious of all the pairs of annotations of the same image in one pass
+    bboxes = np.array([a['bbox'] for a in anns], dtype=np.float64).reshape((len(anns), 4))
+    ious, _, rows, cols = utilities.compute_ious_batch(bboxes, offsets)
+    overlaps = (ious > IOU_FOR_OVERLAP) & (rows != cols)
+    num_overlaps = np.bincount(rows[overlaps], minlength=len(anns))
+    for aind, a in enumerate(anns):
+        num_keypoints = a['num_keypoints']
+
+        overlap_index.setdefault(int(num_overlaps[aind]), []).append(a['id'])
+        keypoints_index.setdefault(num_keypoints, []).append(a['id'])
 
     benchmark_overlap  = {}; benchmark_keypoint = {}
     for ind, og in enumerate(overlap_groups):
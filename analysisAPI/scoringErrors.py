@@ -52,11 +52,9 @@ def scoringErrors( coco_analyze, oks, imgs_info, saveDir ):
         gts = coco_analyze.cocoGt.loadAnns(coco_analyze.cocoGt.getAnnIds(imgIds=imgId))
         not_ignore_gts = []
         for g in gts:
-            # gt ignores are discarded
-            if g['ignore'] or (g['area']<coco_analyze.params.areaRng[0][0] or g['area']>coco_analyze.params.areaRng[0][1]):
-                g['_ignore'] = 1
-            else:
-                g['_ignore'] = 0
+            # gt ignores are discarded (same ignore rule as cocoEval, without writing it in the gt)
+            ignore = g['iscrowd'] or g['num_keypoints'] == 0
+            if not (ignore or (g['area']<coco_analyze.params.areaRng[0][0] or g['area']>coco_analyze.params.areaRng[0][1])):
                 not_ignore_gts.append(g)
 
         # compute the oks matrix between the dts and gts of each image
@@ -88,8 +86,6 @@ def scoringErrors( coco_analyze, oks, imgs_info, saveDir ):
 
             used_dts   = []
             for gind, gt in enumerate(all_gts[imgId]):
-                assert(gt['_ignore']==0)
-
                 oks = all_dtgt_oks[imgId][dind,gind]
                 dts_with_oks = np.where(oks >= min_match_oks)[0]
                 # remove the matched dts
@@ -122,6 +118,8 @@ def scoringErrors( coco_analyze, oks, imgs_info, saveDir ):
     ## print the top scoring errors of the algorithm
     ori_scoring_errors = scoring_errors['score']
     ori_scoring_errors.sort(key=lambda k: -np.sqrt((k['matched_dt']['score']-k['top_match_dt']['score'])*(k['high_oks']-k['low_oks'])))
+    ## both figures of an error show the same image
+    utilities.prefetch_images([imgs_info[err['imgId']] for err in ori_scoring_errors[0:12] for _ in range(2)])
     for ind, err in enumerate(ori_scoring_errors[0:12]):
         relevance = np.sqrt((err['matched_dt']['score']-err['top_match_dt']['score'])*(err['high_oks']-err['low_oks']))
         f.write("================================================\n")
@@ -159,8 +157,6 @@ def scoringErrors( coco_analyze, oks, imgs_info, saveDir ):
         if len(dts) * len(gtIds) == 0: continue
 
         for gind, gt in enumerate(all_gts[imgId]):
-            assert(gt['_ignore']==0)
-
             dts_oks        = all_dtgt_oks[imgId][:,gind]
             dts_high_oks_i = np.where(dts_oks > .1)[0]
             num_dts_high_oks.append(len(dts_high_oks_i))
@@ -8,6 +8,7 @@ from matplotlib.collections import PatchCollection
 from matplotlib.patches import Polygon
 from scipy.misc import imresize
 import skimage.io as io
+from pycocotools.imagestore import ImageStore
 
 """
 Utility functions
@@ -24,11 +25,27 @@ colors    = {(0,1): '#cd87ff', (0,2): '#cd87ff', (1,2): '#cd87ff', (1,3): '#cd87
             (6,8): '#74c8f9', (6,12): '#feff95',(7,9): '#74c8f9', (8,10): '#74c8f9',(11,12): '#feff95',
             (13,11): '#a2805b',(14,12): '#a2805b',(15,13): '#a2805b',(16,14): '#a2805b'}
 
+## images of the example figures, by default read from their coco_url
+images = ImageStore(reader=io.imread)
+
+def set_image_source(root=None, url_base=None, cache_dir=None, cache_size=2<<30):
+    """
+    Read the images of the example figures from a local image root or a url base.
+    """
+    global images
+    images.close()
+    images = ImageStore(root=root, url_base=url_base, cache_dir=cache_dir,
+                        cache_size=cache_size, reader=io.imread)
+
+def prefetch_images(imgs_info):
+    ## start loading the images of the examples as soon as they are chosen
+    images.prefetch(imgs_info)
+
 def show_dets(coco_dts, coco_gts, img_info, save_path=None):
     if len(coco_dts) == 0 and len(coco_gts)==0:
         return 0
     print img_info['coco_url']
-    I = io.imread(img_info['coco_url'])
+    I = images.read(img_info)
     plt.figure(figsize=(10,10)); plt.axis('off')
     plt.imshow(I)
     ax = plt.gca(); ax.set_autoscale_on(False)
@@ -129,18 +146,21 @@ def compute_oks(dts, gts):
     if len(dts) * len(gts) == 0:
         return np.array([])
     oks_mat = np.zeros((len(dts), len(gts)))
+    # build the keypoint arrays once, not once per (dt, gt) pair
+    dkpts = np.array([dt['keypoints'] for dt in dts], dtype=np.float64)
+    gkpts = np.array([gt['keypoints'] for gt in gts], dtype=np.float64)
 
     # compute oks between each detection and ground truth object
     for j, gt in enumerate(gts):
         # create bounds for ignore regions(double the gt bbox)
-        g = np.array(gt['keypoints'])
+        g = gkpts[j]
         xg = g[0::3]; yg = g[1::3]; vg = g[2::3]
         k1 = np.count_nonzero(vg > 0)
         bb = gt['bbox']
         x0 = bb[0] - bb[2]; x1 = bb[0] + bb[2] * 2
         y0 = bb[1] - bb[3]; y1 = bb[1] + bb[3] * 2
         for i, dt in enumerate(dts):
-            d = np.array(dt['keypoints'])
+            d = dkpts[i]
             xd = d[0::3]; yd = d[1::3]
             if k1>0:
                 # measure the per-keypoint distance if keypoints visible
@@ -190,13 +210,47 @@ def compute_iou(bbox_1, bbox_2):
 
     return iou
 
+def box_ious(bboxes_1, bboxes_2):
+    ## compute_iou of every pair of boxes of two broadcastable [...x4] arrays
+    bboxes_1 = np.asarray(bboxes_1, dtype=np.float64)
+    bboxes_2 = np.asarray(bboxes_2, dtype=np.float64)
+
+    xi_l = np.maximum(bboxes_1[...,0], bboxes_2[...,0])
+    xi_r = np.minimum(bboxes_1[...,0] + bboxes_1[...,2], bboxes_2[...,0] + bboxes_2[...,2])
+    yi_t = np.maximum(bboxes_1[...,1], bboxes_2[...,1])
+    yi_b = np.minimum(bboxes_1[...,1] + bboxes_1[...,3], bboxes_2[...,1] + bboxes_2[...,3])
+
+    width  = np.maximum(0, xi_r - xi_l)
+    height = np.maximum(0, yi_b - yi_t)
+    a1 = bboxes_1[...,2] * bboxes_1[...,3]
+    a2 = bboxes_2[...,2] * bboxes_2[...,3]
+
+    inter = width * height
+    union = a1 + a2 - inter
+    return np.where(union == 0, 0, inter / np.where(union == 0, 1, union))
+
 def compute_ious(anns):
-    num_boxes = len(anns)
-    ious = np.zeros((num_boxes, num_boxes))
-
-    for i in xrange(num_boxes):
-        for j in xrange(i,num_boxes):
-            ious[i,j] = compute_iou(anns[i]['bbox'],anns[j]['bbox'])
-            if i!=j:
-                ious[j,i] = ious[i,j]
-    return ious
+    ## [NxN] ious of the boxes of anns
+    bboxes = np.array([a['bbox'] for a in anns], dtype=np.float64).reshape((len(anns), 4))
+    return box_ious(bboxes[:,None,:], bboxes[None,:,:])
+
+def compute_ious_batch(bboxes, offsets):
+    """
+    Pairwise ious of the boxes of many images at once.
+    :param bboxes (float array) : [Nx4] boxes of all images, the boxes of image k are bboxes[offsets[k]:offsets[k+1]]
+    :param offsets (int array)  : [K+1] offsets of the images in bboxes
+    :return: ious (float array) : flat buffer of the [n_k x n_k] iou matrices of the images (row major)
+             ious_offsets (int array) : [K+1] offsets of the matrices in ious
+             rows, cols (int array)   : indices in bboxes of the two boxes of each entry of ious
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    sizes   = np.diff(offsets)
+    ious_offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    ious_offsets[1:] = np.cumsum(sizes ** 2)
+
+    image = np.repeat(np.arange(len(sizes)), sizes ** 2)
+    local = np.arange(ious_offsets[-1]) - ious_offsets[image]
+    rows  = offsets[image] + local // sizes[image]
+    cols  = offsets[image] + local % sizes[image]
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape((-1, 4))
+    return box_ious(bboxes[rows], bboxes[cols]), ious_offsets, rows, cols
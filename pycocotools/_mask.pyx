@@ -18,6 +18,7 @@ PYTHON_VERSION = sys.version_info[0]
 import numpy as np
 cimport numpy as np
 from libc.stdlib cimport malloc, free
+from cython.parallel cimport prange
 
 # intialized Numpy. must do.
 np.import_array()
@@ -28,7 +29,10 @@ cdef extern from "numpy/arrayobject.h":
     void PyArray_ENABLEFLAGS(np.ndarray arr, int flags)
 
 # Declare the prototype of the C functions in MaskApi.h
-cdef extern from "maskApi.h":
+# none of them touches Python objects, so they can be called without the GIL:
+# the Python objects are converted to C data before (and after) each call,
+# and the call itself runs in a nogil block so that threads can run in parallel
+cdef extern from "maskApi.h" nogil:
     ctypedef unsigned int uint
     ctypedef unsigned long siz
     ctypedef unsigned char byte
@@ -102,11 +106,13 @@ cdef class Masks:
 # internal conversion from Python RLEs object to compressed RLE format
 def _toString(RLEs Rs):
     cdef siz n = Rs.n
+    cdef siz i
     cdef bytes py_string
     cdef char* c_string
     objs = []
     for i in range(n):
-        c_string = rleToString( <RLE*> &Rs._R[i] )
+        with nogil:
+            c_string = rleToString( <RLE*> &Rs._R[i] )
         py_string = c_string
         objs.append({
             'size': [Rs._R[i].h, Rs._R[i].w],
@@ -118,9 +124,10 @@ def _toString(RLEs Rs):
 # internal conversion from compressed RLE format to Python RLEs object
 def _frString(rleObjs):
     cdef siz n = len(rleObjs)
-    Rs = RLEs(n)
+    cdef RLEs Rs = RLEs(n)
     cdef bytes py_string
     cdef char* c_string
+    cdef siz i, h, w
     for i, obj in enumerate(rleObjs):
         if PYTHON_VERSION == 2:
             py_string = str(obj['counts']).encode('utf8')
@@ -129,37 +136,45 @@ def _frString(rleObjs):
         else:
             raise Exception('Python version must be 2 or 3')
         c_string = py_string
-        rleFrString( <RLE*> &Rs._R[i], <char*> c_string, obj['size'][0], obj['size'][1] )
+        h, w = obj['size'][0], obj['size'][1]
+        with nogil:
+            rleFrString( <RLE*> &Rs._R[i], <char*> c_string, h, w )
     return Rs
 
 # encode mask to RLEs objects
 # list of RLE string can be generated by RLEs member function
 def encode(np.ndarray[np.uint8_t, ndim=3, mode='fortran'] mask):
-    h, w, n = mask.shape[0], mask.shape[1], mask.shape[2]
+    cdef siz h = mask.shape[0], w = mask.shape[1], n = mask.shape[2]
     cdef RLEs Rs = RLEs(n)
-    rleEncode(Rs._R,<byte*>mask.data,h,w,n)
+    cdef byte* M = <byte*> mask.data
+    with nogil:
+        rleEncode(Rs._R,M,h,w,n)
     objs = _toString(Rs)
     return objs
 
 # decode mask from compressed list of RLE string or RLEs object
 def decode(rleObjs):
     cdef RLEs Rs = _frString(rleObjs)
-    h, w, n = Rs._R[0].h, Rs._R[0].w, Rs._n
-    masks = Masks(h, w, n)
-    rleDecode(<RLE*>Rs._R, masks._mask, n);
+    cdef siz h = Rs._R[0].h, w = Rs._R[0].w, n = Rs._n
+    cdef Masks masks = Masks(h, w, n)
+    with nogil:
+        rleDecode(<RLE*>Rs._R, masks._mask, n)
     return np.array(masks)
 
 def merge(rleObjs, intersect=0):
     cdef RLEs Rs = _frString(rleObjs)
     cdef RLEs R = RLEs(1)
-    rleMerge(<RLE*>Rs._R, <RLE*> R._R, <siz> Rs._n, intersect)
+    cdef int _intersect = intersect
+    with nogil:
+        rleMerge(<RLE*>Rs._R, <RLE*> R._R, <siz> Rs._n, _intersect)
     obj = _toString(R)[0]
     return obj
 
 def area(rleObjs):
     cdef RLEs Rs = _frString(rleObjs)
     cdef uint* _a = <uint*> malloc(Rs._n* sizeof(uint))
-    rleArea(Rs._R, Rs._n, _a)
+    with nogil:
+        rleArea(Rs._R, Rs._n, _a)
     cdef np.npy_intp shape[1]
     shape[0] = <np.npy_intp> Rs._n
     a = np.array((Rs._n, ), dtype=np.uint8)
@@ -195,9 +210,17 @@ def iou( dt, gt, pyiscrowd ):
             raise Exception('unrecognized type.  The following type: RLEs (rle), np.ndarray (box), and list (box) are supported.')
         return objs
     def _rleIou(RLEs dt, RLEs gt, np.ndarray[np.uint8_t, ndim=1] iscrowd, siz m, siz n, np.ndarray[np.double_t,  ndim=1] _iou):
-        rleIou( <RLE*> dt._R, <RLE*> gt._R, m, n, <byte*> iscrowd.data, <double*> _iou.data )
+        cdef byte* c = <byte*> iscrowd.data
+        cdef double* o = <double*> _iou.data
+        with nogil:
+            rleIou( <RLE*> dt._R, <RLE*> gt._R, m, n, c, o )
     def _bbIou(np.ndarray[np.double_t, ndim=2] dt, np.ndarray[np.double_t, ndim=2] gt, np.ndarray[np.uint8_t, ndim=1] iscrowd, siz m, siz n, np.ndarray[np.double_t, ndim=1] _iou):
-        bbIou( <BB> dt.data, <BB> gt.data, m, n, <byte*> iscrowd.data, <double*>_iou.data )
+        cdef BB d = <BB> dt.data
+        cdef BB g = <BB> gt.data
+        cdef byte* c = <byte*> iscrowd.data
+        cdef double* o = <double*> _iou.data
+        with nogil:
+            bbIou( d, g, m, n, c, o )
     def _len(obj):
         cdef siz N = 0
         if type(obj) == RLEs:
@@ -238,11 +261,73 @@ def iou( dt, gt, pyiscrowd ):
     _iouFun(dt, gt, iscrowd, m, n, iou)
     return iou.reshape((m,n), order='F')
 
+# iou computation of many images in one call (boxes or RLEs, as for iou).
+# dt and gt hold the dts and gts of all the images, the dts of image k are
+# dt[dtOffsets[k]:dtOffsets[k+1]] and its gts (and their iscrowd flags) are
+# gt[gtOffsets[k]:gtOffsets[k+1]]. Returns a flat buffer with the [m_k x n_k]
+# iou matrix of every image (column-major, as the buffer of iou) and the
+# offsets of the matrices in it. The images are split between num_threads
+# threads when the extension is compiled with OpenMP (-fopenmp in the
+# extra_compile_args and extra_link_args of the extension), otherwise they
+# are computed one after the other.
+def iou_batch( dt, gt, pyiscrowd, dtOffsets, gtOffsets, int num_threads=1 ):
+    def _preproc(objs):
+        if type(objs) == list and len(objs) > 0 and type(objs[0]) == dict:
+            return _frString(objs)
+        objs = np.ascontiguousarray(objs, dtype=np.double)
+        if objs.size == 0:
+            objs = objs.reshape((0, 4))
+        if not len(objs.shape) == 2 or not objs.shape[1] == 4:
+            raise Exception('iou_batch input can be bounding boxes (Nx4) or RLEs ([RLE])')
+        return objs
+    def _len(obj):
+        return obj.n if type(obj) == RLEs else obj.shape[0]
+    dt = _preproc(dt)
+    gt = _preproc(gt)
+    cdef np.ndarray[np.int64_t, ndim=1] dOff = np.ascontiguousarray(dtOffsets, dtype=np.int64)
+    cdef np.ndarray[np.int64_t, ndim=1] gOff = np.ascontiguousarray(gtOffsets, dtype=np.int64)
+    cdef np.ndarray[np.uint8_t, ndim=1] iscrowd = np.ascontiguousarray(pyiscrowd, dtype=np.uint8)
+    if not len(dOff) == len(gOff) or len(dOff) == 0:
+        raise Exception('dtOffsets and gtOffsets should have the same length K+1')
+    if not dOff[-1] == _len(dt) or not gOff[-1] == _len(gt) or not len(iscrowd) == _len(gt):
+        raise Exception('the offsets and iscrowd do not match the number of dts and gts')
+    if _len(dt) > 0 and _len(gt) > 0 and not type(dt) == type(gt):
+        raise Exception('The dt and gt should have the same data type, either RLEs, list or np.ndarray')
+    cdef np.ndarray[np.int64_t, ndim=1] oOff = np.zeros((len(dOff), ), dtype=np.int64)
+    oOff[1:] = np.cumsum(np.diff(dOff) * np.diff(gOff))
+    cdef np.ndarray[np.double_t, ndim=1] _iou = np.zeros((oOff[-1], ), dtype=np.double)
+
+    # plain C views of the inputs, used without the GIL
+    cdef int isrle = type(dt) == RLEs or type(gt) == RLEs
+    cdef RLE* dR = (<RLEs> dt)._R if type(dt) == RLEs else NULL
+    cdef RLE* gR = (<RLEs> gt)._R if type(gt) == RLEs else NULL
+    cdef np.ndarray[np.double_t, ndim=2] dB = dt if not isrle else np.zeros((0, 4))
+    cdef np.ndarray[np.double_t, ndim=2] gB = gt if not isrle else np.zeros((0, 4))
+    cdef BB d = <BB> dB.data
+    cdef BB g = <BB> gB.data
+    cdef byte* c = <byte*> iscrowd.data
+    cdef double* o = <double*> _iou.data
+    cdef np.int64_t* do = <np.int64_t*> dOff.data
+    cdef np.int64_t* go = <np.int64_t*> gOff.data
+    cdef np.int64_t* oo = <np.int64_t*> oOff.data
+    cdef Py_ssize_t k, K = len(dOff) - 1
+    cdef siz m, n
+    for k in prange(K, nogil=True, schedule='dynamic', num_threads=num_threads):
+        m = do[k+1] - do[k]
+        n = go[k+1] - go[k]
+        if m > 0 and n > 0:
+            if isrle:
+                rleIou( &dR[do[k]], &gR[go[k]], m, n, &c[go[k]], &o[oo[k]] )
+            else:
+                bbIou( &d[4*do[k]], &g[4*go[k]], m, n, &c[go[k]], &o[oo[k]] )
+    return _iou, oOff
+
 def toBbox( rleObjs ):
     cdef RLEs Rs = _frString(rleObjs)
     cdef siz n = Rs.n
     cdef BB _bb = <BB> malloc(4*n* sizeof(double))
-    rleToBbox( <const RLE*> Rs._R, _bb, n )
+    with nogil:
+        rleToBbox( <const RLE*> Rs._R, _bb, n )
     cdef np.npy_intp shape[1]
     shape[0] = <np.npy_intp> 4*n
     bb = np.array((1,4*n), dtype=np.double)
@@ -252,18 +337,24 @@ def toBbox( rleObjs ):
 
 def frBbox(np.ndarray[np.double_t, ndim=2] bb, siz h, siz w ):
     cdef siz n = bb.shape[0]
-    Rs = RLEs(n)
-    rleFrBbox( <RLE*> Rs._R, <const BB> bb.data, h, w, n )
+    cdef RLEs Rs = RLEs(n)
+    cdef BB _bb = <BB> bb.data
+    with nogil:
+        rleFrBbox( <RLE*> Rs._R, <const BB> _bb, h, w, n )
     objs = _toString(Rs)
     return objs
 
 def frPoly( poly, siz h, siz w ):
     cdef np.ndarray[np.double_t, ndim=1] np_poly
+    cdef siz i, k
+    cdef double* xy
     n = len(poly)
-    Rs = RLEs(n)
+    cdef RLEs Rs = RLEs(n)
     for i, p in enumerate(poly):
         np_poly = np.array(p, dtype=np.double, order='F')
-        rleFrPoly( <RLE*>&Rs._R[i], <const double*> np_poly.data, int(len(p)/2), h, w )
+        xy, k = <double*> np_poly.data, int(len(p)/2)
+        with nogil:
+            rleFrPoly( <RLE*>&Rs._R[i], <const double*> xy, k, h, w )
     objs = _toString(Rs)
     return objs
 
@@ -271,15 +362,19 @@ def frUncompressedRLE(ucRles, siz h, siz w):
     cdef np.ndarray[np.uint32_t, ndim=1] cnts
     cdef RLE R
     cdef uint *data
+    cdef uint *src
+    cdef siz j, m
     n = len(ucRles)
     objs = []
     for i in range(n):
         Rs = RLEs(1)
         cnts = np.array(ucRles[i]['counts'], dtype=np.uint32)
+        m, src = len(cnts), <uint*> cnts.data
         # time for malloc can be saved here but it's fine
-        data = <uint*> malloc(len(cnts)* sizeof(uint))
-        for j in range(len(cnts)):
-            data[j] = <uint> cnts[j]
+        data = <uint*> malloc(m* sizeof(uint))
+        with nogil:
+            for j in range(m):
+                data[j] = src[j]
         R = RLE(ucRles[i]['size'][0], ucRles[i]['size'][1], len(cnts), <uint*> data)
         Rs._R[0] = R
         objs.append(_toString(Rs)[0])
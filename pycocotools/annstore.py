@@ -0,0 +1,599 @@
+import os
+import copy
+import pickle
+import itertools
+import numpy as np
+from .sharedmem import SharedArrays, packObjects, PackedObjects
+
+# Columnar storage for COCO annotations.
+#
+# An AnnStore keeps the numeric fields of N annotations as contiguous numpy
+# arrays (one array per field) instead of N Python dicts. For keypoint
+# annotation files this removes the per-annotation dict and the Python list
+# of 3*K numbers, and lets consumers read the keypoints of many annotations
+# with a single fancy index instead of calling np.array(ann['keypoints'])
+# for every annotation.
+#
+# The columns are:
+#  ids           - [N]     int64   annotation ids
+#  image_id      - [N]     int64   image id of every annotation
+#  category_id   - [N]     int64   category id of every annotation
+#  iscrowd       - [N]     uint8   crowd flag
+#  num_keypoints - [N]     int32   number of labeled keypoints
+#  area          - [N]     float64 annotation area
+#  bbox          - [Nx4]   float64 bounding box [x y w h]
+#  keypoints     - [NxKx3] float32 (x, y, v) for every keypoint (float64 if not integral)
+#  score         - [N]     float64 detection confidence (results only)
+# A column is None when the annotations do not have that field. Any other
+# field (segmentation, caption, ...) is kept per annotation in "extras".
+# Stores of bbox results set "bbox_segm": annotations without a segmentation
+# get the polygon of their box when they are materialized, as in loadRes.
+#
+# Annotations are turned back into dicts only when asked for, see AnnMap,
+# or handed out as AnnRecords that read the arrays on access.
+# The store reflects the annotations as they were loaded: changing a dict
+# produced by AnnMap does not change the arrays.
+#
+# share / attach place the arrays of a store (and of its index) in shared
+# memory, so that the workers of a process pool read one copy of them. The
+# extras go in the segment pickled one annotation at a time (see
+# packObjects), workers unpickle the extras of the annotations they read.
+
+COLUMNS = ['image_id', 'category_id', 'iscrowd', 'num_keypoints', 'area', 'bbox', 'keypoints', 'score']
+DTYPES  = {'image_id': np.int64, 'category_id': np.int64, 'iscrowd': np.uint8, 'num_keypoints': np.int32,
+           'area': np.float64, 'bbox': np.float64, 'keypoints': np.float32, 'score': np.float64}
+
+def _stack(values, dtype):
+    # np.array is slow on long lists of lists, lists of equal length are
+    # flattened into np.fromiter instead
+    if len(values) == 0 or not isinstance(values[0], list):
+        return np.array(values, dtype=dtype)
+    lengths = set(map(len, values))
+    if len(lengths) != 1:
+        raise ValueError('ragged column')
+    L = lengths.pop()
+    return np.fromiter(itertools.chain.from_iterable(values), dtype, len(values) * L).reshape((len(values), L))
+
+class AnnStore:
+    def __init__(self, ids, columns, extras=None, kpt_integral=False, order=None, bbox_segm=False):
+        '''
+        Build a store from already computed columns.
+        :param ids (int array)     : [N] annotation ids
+        :param columns (dict)      : field name -> numpy array with N rows (see COLUMNS)
+        :param extras (list)       : [N] dicts with the remaining fields of each annotation, or None
+        :param kpt_integral (bool) : materialize keypoints as ints (the source file stored ints)
+        :param order (int array)   : [N] rows sorted by id, computed when not given
+        :param bbox_segm (bool)    : give annotations without segmentation the polygon of their bbox
+        :return: None
+        '''
+        self.ids = np.asarray(ids, dtype=np.int64)
+        for name in COLUMNS:
+            setattr(self, name, columns.get(name))
+        self.fields = [name for name in COLUMNS if columns.get(name) is not None]
+        self.extras = extras
+        self.kpt_integral = kpt_integral
+        self.bbox_segm = bbox_segm
+        self._order = np.argsort(self.ids, kind='mergesort') if order is None else order
+        self._sorted_ids = self.ids[self._order]
+        self._index = None
+
+    @classmethod
+    def fromAnns(cls, anns, kpt_dtype=None, ids=None):
+        '''
+        Build a store from a list of annotation dicts.
+        :param anns (object array) : annotations as loaded from a COCO json file
+        :param kpt_dtype (dtype)   : dtype used for the keypoints column, by default float32
+                                     when all values are integral (lossless) and float64 otherwise
+        :param ids (int array)     : [N] annotation ids, by default the 'id' of every annotation
+        :return: store (AnnStore)
+        '''
+        N = len(anns)
+        columns = {}
+        kpt_integral = False
+        for name in COLUMNS:
+            try:
+                col = _stack([ann[name] for ann in anns], np.float64 if name == 'keypoints' else DTYPES[name])
+            except (KeyError, ValueError, TypeError):
+                # missing, ragged or non numeric values stay in the per annotation extras
+                continue
+            if N == 0 or (name == 'bbox' and col.shape != (N, 4)):
+                continue
+            if name == 'keypoints':
+                if col.ndim != 2 or col.shape[1] % 3 != 0:
+                    continue
+                kpt_integral = bool(np.all(col == np.round(col)))
+                if kpt_dtype is None:
+                    kpt_dtype = DTYPES[name] if kpt_integral else np.float64
+                col = col.astype(kpt_dtype).reshape((N, -1, 3))
+            elif col.ndim != 1 and name != 'bbox':
+                continue
+            columns[name] = col
+        keys = set().union(*anns) - set(columns.keys()) - set(['id'])
+        extras = [dict((k, ann[k]) for k in keys if k in ann) for ann in anns] if keys else None
+        if ids is None:
+            ids = np.array([ann['id'] for ann in anns], dtype=np.int64)
+        return cls(ids, columns, extras, kpt_integral)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        '''
+        Load a store written by AnnStore.save.
+        :param path (str)      : directory the store was saved to
+        :param mmap_mode (str) : mode used to memory map the columns, None reads them in memory
+        :return: store (AnnStore)
+        '''
+        with open(os.path.join(path, 'store.pkl'), 'rb') as f:
+            meta = pickle.load(f)
+        load = lambda name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+        columns = dict((name, load(name)) for name in meta['fields'])
+        return cls(load('ids'), columns, meta['extras'], meta['kpt_integral'], order=load('order'),
+                   bbox_segm=meta.get('bbox_segm', False))
+
+    def save(self, path):
+        '''
+        Save the store as one .npy file per column, so that it can be memory mapped by AnnStore.load.
+        :param path (str) : directory where the store is written
+        :return: None
+        '''
+        if not os.path.exists(path):
+            os.makedirs(path)
+        np.save(os.path.join(path, 'ids.npy'), self.ids)
+        np.save(os.path.join(path, 'order.npy'), self._order)
+        for name in self.fields:
+            np.save(os.path.join(path, name + '.npy'), np.ascontiguousarray(getattr(self, name)))
+        # extras of an attached store are a PackedObjects
+        extras = self.extras if self.extras is None or isinstance(self.extras, list) else list(self.extras)
+        with open(os.path.join(path, 'store.pkl'), 'wb') as f:
+            pickle.dump({'fields': self.fields, 'extras': extras, 'kpt_integral': self.kpt_integral,
+                         'bbox_segm': self.bbox_segm}, f, 2)
+
+    def share(self, skip=(), meta=None, arrays=None):
+        '''
+        Copy the store into a shared memory segment that the workers of a process pool can attach to.
+        :param skip (list)    : extra fields left out of the shared store (e.g. ['segmentation'] for keypoints)
+        :param meta (obj)     : small picklable data sent along, available as store.shared.meta['extra']
+        :param arrays (dict)  : more arrays copied in the segment, available in store.shared.arrays
+        :return: shared (SharedArrays) : owner of the segment, pass shared.handle to AnnStore.attach
+        '''
+        columns = {'ids': self.ids, 'order': self._order}
+        for name in self.fields:
+            columns[name] = getattr(self, name)
+        if self.image_id is not None:
+            index = self.index
+            columns.update({'index_order': index.order, 'index_imgIds': index.imgIds, 'index_offsets': index.offsets})
+        extras = self.extras
+        if extras is not None:
+            if len(skip) > 0:
+                extras = [dict((k, v) for k, v in extra.items() if not k in skip) for extra in extras]
+            packed = packObjects(extras)
+            columns.update({'extras_data': packed['data'], 'extras_offsets': packed['offsets']})
+        if arrays is not None:
+            columns.update(arrays)
+        return SharedArrays(columns, {'fields': self.fields, 'kpt_integral': self.kpt_integral,
+                                      'bbox_segm': self.bbox_segm, 'extra': meta})
+
+    @classmethod
+    def attach(cls, handle):
+        '''
+        Get a read-only store over a shared memory segment created by AnnStore.share, without copying it.
+        :param handle (dict)     : shared.handle of the segment
+        :return: store (AnnStore) : store whose columns are views of the segment (kept open in store.shared)
+        '''
+        shared = SharedArrays.attach(handle)
+        arrays, meta = shared.arrays, shared.meta
+        columns = dict((name, arrays[name]) for name in meta['fields'])
+        extras = None
+        if 'extras_data' in arrays:
+            extras = PackedObjects(arrays['extras_data'], arrays['extras_offsets'])
+        store = cls(arrays['ids'], columns, extras, meta['kpt_integral'], order=arrays['order'],
+                    bbox_segm=meta['bbox_segm'])
+        if 'index_order' in arrays:
+            store._index = AnnIndex(store.ids, store.image_id, store.category_id, store.area, store.iscrowd,
+                                    sorted=(arrays['index_order'], arrays['index_imgIds'], arrays['index_offsets']))
+        store.shared = shared
+        return store
+
+    @classmethod
+    def concat(cls, stores, ids):
+        '''
+        Concatenate the rows of several stores with the same fields.
+        :param stores (list)   : stores to concatenate, in order
+        :param ids (int array) : ids of the rows of the result
+        :return: store (AnnStore), raises ValueError if the stores do not have the same fields or column shapes
+        '''
+        fields, bbox_segm = stores[0].fields, stores[0].bbox_segm
+        if any(store.fields != fields or store.bbox_segm != bbox_segm for store in stores):
+            raise ValueError('stores with different fields')
+        columns = dict((name, np.concatenate([getattr(store, name) for store in stores])) for name in fields)
+        extras = None
+        if any(store.extras is not None for store in stores):
+            extras = []
+            for store in stores:
+                extras += store.extras if store.extras is not None else [{} for _ in range(len(store))]
+        kpt_integral = all(store.kpt_integral for store in stores)
+        return cls(ids, columns, extras, kpt_integral, bbox_segm=bbox_segm)
+
+    def take(self, rows):
+        '''
+        Get a store with the given rows of this store (only those rows are copied).
+        :param rows (int array)  : rows to keep, in the order they are given
+        :return: store (AnnStore)
+        '''
+        columns = dict((name, getattr(self, name)[rows]) for name in self.fields)
+        extras = None if self.extras is None else [self.extras[row] for row in rows]
+        return AnnStore(self.ids[rows], columns, extras, self.kpt_integral, bbox_segm=self.bbox_segm)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        arrays = [self.ids, self._order, self._sorted_ids] + [getattr(self, name) for name in self.fields]
+        return sum(a.nbytes for a in arrays)
+
+    def rows(self, ids):
+        '''
+        Get the row index of the annotations with the given ids.
+        :param ids (int array)  : annotation ids
+        :return: rows (int array) : row of every id, raises KeyError for unknown ids
+        '''
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        pos = np.searchsorted(self._sorted_ids, ids)
+        pos[pos == len(self._sorted_ids)] = 0
+        if len(ids) and (len(self._sorted_ids) == 0 or np.any(self._sorted_ids[pos] != ids)):
+            missing = ids[self._sorted_ids[pos] != ids] if len(self._sorted_ids) else ids
+            raise KeyError(int(missing[0]))
+        return self._order[pos]
+
+    def row(self, id):
+        return int(self.rows([id])[0])
+
+    @property
+    def index(self):
+        # built on first use, the columns it filters on never change
+        if self._index is None:
+            self._index = AnnIndex(self.ids, self.image_id, self.category_id, self.area, self.iscrowd)
+        return self._index
+
+    def imgRows(self, imgId):
+        '''
+        Get the rows of all annotations of an image, in load order.
+        :param imgId (int)        : image id
+        :return: rows (int array) : rows of the annotations of the image
+        '''
+        return self.index.rows([imgId])
+
+    def imgIds(self):
+        return self.index.imgIds.tolist()
+
+    def keys(self, row):
+        '''
+        Get the fields of the annotation stored at the given row, in the order AnnStore.ann gives them.
+        :param row (int)     : row index
+        :return: keys (list)
+        '''
+        keys = ['id'] + self.fields
+        if self.extras is not None:
+            keys += list(self.extras[row].keys())
+        if self.bbox_segm and (self.extras is None or not 'segmentation' in self.extras[row]):
+            keys.append('segmentation')
+        return keys
+
+    def value(self, row, name):
+        '''
+        Materialize one field of the annotation stored at the given row.
+        :param row (int)   : row index
+        :param name (str)  : field name
+        :return: value (obj) : value of the field, as in the dict given by AnnStore.ann, raises KeyError if missing
+        '''
+        if name == 'id':
+            return int(self.ids[row])
+        if name in self.fields:
+            col = getattr(self, name)
+            if name == 'keypoints':
+                kpts = col[row].reshape(-1)
+                return kpts.astype(np.int64).tolist() if self.kpt_integral else kpts.tolist()
+            elif name == 'bbox':
+                return col[row].tolist()
+            return col[row].item()
+        if self.extras is not None and name in self.extras[row]:
+            return self.extras[row][name]
+        if self.bbox_segm and name == 'segmentation':
+            x1, y1, w, h = self.bbox[row].tolist()
+            x2, y2 = x1+w, y1+h
+            return [[x1, y1, x1, y2, x2, y2, x2, y1]]
+        raise KeyError(name)
+
+    def ann(self, row):
+        '''
+        Materialize the annotation stored at the given row as a dict.
+        :param row (int)     : row index
+        :return: ann (dict)  : annotation with the same fields it was loaded with
+        '''
+        return dict((name, self.value(row, name)) for name in self.keys(row))
+
+class AnnIndex:
+    # Compressed sparse row index of annotations by image, plus the columns
+    # used by COCO.getAnnIds to filter them. The rows of the annotations are
+    # sorted by image (stable, so load order is kept within an image) and
+    # offsets[i]:offsets[i+1] is the slice of "order" that holds the rows of
+    # imgIds[i]. Any list of images then maps to rows with a few vectorized
+    # numpy calls and the category / area / crowd filters are boolean masks.
+    def __init__(self, ids, image_id, category_id=None, area=None, iscrowd=None, sorted=None):
+        '''
+        :param ids (int array)         : [N] annotation ids
+        :param image_id (int array)    : [N] image id of every annotation
+        :param category_id (int array) : [N] category ids, or None if not all annotations have one
+        :param area (float array)      : [N] areas, or None
+        :param iscrowd (int array)     : [N] crowd flags, or None
+        :param sorted (tuple)          : (order, imgIds, offsets) of an index already built on image_id
+        :return: None
+        '''
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.category_id = category_id
+        self.area = area
+        self.iscrowd = iscrowd
+        if sorted is not None:
+            self.order, self.imgIds, self.offsets = sorted
+            return
+        image_id = np.asarray(image_id, dtype=np.int64)
+        self.order = np.argsort(image_id, kind='mergesort')
+        self.imgIds, offsets = np.unique(image_id[self.order], return_index=True)
+        self.offsets = np.append(offsets, len(image_id)).astype(np.int64)
+
+    @classmethod
+    def fromAnns(cls, anns):
+        '''
+        Build the index of a list of annotation dicts.
+        :param anns (object array) : annotations
+        :return: index (AnnIndex)  : index, or None if ids or image ids are missing or not integers
+        '''
+        def column(name, dtype):
+            try:
+                return np.array([ann[name] for ann in anns], dtype=dtype).reshape(len(anns))
+            except (KeyError, ValueError, TypeError):
+                return None
+        ids, image_id = column('id', np.int64), column('image_id', np.int64)
+        if ids is None or image_id is None:
+            return None
+        return cls(ids, image_id, column('category_id', np.int64), column('area', np.float64), column('iscrowd', np.int64))
+
+    def rows(self, imgIds):
+        '''
+        Get the rows of the annotations of the given images.
+        :param imgIds (int array) : image ids, unknown ids are skipped
+        :return: rows (int array) : rows of all annotations, image by image in the given order
+        '''
+        imgIds = np.asarray(imgIds, dtype=np.int64).reshape(-1)
+        if len(self.imgIds) == 0:
+            return np.zeros((0,), dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.imgIds, imgIds), len(self.imgIds) - 1)
+        pos = pos[self.imgIds[pos] == imgIds]
+        starts, lengths = self.offsets[pos], self.offsets[pos + 1] - self.offsets[pos]
+        # position of every output element inside the slice of its image
+        within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return self.order[np.repeat(starts, lengths) + within]
+
+    def getAnnIds(self, imgIds=[], catIds=[], areaRng=[], iscrowd=None):
+        '''
+        Same as COCO.getAnnIds.
+        :return: ids (int array) : ann ids, or None if a filter needs a field that some annotation does not have
+        '''
+        if (len(catIds) > 0 and self.category_id is None) or (len(areaRng) > 0 and self.area is None) \
+                or (not iscrowd == None and self.iscrowd is None):
+            return None
+        try:
+            rows = np.arange(len(self.ids)) if len(imgIds) == 0 else self.rows(imgIds)
+        except (ValueError, TypeError, OverflowError):
+            return None
+        keep = np.ones(len(rows), dtype=bool)
+        if len(catIds) > 0:
+            keep &= np.isin(self.category_id[rows], catIds)
+        if len(areaRng) > 0:
+            area = self.area[rows]
+            keep &= (area > areaRng[0]) & (area < areaRng[1])
+        if not iscrowd == None:
+            keep &= self.iscrowd[rows] == iscrowd
+        return self.ids[rows[keep]].tolist()
+
+# marks a field deleted from an AnnRecord
+_DELETED = object()
+
+class AnnRecord(object):
+    # Compact stand-in for the dict of one annotation of an AnnStore. A
+    # record only holds its store and row (__slots__, no per-instance dict):
+    # ann['keypoints'] builds the list of the row of the keypoints column
+    # when it is read instead of keeping 3*K Python floats per annotation,
+    # and the field names are the ones of the store, shared by all records.
+    # Fields set (or deleted) on a record are kept in a small dict of
+    # changes that hides the stored value, the arrays are never written.
+    # Copying or pickling a record gives a plain dict.
+    __slots__ = ('store', 'row', 'changes')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+        self.changes = None
+
+    def __getitem__(self, key):
+        if self.changes is not None and key in self.changes:
+            value = self.changes[key]
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
+        return self.store.value(self.row, key)
+
+    def __setitem__(self, key, value):
+        if self.changes is None:
+            self.changes = {}
+        self.changes[key] = value
+
+    def __delitem__(self, key):
+        self[key]
+        self[key] = _DELETED
+
+    def keys(self):
+        keys = self.store.keys(self.row)
+        if self.changes is not None:
+            keys = [k for k in keys if not self.changes.get(k) is _DELETED]
+            keys += [k for k, v in self.changes.items() if not v is _DELETED and not k in keys]
+        return keys
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[key]
+        return value
+
+    def setdefault(self, key, default=None):
+        if not key in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def copy(self):
+        return dict(self.items())
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self.copy(), memo)
+
+    def __reduce__(self):
+        return (dict, (self.copy(),))
+
+    def __eq__(self, other):
+        if isinstance(other, AnnRecord):
+            other = other.copy()
+        return isinstance(other, dict) and self.copy() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.copy())
+
+class AnnMap:
+    # Dict-like view {ann id: ann} over an AnnStore. Annotations are built on
+    # first access and cached, so every caller gets (and may modify) the same
+    # object, exactly as with the dict based index. The annotations are dicts,
+    # or AnnRecords if records is set.
+    def __init__(self, store, cache=None, records=False):
+        self.store = store
+        self.records = records
+        self._cache = {} if cache is None else cache
+
+    def subset(self, store):
+        # map over a store taken from this one, sharing the cached annotations
+        return AnnMap(store, self._cache, self.records)
+
+    def __getitem__(self, id):
+        ann = self._cache.get(id)
+        if ann is None:
+            row = self.store.row(id)
+            ann = AnnRecord(self.store, row) if self.records else self.store.ann(row)
+            self._cache[id] = ann
+        return ann
+
+    def get(self, id, default=None):
+        try:
+            return self[id]
+        except KeyError:
+            return default
+
+    def __contains__(self, id):
+        try:
+            self.store.row(id)
+        except (KeyError, TypeError, ValueError):
+            return False
+        return True
+
+    def __len__(self):
+        return len(self.store)
+
+    def __iter__(self):
+        return iter(self.store.ids.tolist())
+
+    def keys(self):
+        return self.store.ids.tolist()
+
+    def values(self):
+        return [self[id] for id in self.store.ids.tolist()]
+
+    def items(self):
+        return [(id, self[id]) for id in self.store.ids.tolist()]
+
+class AnnList:
+    # Read-only list-like view of all annotations of an AnnMap in load order,
+    # used as dataset['annotations'] by a columnar COCO object.
+    def __init__(self, anns):
+        self.anns = anns
+
+    def __len__(self):
+        return len(self.anns)
+
+    def __getitem__(self, i):
+        ids = self.anns.store.ids[i]
+        if isinstance(ids, np.ndarray):
+            return [self.anns[id] for id in ids.tolist()]
+        return self.anns[int(ids)]
+
+    def __iter__(self):
+        for id in self.anns.store.ids.tolist():
+            yield self.anns[id]
+
+class ImgToAnns:
+    # Dict-like view {image id: [anns]} over an AnnMap.
+    def __init__(self, anns):
+        self.anns = anns
+
+    def __getitem__(self, imgId):
+        rows = self.anns.store.imgRows(imgId)
+        return [self.anns[id] for id in self.anns.store.ids[rows].tolist()]
+
+    def __contains__(self, imgId):
+        return len(self.anns.store.imgRows(imgId)) > 0
+
+    def __len__(self):
+        return len(self.anns.store.imgIds())
+
+    def __iter__(self):
+        return iter(self.anns.store.imgIds())
+
+    def keys(self):
+        return self.anns.store.imgIds()
@@ -0,0 +1,179 @@
+import numpy as np
+from .sparseious import SparseIous
+
+# Ious (or oks) of many images kept in the flat buffers of a batched computation.
+#
+# computeIoUBatch and computeOksBatch produce the [m_k x n_k] matrices of all
+# the (imgId, catId) keys of an evaluation as one flat buffer: matrix k is
+# data[offsets[k]:offsets[k+1]], in row major ('C') or column major ('F')
+# order. BatchIous keeps that buffer as it is and behaves as the read-only
+# dict {key: ious} that evaluateImg reads, each lookup slicing the buffer.
+#
+# A sparse BatchIous holds the pairs above eps of all the images in one CSR
+# layout instead: the dt rows of all images are stacked (rowOffsets[k] is
+# the first row of image k) and indptr, indices and data are those of the
+# stacked rows, so that a lookup gives the SparseIous of the image as views.
+#
+# fromChunks assembles a BatchIous from the output of a batched kernel, one
+# chunk of consecutive images at a time: a sparse BatchIous never holds the
+# dense values of more than one chunk.
+
+class BatchIous:
+    def __init__(self, keys, shapes, offsets, data, order='C', indptr=None, indices=None):
+        '''
+        :param keys (list)         : [K] (imgId, catId) of the images
+        :param shapes (int array)  : [Kx2] (m_k, n_k), m_k = 0 or n_k = 0 for images without ious
+        :param offsets (int array) : [K+1] offsets of the values of each image in data
+        :param data (float array)  : flat buffer of the ious
+        :param order (str)         : 'C' for row major matrices, 'F' for column major (dense only)
+        :param indptr (int array)  : [R+1] offsets in data of the pairs of each stacked dt row, None if dense
+        :param indices (int array) : gt column of each pair of data, None if dense
+        :return: None
+        '''
+        self._keys = list(keys)
+        self._index = dict((key, k) for k, key in enumerate(self._keys))
+        self.shapes = shapes
+        self.offsets = offsets
+        self.data = data
+        self.order = order
+        self.indptr = indptr
+        self.indices = indices
+        self.rowOffsets = np.zeros((len(self._keys)+1,), dtype=np.int64)
+        self.rowOffsets[1:] = np.cumsum(shapes[:,0])
+
+    @property
+    def sparse(self):
+        return self.indptr is not None
+
+    @staticmethod
+    def fromChunks(keys, shapes, chunks, order='C', eps=None):
+        '''
+        Assemble the output of a batched kernel.
+        :param keys (list)        : [K] (imgId, catId) of the images
+        :param shapes (int array) : [Kx2] shapes of the matrices
+        :param chunks (iterable)  : (b0, b1, values) with the flat values of the matrices of the images b0 to b1-1,
+                                    for consecutive ranges of images that cover all of them
+        :param order (str)        : order of the matrices in the values, 'C' or 'F'
+        :param eps (float)        : keep only the pairs with an iou above eps, None for dense matrices
+        :return: ious (BatchIous)
+        '''
+        shapes = np.asarray(shapes, dtype=np.int64).reshape((len(keys), 2))
+        sizes = shapes[:,0] * shapes[:,1]
+        offsets = np.zeros((len(keys)+1,), dtype=np.int64)
+        offsets[1:] = np.cumsum(sizes)
+        if eps is None:
+            data = np.zeros((offsets[-1],))
+            for b0, b1, values in chunks:
+                data[offsets[b0]:offsets[b1]] = values
+            return BatchIous(keys, shapes, offsets, data, order)
+        rowOffsets = np.zeros((len(keys)+1,), dtype=np.int64)
+        rowOffsets[1:] = np.cumsum(shapes[:,0])
+        rows, cols, data = [np.zeros((0,), dtype=np.int64)], [np.zeros((0,), dtype=np.int64)], [np.zeros((0,))]
+        for b0, b1, values in chunks:
+            blocks = np.arange(b0, b1)
+            block = np.repeat(blocks, sizes[blocks])
+            keep = np.nonzero(values > eps)[0]
+            block = block[keep]
+            local = keep + offsets[b0] - offsets[block]
+            m, n = shapes[block,0], shapes[block,1]
+            r, c = (local // n, local % n) if order == 'C' else (local % m, local // m)
+            r = r + rowOffsets[block]
+            if order == 'F':
+                # the pairs of each image are stored column by column
+                s = np.lexsort((c, r))
+                r, c, keep = r[s], c[s], keep[s]
+            rows.append(r)
+            cols.append(c)
+            data.append(values[keep])
+        rows = np.concatenate(rows)
+        indptr = np.zeros((rowOffsets[-1]+1,), dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(rows, minlength=rowOffsets[-1]))
+        return BatchIous(keys, shapes, indptr[rowOffsets], np.concatenate(data), 'C', indptr, np.concatenate(cols))
+
+    @staticmethod
+    def fromDict(ious):
+        '''
+        :param ious (dict)       : (imgId, catId) -> [DxG] ious, SparseIous or []
+        :return: ious (BatchIous) : the same ious in flat buffers, sparse if any of them is a SparseIous
+        '''
+        keys = list(ious.keys())
+        values = [ious[key] for key in keys]
+        shapes = np.array([o.shape if len(o) > 0 else (0, 0) for o in values], dtype=np.int64).reshape((len(keys), 2))
+        if not any(isinstance(o, SparseIous) for o in values):
+            chunks = [(k, k+1, np.asarray(o, dtype=np.float64).reshape(-1)) for k, o in enumerate(values)]
+            return BatchIous.fromChunks(keys, shapes, chunks)
+        values = [SparseIous.fromDense(o) if isinstance(o, np.ndarray) else o for o in values]
+        values = [o for o in values if len(o) > 0]
+        indptr = np.zeros((int(shapes[:,0].sum())+1,), dtype=np.int64)
+        indptr[1:] = np.cumsum(np.concatenate([np.zeros((0,), dtype=np.int64)] + [np.diff(o.indptr) for o in values]))
+        rowOffsets = np.zeros((len(keys)+1,), dtype=np.int64)
+        rowOffsets[1:] = np.cumsum(shapes[:,0])
+        return BatchIous(keys, shapes, indptr[rowOffsets],
+                         np.concatenate([np.zeros((0,))] + [o.data for o in values]), 'C', indptr,
+                         np.concatenate([np.zeros((0,), dtype=np.int64)] + [o.indices for o in values]))
+
+    def arrays(self):
+        '''
+        :return: arrays (dict) : the buffers of the ious, see fromArrays (the order goes along separately)
+        '''
+        arrays = {'keys': np.array(self._keys, dtype=np.int64).reshape((len(self._keys), 2)),
+                  'shapes': self.shapes, 'offsets': self.offsets, 'data': self.data}
+        if self.sparse:
+            arrays.update({'indptr': self.indptr, 'indices': self.indices})
+        return arrays
+
+    @staticmethod
+    def fromArrays(arrays, order='C'):
+        '''
+        :param arrays (dict)     : output of BatchIous.arrays (or views of it), not copied
+        :param order (str)       : order of the ious that gave the arrays
+        :return: ious (BatchIous)
+        '''
+        keys = [tuple(key) for key in arrays['keys'].tolist()]
+        return BatchIous(keys, arrays['shapes'], arrays['offsets'], arrays['data'], order,
+                         arrays.get('indptr'), arrays.get('indices'))
+
+    def __getitem__(self, key):
+        k = self._index[key]
+        m, n = int(self.shapes[k,0]), int(self.shapes[k,1])
+        if m == 0 or n == 0:
+            return []
+        a, b = self.offsets[k], self.offsets[k+1]
+        if self.indptr is None:
+            return self.data[a:b].reshape((m, n), order=self.order)
+        r = self.rowOffsets[k]
+        return SparseIous((m, n), self.indptr[r:r+m+1] - a, self.indices[a:b], self.data[a:b])
+
+    def get(self, key, default=None):
+        return self[key] if key in self._index else default
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def keys(self):
+        return list(self._keys)
+
+    def values(self):
+        return [self[key] for key in self._keys]
+
+    def items(self):
+        return [(key, self[key]) for key in self._keys]
+
+def imageRanges(offsets, chunk):
+    '''
+    Split a batch into ranges of consecutive images with about chunk pairs each.
+    :param offsets (int array) : [K+1] offsets of the pairs of each image
+    :param chunk (int)         : number of pairs per range (a larger image gets a range of its own)
+    :return: ranges (generator) : (b0, b1) of each range of images b0 to b1-1
+    '''
+    b0, K = 0, len(offsets) - 1
+    while b0 < K:
+        b1 = max(np.searchsorted(offsets, offsets[b0] + chunk, side='right') - 1, b0 + 1)
+        yield b0, b1
+        b0 = b1
@@ -27,8 +27,11 @@ __version__ = '2.0'
 #  loadAnns   - Load anns with the specified ids.
 #  loadCats   - Load cats with the specified ids.
 #  loadImgs   - Load imgs with the specified ids.
+#  getKeypoints - Get keypoints of anns as a single array.
 #  annToMask  - Convert segmentation in an annotation to binary mask.
 #  showAnns   - Display the specified annotations.
+#  subset     - Get a view of the dataset restricted to some images.
+#  share      - Place the annotations in shared memory for process pool workers.
 #  loadRes    - Load algorithm results and create API for accessing them.
 #  download   - Download COCO images from mscoco.org server.
 # Throughout the API "ann"=annotation, "cat"=category, and "img"=image.
@@ -52,66 +55,258 @@ from matplotlib.patches import Polygon
 import numpy as np
 import copy
 import itertools
+import hashlib
+import pickle
+import marshal
+import gc
+import shutil
 from . import mask as maskUtils
+from .annstore import AnnStore, AnnIndex, AnnMap, AnnList, AnnRecord, ImgToAnns
+from .resstream import loadResStream, loadResShards, resFiles, storeFromRes, storeFromNumpy
+from .resbin import isResBin, loadResBin
+from .imagestore import ImageStore
+from .lrucache import LRUCache, rleBytes, maskBytes
+from .sharedmem import packObjects, PackedObjects, PackedMap
 import os
 from collections import defaultdict
 import sys
 PYTHON_VERSION = sys.version_info[0]
-if PYTHON_VERSION == 2:
-    from urllib import urlretrieve
-elif PYTHON_VERSION == 3:
-    from urllib.request import urlretrieve
+
+# version of the layout written by COCO._writeCache, bump it when the layout changes
+CACHE_VERSION = 2
 
 class COCO:
-    def __init__(self, annotation_file=None):
+    def __init__(self, annotation_file=None, columnar=False, cache=False, cache_dir=None, records=False,
+                 rle_cache=256<<20, mask_cache=0):
         """
         Constructor of Microsoft COCO helper class for reading and visualizing annotations.
         :param annotation_file (str): location of annotation file
         :param image_folder (str): location to the folder that hosts images.
+        :param columnar (bool): keep annotations in a columnar AnnStore and build dicts on demand
+        :param cache (bool): load the annotations from a binary cache, written on the first run
+        :param cache_dir (str): directory of the cache, by default next to the annotation file
+        :param records (bool): give annotations as compact AnnRecords instead of dicts (implies columnar)
+        :param rle_cache (int): size cap in bytes of the RLEs kept by annToRLE, 0 to convert on every call
+        :param mask_cache (int): size cap in bytes of the masks kept by annToMask, 0 to decode on every call
         :return:
         """
         # load dataset
-        self.dataset,self.anns,self.cats,self.imgs = dict(),dict(),dict(),dict()
-        self.imgToAnns, self.catToImgs = defaultdict(list), defaultdict(list)
+        self.dataset = dict()
+        self.columnar = columnar or records
+        self.records = records
+        self.rleCache = LRUCache(rle_cache, rleBytes)
+        self.maskCache = LRUCache(mask_cache, maskBytes)
         if not annotation_file == None:
+            if cache and self._loadCache(annotation_file, cache_dir):
+                self.createIndex()
+                return
             print('loading annotations into memory...')
             tic = time.time()
-            dataset = json.load(open(annotation_file, 'r'))
+            with open(annotation_file, 'rb') as f:
+                data = f.read()
+            dataset = json.loads(data.decode('utf8'))
             assert type(dataset)==dict, 'annotation file format {} not supported'.format(type(dataset))
             print('Done (t={:0.2f}s)'.format(time.time()- tic))
             self.dataset = dataset
+            if cache:
+                self._writeCache(annotation_file, cache_dir, hashlib.sha1(data).hexdigest())
             self.createIndex()
 
+    @staticmethod
+    def _cachePath(annotation_file, cache_dir):
+        if cache_dir is None:
+            return annotation_file + '.cache'
+        # keep files with the same name in different directories apart
+        key = hashlib.sha1(os.path.abspath(annotation_file).encode('utf8')).hexdigest()[:8]
+        return os.path.join(cache_dir, '{}.{}.cache'.format(os.path.basename(annotation_file), key))
+
+    def _cacheName(self):
+        # columnar objects read the annotations from a memory mapped AnnStore, dict objects
+        # from a marshal of the dicts (much faster to load than json or than building the
+        # dicts from the store). marshal data is only readable by the same python version.
+        if self.columnar:
+            return 'annotations'
+        return 'annotations.py{}{}.marshal'.format(*sys.version_info[:2])
+
+    def _readCacheMeta(self, path, annotation_file):
+        # meta of the cache at path, None if there is none or it is out of date
+        try:
+            with open(os.path.join(path, 'meta.json'), 'r') as f:
+                meta = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        st = os.stat(annotation_file)
+        if meta['version'] != CACHE_VERSION or meta['size'] != st.st_size:
+            return None
+        if meta['mtime'] != st.st_mtime:
+            with open(annotation_file, 'rb') as f:
+                if hashlib.sha1(f.read()).hexdigest() != meta['sha1']:
+                    return None
+        return meta
+
+    def _loadCache(self, annotation_file, cache_dir):
+        """
+        Load dataset from the cache of annotation_file if the cache is up to date.
+        The cache is valid if it was written from a file with the same size, and
+        either the same mtime or (if the file was touched) the same sha1.
+        :return: loaded (bool)
+        """
+        path = self._cachePath(annotation_file, cache_dir)
+        meta = self._readCacheMeta(path, annotation_file)
+        annPath = os.path.join(path, self._cacheName())
+        if meta is None or ('annotations' in meta['keys'] and not os.path.exists(annPath)):
+            return False
+        print('loading annotations from cache {}...'.format(path))
+        tic = time.time()
+        with open(os.path.join(path, 'dataset.pkl'), 'rb') as f:
+            dataset = pickle.load(f)
+        if 'annotations' in meta['keys']:
+            if self.columnar:
+                self.store = AnnStore.load(annPath)
+                dataset['annotations'] = AnnList(AnnMap(self.store, records=self.records))
+            else:
+                # the cyclic gc would scan the new containers over and over while they are built
+                enabled = gc.isenabled()
+                gc.disable()
+                try:
+                    with open(annPath, 'rb') as f:
+                        dataset['annotations'] = marshal.load(f)
+                finally:
+                    if enabled:
+                        gc.enable()
+        self.dataset = dataset
+        print('Done (t={:0.2f}s)'.format(time.time()- tic))
+        return True
+
+    def _writeAnnCache(self, path):
+        if self.columnar:
+            self.store.save(path)
+        else:
+            with open(path, 'wb') as f:
+                marshal.dump(self.dataset['annotations'], f)
+
+    def _writeCache(self, annotation_file, cache_dir, sha1):
+        """
+        Write the cache of annotation_file: annotations go to a memory mappable
+        AnnStore or a marshal file (see _cacheName), all the other fields of the
+        dataset to a pickle. An up to date cache written in the other mode only
+        gets the annotations file of this mode.
+        :return: None
+        """
+        path = self._cachePath(annotation_file, cache_dir)
+        meta = self._readCacheMeta(path, annotation_file)
+        if meta is not None and meta['sha1'] == sha1:
+            if not 'annotations' in self.dataset:
+                return
+            tmp = '{}.tmp{}'.format(os.path.join(path, self._cacheName()), os.getpid())
+            try:
+                self._writeAnnCache(tmp)
+                os.rename(tmp, os.path.join(path, self._cacheName()))
+                print('wrote annotations cache {}'.format(path))
+            except (IOError, OSError, ValueError) as e:
+                print('could not write annotations cache {}: {}'.format(path, e))
+            finally:
+                if os.path.isdir(tmp):
+                    shutil.rmtree(tmp, ignore_errors=True)
+                elif os.path.exists(tmp):
+                    os.remove(tmp)
+            return
+        tmp = '{}.tmp{}'.format(path, os.getpid())
+        try:
+            if not os.path.exists(tmp):
+                os.makedirs(tmp)
+            rest = dict((k, v) for k, v in self.dataset.items() if k != 'annotations')
+            with open(os.path.join(tmp, 'dataset.pkl'), 'wb') as f:
+                pickle.dump(rest, f, 2)
+            if 'annotations' in self.dataset:
+                self._writeAnnCache(os.path.join(tmp, self._cacheName()))
+            st = os.stat(annotation_file)
+            meta = {'version': CACHE_VERSION, 'size': st.st_size, 'mtime': st.st_mtime,
+                    'sha1': sha1, 'keys': list(self.dataset.keys())}
+            # meta.json is written last, a cache without it is never loaded
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.rename(tmp, path)
+            print('wrote annotations cache {}'.format(path))
+        except (IOError, OSError, ValueError) as e:
+            print('could not write annotations cache {}: {}'.format(path, e))
+        finally:
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp, ignore_errors=True)
+
     def createIndex(self):
-        # create index
+        # create index, every index is built the first time it is used (see __getattr__)
         print('creating index...')
-        anns, cats, imgs = {}, {}, {}
-        imgToAnns,catToImgs = defaultdict(list),defaultdict(list)
-        if 'annotations' in self.dataset:
-            for ann in self.dataset['annotations']:
-                imgToAnns[ann['image_id']].append(ann)
-                anns[ann['id']] = ann
+        for name in ['anns', 'imgToAnns', 'catToImgs', 'imgs', 'cats', 'annIndex']:
+            self.__dict__.pop(name, None)
+        # the annotation ids may now refer to other annotations. The caches are replaced rather
+        # than cleared, as they may still be used by the subsets of this object (see subset)
+        self.rleCache = LRUCache(self.rleCache.max_bytes, rleBytes)
+        self.maskCache = LRUCache(self.maskCache.max_bytes, maskBytes)
+        if not isinstance(self.dataset.get('annotations'), AnnList):
+            self.__dict__.pop('store', None)
+        print('index created!')
 
-        if 'images' in self.dataset:
-            for img in self.dataset['images']:
-                imgs[img['id']] = img
+    def __getattr__(self, name):
+        # only called for attributes that are not set: build the index and cache it as an attribute
+        build = {'store': self._buildStore, 'anns': self._buildAnns, 'imgToAnns': self._buildImgToAnns,
+                 'catToImgs': self._buildCatToImgs, 'imgs': self._buildImgs, 'cats': self._buildCats,
+                 'annIndex': self._buildAnnIndex}.get(name) if 'dataset' in self.__dict__ else None
+        if build is None:
+            raise AttributeError(name)
+        value = build()
+        self.__dict__[name] = value
+        return value
+
+    def _buildStore(self):
+        if not self.columnar or not 'annotations' in self.dataset:
+            return None
+        # the dicts of the json file are dropped once the store is built
+        store = AnnStore.fromAnns(self.dataset['annotations'])
+        self.dataset['annotations'] = AnnList(AnnMap(store, records=self.records))
+        return store
 
-        if 'categories' in self.dataset:
-            for cat in self.dataset['categories']:
-                cats[cat['id']] = cat
+    def _buildAnns(self):
+        if self.store is not None:
+            return self.dataset['annotations'].anns
+        anns = {}
+        for ann in self.dataset.get('annotations', []):
+            anns[ann['id']] = ann
+        return anns
 
-        if 'annotations' in self.dataset and 'categories' in self.dataset:
+    def _buildImgToAnns(self):
+        if self.store is not None:
+            return ImgToAnns(self.anns)
+        imgToAnns = defaultdict(list)
+        for ann in self.dataset.get('annotations', []):
+            imgToAnns[ann['image_id']].append(ann)
+        return imgToAnns
+
+    def _buildCatToImgs(self):
+        catToImgs = defaultdict(list)
+        if not ('annotations' in self.dataset and 'categories' in self.dataset):
+            return catToImgs
+        if self.store is not None:
+            catIds = [] if self.store.category_id is None else np.unique(self.store.category_id).tolist()
+            for catId in catIds:
+                catToImgs[catId] = self.store.image_id[self.store.category_id == catId].tolist()
+        else:
             for ann in self.dataset['annotations']:
                 catToImgs[ann['category_id']].append(ann['image_id'])
+        return catToImgs
 
-        print('index created!')
+    def _buildImgs(self):
+        return dict((img['id'], img) for img in self.dataset.get('images', []))
+
+    def _buildCats(self):
+        return dict((cat['id'], cat) for cat in self.dataset.get('categories', []))
 
-        # create class members
-        self.anns = anns
-        self.imgToAnns = imgToAnns
-        self.catToImgs = catToImgs
-        self.imgs = imgs
-        self.cats = cats
+    def _buildAnnIndex(self):
+        if not 'annotations' in self.dataset:
+            return None
+        return self.store.index if self.store is not None else AnnIndex.fromAnns(self.dataset['annotations'])
 
     def info(self):
         """
@@ -133,6 +328,11 @@ class COCO:
         imgIds = imgIds if type(imgIds) == list else [imgIds]
         catIds = catIds if type(catIds) == list else [catIds]
 
+        # filter the columns of the annotation index instead of the annotation dicts
+        ids = None if self.annIndex is None else self.annIndex.getAnnIds(imgIds, catIds, areaRng, iscrowd)
+        if ids is not None:
+            return ids
+
         if len(imgIds) == len(catIds) == len(areaRng) == 0:
             anns = self.dataset['annotations']
         else:
@@ -255,12 +455,7 @@ class COCO:
                             color.append(c)
                     else:
                         # mask
-                        t = self.imgs[ann['image_id']]
-                        if type(ann['segmentation']['counts']) == list:
-                            rle = maskUtils.frPyObjects([ann['segmentation']], t['height'], t['width'])
-                        else:
-                            rle = [ann['segmentation']]
-                        m = maskUtils.decode(rle)
+                        m = self.annToMask(ann)
                         img = np.ones( (m.shape[0], m.shape[1], 3) )
                         if ann['iscrowd'] == 1:
                             color_mask = np.array([2.0,166.0,101.0])/255
@@ -289,10 +484,82 @@ class COCO:
             for ann in anns:
                 print(ann['caption'])
 
-    def loadRes(self, resFile):
+    def subset(self, imgIds):
+        """
+        Get a view of this coco object restricted to the given images. The images, categories and
+        annotations are shared with this object (not copied) and the work is proportional to the subset.
+        :param imgIds (int array) : ids of the images to keep, unknown ids are skipped
+        :return: sub (obj)        : coco api object with the given images and their annotations
+        """
+        imgIds = imgIds if type(imgIds) == list else [imgIds]
+        imgIds = [imgId for imgId in sorted(set(imgIds)) if imgId in self.imgs]
+        sub = COCO(columnar=self.columnar, records=self.records)
+        sub.dataset = dict((k, v) for k, v in self.dataset.items() if not k in ['images', 'annotations'])
+        sub.dataset['images'] = [self.imgs[imgId] for imgId in imgIds]
+        if 'annotations' in self.dataset:
+            if self.store is not None:
+                # rows in load order, so the subset lists annotations in the same order as this object
+                sub.store = self.store.take(np.sort(self.store.index.rows(imgIds)))
+                sub.dataset['annotations'] = AnnList(self.anns.subset(sub.store))
+            elif self.annIndex is not None:
+                anns = self.dataset['annotations']
+                sub.dataset['annotations'] = [anns[row] for row in np.sort(self.annIndex.rows(imgIds)).tolist()]
+            else:
+                imgIds = set(imgIds)
+                sub.dataset['annotations'] = [ann for ann in self.dataset['annotations'] if ann['image_id'] in imgIds]
+        sub.createIndex()
+        # same annotations, same ids: the caches are shared until either object is reindexed
+        sub.rleCache = self.rleCache
+        sub.maskCache = self.maskCache
+        return sub
+
+    def share(self, skip=()):
+        """
+        Copy the annotations into shared memory, so that the workers of a process pool can
+        use this dataset through COCO.attach without getting a pickled copy each.
+        :param skip (list) : annotation fields left out (e.g. ['segmentation'] for keypoint evaluation)
+        :return: shared (SharedArrays) : owner of the shared memory, send shared.handle to the workers and close
+                                         it once they are done (or use it in a with block); it must be kept
+                                         alive until then, as it frees the memory when garbage collected
+        """
+        store = self.store if self.store is not None else AnnStore.fromAnns(self.dataset.get('annotations', []))
+        rest = dict((k, v) for k, v in self.dataset.items() if not k in ['annotations', 'images'])
+        arrays = None
+        if 'images' in self.dataset:
+            # the images go in the segment too, workers unpickle the ones they read
+            images = self.dataset['images']
+            packed = packObjects(images)
+            arrays = {'images_data': packed['data'], 'images_offsets': packed['offsets'],
+                      'images_ids': np.array([img['id'] for img in images], dtype=np.int64)}
+        return store.share(skip, meta=rest, arrays=arrays)
+
+    @staticmethod
+    def attach(handle, records=False):
+        """
+        Get a columnar coco object over annotations shared by COCO.share, the arrays are not copied.
+        :param handle (dict)  : shared.handle returned by COCO.share
+        :param records (bool) : give annotations as AnnRecords instead of dicts
+        :return: coco (obj)   : read-only coco api object
+        """
+        store = AnnStore.attach(handle)
+        coco = COCO(columnar=True, records=records)
+        arrays = store.shared.arrays
+        coco.dataset = dict(store.shared.meta['extra'])
+        if 'images_data' in arrays:
+            coco.dataset['images'] = PackedObjects(arrays['images_data'], arrays['images_offsets'])
+        coco.dataset['annotations'] = AnnList(AnnMap(store, records=records))
+        coco.store = store
+        coco.createIndex()
+        if 'images_data' in arrays:
+            coco.imgs = PackedMap(arrays['images_ids'].tolist(), coco.dataset['images'])
+        return coco
+
+    def loadRes(self, resFile, stream=False, processes=None):
         """
         Load result file and return a result api object.
-        :param   resFile (str)     : file name of result file
+        :param   resFile (str)     : file name of result file (json or binary, see resbin), or list / glob pattern of result shard files
+        :param   stream (bool)     : parse the file one result at a time into a columnar store (bounded memory)
+        :param   processes (int)   : number of processes used to load shard files (default: one per file up to the cpu count)
         :return: res (obj)         : result api object
         """
         res = COCO()
@@ -300,16 +567,62 @@ class COCO:
 
         print('Loading and preparing results...')
         tic = time.time()
-        if type(resFile) == str or type(resFile) == unicode:
+        files = resFiles(resFile)
+        if stream and files is None and (type(resFile) == str or type(resFile) == unicode) and not isResBin(resFile):
+            anns, kind = loadResStream(resFile, set(self.getImgIds()))
+            if kind == 'caption':
+                imgIds = set(anns.image_id.tolist())
+                res.dataset['images'] = [img for img in res.dataset['images'] if img['id'] in imgIds]
+            elif kind is not None:
+                res.dataset['categories'] = copy.deepcopy(self.dataset['categories'])
+            anns = anns if len(anns) > 0 else []
+        else:
+            anns = self._loadResAnns(resFile, res, files, set(self.getImgIds()) if stream else None, processes)
+        print('DONE (t={:0.2f}s)'.format(time.time()- tic))
+
+        if isinstance(anns, AnnStore):
+            # results kept in columns, their dicts are built when first accessed
+            res.columnar = True
+            res.records = self.records
+            res.store = anns
+            anns = AnnList(AnnMap(anns, records=self.records))
+        res.dataset['annotations'] = anns
+        res.createIndex()
+        return res
+
+    def _loadResAnns(self, resFile, res, files=None, imgIds=None, processes=None):
+        """
+        Load the results given to loadRes and add the fields derived from them (id, area, bbox, ...).
+        :param   resFile (str)     : file name of result file, numpy array or list of results
+        :param   res (obj)         : result api object, its images and categories are set here
+        :param   files (list)      : result shard files to load instead of resFile
+        :param   imgIds (set)      : stream the shard files, checking their image ids
+        :param   processes (int)   : number of processes used to load the shard files
+        :return: anns (obj)        : AnnStore with the results, or the list of result dicts if they do not fit in columns
+        """
+        if files is not None:
+            anns = loadResShards(files, imgIds, processes)
+        elif (type(resFile) == str or type(resFile) == unicode) and isResBin(resFile):
+            anns = loadResBin(resFile)
+        elif type(resFile) == str or type(resFile) == unicode:
             anns = json.load(open(resFile))
         elif type(resFile) == np.ndarray:
             anns = self.loadNumpyAnnotations(resFile)
         else:
             anns = resFile
+        if isinstance(anns, AnnStore):
+            assert np.all(np.isin(anns.image_id, self.getImgIds())), \
+                   'Results do not correspond to current coco set'
+            res.dataset['categories'] = copy.deepcopy(self.dataset['categories'])
+            return anns
         assert type(anns) == list, 'results in not an array of objects'
         annsImgIds = [ann['image_id'] for ann in anns]
         assert set(annsImgIds) == (set(annsImgIds) & set(self.getImgIds())), \
                'Results do not correspond to current coco set'
+        store = None if 'caption' in anns[0] else storeFromRes(anns)
+        if store is not None:
+            res.dataset['categories'] = copy.deepcopy(self.dataset['categories'])
+            return store
         if 'caption' in anns[0]:
             imgIds = set([img['id'] for img in res.dataset['images']]) & set([ann['image_id'] for ann in anns])
             res.dataset['images'] = [img for img in res.dataset['images'] if img['id'] in imgIds]
@@ -344,85 +657,94 @@ class COCO:
                 ann['area'] = (x1-x0)*(y1-y0)
                 ann['id'] = id + 1
                 ann['bbox'] = [x0,y0,x1-x0,y1-y0]
-        print('DONE (t={:0.2f}s)'.format(time.time()- tic))
-
-        res.dataset['annotations'] = anns
-        res.createIndex()
-        return res
+        return anns
 
-    def download(self, tarDir = None, imgIds = [] ):
+    def download(self, tarDir = None, imgIds = [], threads=8 ):
         '''
         Download COCO images from mscoco.org server.
         :param tarDir (str): COCO results directory name
                imgIds (list): images to be downloaded
+               threads (int): number of images downloaded at the same time
         :return:
         '''
         if tarDir is None:
             print('Please specify target directory')
             return -1
         if len(imgIds) == 0:
-            imgs = self.imgs.values()
+            imgs = list(self.imgs.values())
         else:
             imgs = self.loadImgs(imgIds)
         N = len(imgs)
         if not os.path.exists(tarDir):
             os.makedirs(tarDir)
-        for i, img in enumerate(imgs):
-            tic = time.time()
-            fname = os.path.join(tarDir, img['file_name'])
-            if not os.path.exists(fname):
-                urlretrieve(img['coco_url'], fname)
-            print('downloaded {}/{} images (t={:0.1f}s)'.format(i, N, time.time()- tic))
+        store = ImageStore(cache_dir=tarDir, cache_size=None, threads=threads)
+        tic = time.time()
+        try:
+            for i, _ in enumerate(store.fetch(imgs)):
+                print('downloaded {}/{} images (t={:0.1f}s)'.format(i, N, time.time()- tic))
+        finally:
+            store.close()
 
     def loadNumpyAnnotations(self, data):
         """
         Convert result data from a numpy array [Nx7] where each row contains {imageID,x1,y1,w,h,score,class}
+        or [Nx(3K+3)] where each row contains {imageID,class,x1,y1,v1,...,xK,yK,vK,score}
         :param  data (numpy.ndarray)
-        :return: annotations (python nested list)
+        :return: annotations (AnnStore) : results backed by the columns of data (no copy of boxes, keypoints and scores)
         """
-        print('Converting ndarray to lists...')
+        print('Converting ndarray to annotation store...')
         assert(type(data) == np.ndarray)
         print(data.shape)
-        assert(data.shape[1] == 7)
-        N = data.shape[0]
-        ann = []
-        for i in range(N):
-            if i % 1000000 == 0:
-                print('{}/{}'.format(i,N))
-            ann += [{
-                'image_id'  : int(data[i, 0]),
-                'bbox'  : [ data[i, 1], data[i, 2], data[i, 3], data[i, 4] ],
-                'score' : data[i, 5],
-                'category_id': int(data[i, 6]),
-                }]
-        return ann
+        return storeFromNumpy(data)
+
+    def getKeypoints(self, anns):
+        """
+        Get the keypoints of the given annotations as a single array.
+        :param anns (object array) : annotations loaded from this coco object
+        :return: kpts (numpy array) : [Nx3K] keypoints (x1,y1,v1,...,xK,yK,vK) of every ann
+        """
+        if len(anns) == 0:
+            return np.zeros((0, 0))
+        # the store holds the keypoints as loaded: only AnnRecords whose keypoints were not set
+        # are read from it, dicts may have been modified in place and are read as they are
+        store = getattr(anns[0], 'store', None)
+        if store is not None and store.keypoints is not None and \
+                all(isinstance(ann, AnnRecord) and ann.store is store and
+                    (ann.changes is None or not 'keypoints' in ann.changes) for ann in anns):
+            rows = np.array([ann.row for ann in anns], dtype=np.int64)
+            return store.keypoints[rows].reshape((len(anns), -1)).astype(np.float64)
+        return np.array([ann['keypoints'] for ann in anns], dtype=np.float64).reshape((len(anns), -1))
 
     def annToRLE(self, ann):
         """
         Convert annotation which can be polygons, uncompressed RLE to RLE.
+        Converted RLEs are kept in self.rleCache by annotation id, for the segmentation object they come from.
         :return: binary mask (numpy 2D array)
         """
-        t = self.imgs[ann['image_id']]
-        h, w = t['height'], t['width']
         segm = ann['segmentation']
-        if type(segm) == list:
-            # polygon -- a single object might consist of multiple parts
-            # we merge all parts into one mask rle code
-            rles = maskUtils.frPyObjects(segm, h, w)
-            rle = maskUtils.merge(rles)
-        elif type(segm['counts']) == list:
-            # uncompressed RLE
-            rle = maskUtils.frPyObjects(segm, h, w)
-        else:
-            # rle
-            rle = ann['segmentation']
+        if type(segm) != list and type(segm['counts']) != list:
+            # already an RLE, nothing to convert
+            return segm
+        rle = self.rleCache.get(ann['id'], tag=segm) if 'id' in ann else None
+        if rle is None:
+            t = self.imgs[ann['image_id']]
+            rle = maskUtils.segmToRLE(segm, t['height'], t['width'])
+            if 'id' in ann:
+                self.rleCache.put(ann['id'], rle, tag=segm)
         return rle
 
     def annToMask(self, ann):
         """
         Convert annotation which can be polygons, uncompressed RLE, or RLE to binary mask.
+        Masks are kept in self.maskCache by annotation id if it is enabled, they are then read-only.
         :return: binary mask (numpy 2D array)
         """
-        rle = self.annToRLE(ann)
-        m = maskUtils.decode(rle)
+        segm = ann['segmentation']
+        m = self.maskCache.get(ann['id'], tag=segm) if 'id' in ann else None
+        if m is None:
+            rle = self.annToRLE(ann)
+            m = maskUtils.decode(rle)
+            if 'id' in ann and self.maskCache.max_bytes > 0:
+                m.flags.writeable = False
+                self.maskCache.put(ann['id'], m, tag=segm)
         return m
\ No newline at end of file
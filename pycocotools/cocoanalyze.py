@@ -14,13 +14,17 @@ import skimage.io as io
 
 class COCOanalyze:
     # Interface for analyzing the keypoints detections on the Microsoft COCO dataset.
-    def __init__(self, cocoGt, cocoDt, iouType='keypoints'):
+    def __init__(self, cocoGt, cocoDt, iouType='keypoints', imgIds=None):
         '''
         Initialize COCOanalyze using coco APIs for gt and dt
         :param cocoGt: coco object with ground truth annotations
         :param cocoDt: coco object with detection results
+        :param imgIds: analyze only these images, using subset views of cocoGt and cocoDt
         :return: None
         '''
+        if not imgIds is None:
+            cocoGt = cocoGt.subset(imgIds)
+            cocoDt = cocoDt.subset(imgIds)
         # ground truth COCO API
         self.cocoGt   = cocoGt
         # detections COCO API
@@ -204,6 +208,8 @@ class COCOanalyze:
     def _find_kpt_errors(self):
         zero_kpt_gts  = 0
         corrected_dts = {}
+        # keypoints of all the gts in an image, shared by the dts matched in that image
+        image_kpts    = {}
 
         oksLocThrs  = self.params.oksLocThrs
         areaRngLbls = self.params.areaRngLbl
@@ -219,15 +225,17 @@ class COCOanalyze:
                 image_id   = dtm['image_id']
 
                 dt         = self.cocoDt.loadAnns(did)[0]
-                dt_kpt_x   = np.array(dt['keypoints'][0::3])
-                dt_kpt_y   = np.array(dt['keypoints'][1::3])
-                dt_kpt_v   = np.array(dt['keypoints'][2::3])
-                dt_kpt_arr = np.delete(np.array(dt['keypoints']), slice(2, None, 3))
+                dt_kpts    = np.array(dt['keypoints'])
+                dt_kpt_x   = dt_kpts[0::3]
+                dt_kpt_y   = dt_kpts[1::3]
+                dt_kpt_v   = dt_kpts[2::3]
+                dt_kpt_arr = np.delete(dt_kpts, slice(2, None, 3))
 
                 gt         = self.cocoGt.loadAnns(dtm['gtId'])[0]
-                gt_kpt_x   = np.array(gt['keypoints'][0::3])
-                gt_kpt_y   = np.array(gt['keypoints'][1::3])
-                gt_kpt_v   = np.array(gt['keypoints'][2::3])
+                gt_kpts    = self.cocoGt.getKeypoints([gt])[0]
+                gt_kpt_x   = gt_kpts[0::3]
+                gt_kpt_y   = gt_kpts[1::3]
+                gt_kpt_v   = gt_kpts[2::3]
 
                 # if the gt match has no keypoint annotations the analysis
                 # cannot be carried out.
@@ -245,7 +253,10 @@ class COCOanalyze:
                 #  - 'swap': binary list identifying swap errors
 
                 # load all annotations for the image being analyzed
-                image_anns = self.cocoGt.loadAnns(self.cocoGt.getAnnIds(imgIds=image_id))
+                if image_id not in image_kpts:
+                    anns = self.cocoGt.loadAnns(self.cocoGt.getAnnIds(imgIds=image_id))
+                    image_kpts[image_id] = (anns, self.cocoGt.getKeypoints(anns))
+                image_anns, image_anns_kpts = image_kpts[image_id]
                 num_anns   = len(image_anns)
 
                 # create a matrix with all keypoints from gts in the image
@@ -256,11 +267,11 @@ class COCOanalyze:
                 areas       = np.zeros(2*num_anns)
                 indx        = 1
 
-                for a in image_anns:
+                for a, a_kpts in zip(image_anns, image_anns_kpts):
                     # get the keypoint vector and its inverted version
-                    xs = np.array(a['keypoints'][0::3])
-                    ys = np.array(a['keypoints'][1::3])
-                    vs = np.array(a['keypoints'][2::3])
+                    xs = a_kpts[0::3]
+                    ys = a_kpts[1::3]
+                    vs = a_kpts[2::3]
                     inv_vs = vs[self.params.inv_idx]
 
                     keypoints     = np.insert(ys, np.arange(self.params.num_kpts), xs)
@@ -415,7 +426,7 @@ class COCOanalyze:
         if self.params.check_kpts:
             evalImgs = []
             for aind, areaRngLbl in enumerate(self.params.areaRngLbl):
-                # restore original dts and gt ignore flags for new area range
+                # restore original dts for new area range
                 self._cleanup()
                 self._correct_dt_keypoints(areaRngLbl)
 
@@ -817,12 +828,11 @@ class COCOanalyze:
         return stats
 
     def _cleanup(self):
-        # restore detections and gt ignores to their original value
+        # restore detections to their original value, the gt ignore flags
+        # are kept by cocoEval and never written to the gt annotations
         for d in self._dts:
             d['keypoints'] = self._original_dts[d['id']]['keypoints']
             d['score']     = self._original_dts[d['id']]['score']
-        for g in self._gts:
-            g['_ignore'] = 0
 
     @staticmethod
     def _plot(recalls, ps_mat, params, err_labels=[], color_vec=[], savedir=None, team_name=None):
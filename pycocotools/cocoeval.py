@@ -7,7 +7,19 @@ import time
 from collections import defaultdict
 from scipy.optimize import linear_sum_assignment
 from . import mask as maskUtils
+from .sharedmem import SharedArrays
+from .sparseious import SparseIous
+from .batchious import BatchIous, imageRanges
 import copy
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+# polygons converted per worker process below which _prepare does not start a pool
+MIN_ANNS_PER_PROCESS = 2000
+
+def _segmToRLE(args):
+    # runs in a worker process: convert one chunk of segmentations
+    return [maskUtils.segmToRLE(segm, h, w) for segm, h, w in args]
 
 class COCOeval:
     # Interface for evaluating detection on the Microsoft COCO dataset.
@@ -53,21 +65,30 @@ class COCOeval:
     #  recall     - [TxKxAxM] max recall for every evaluation setting
     # Note: precision and recall==-1 for settings with no gt objects.
     #
+    # shareIous() / attachIous(): hand the ious computed by evaluate() to the
+    # workers of a process pool through shared memory, so that each worker
+    # can run evaluateImg on its images without a copy of all the ious (the
+    # datasets themselves are shared with COCO.share and COCO.attach).
+    #
     # See also coco, mask, pycocoDemo, pycocoEvalDemo
     #
     # Microsoft COCO Toolbox.      version 2.0
     # Data, paper, and tutorials available at:  http://mscoco.org/
     # Code written by Piotr Dollar and Tsung-Yi Lin, 2015.
     # Licensed under the Simplified BSD License [see coco/license.txt]
-    def __init__(self, cocoGt=None, cocoDt=None, iouType='segm'):
+    def __init__(self, cocoGt=None, cocoDt=None, iouType='segm', imgIds=None):
         '''
         Initialize CocoEval using coco APIs for gt and dt
         :param cocoGt: coco object with ground truth annotations
         :param cocoDt: coco object with detection results
+        :param imgIds: evaluate only these images, using subset views of cocoGt and cocoDt
         :return: None
         '''
         if not iouType:
             print('<{}:{}>iouType not specified. use default iouType segm'.format(__author__,__version__))
+        if not imgIds is None:
+            cocoGt = None if cocoGt is None else cocoGt.subset(imgIds)
+            cocoDt = None if cocoDt is None else cocoDt.subset(imgIds)
         self.cocoGt   = cocoGt              # ground truth COCO API
         self.cocoDt   = cocoDt              # detections COCO API
         self.params   = {}                  # evaluation parameters
@@ -79,20 +100,65 @@ class COCOeval:
         self._paramsEval = {}               # parameters for evaluation
         self.stats = []                     # result summarization
         self.ious = {}                      # ious between all gts and dts
+        self._gtRles = {}                   # gt ann id -> RLE, kept across evaluate() calls
+        self._dtRles = {}                   # dt ann id -> RLE, kept across evaluate() calls
         if not cocoGt is None:
             self.params.imgIds = sorted(cocoGt.getImgIds())
             self.params.catIds = sorted(cocoGt.getCatIds())
 
-    def _prepare(self):
+    def _toRLE(self, anns, coco, rles, processes=1):
+        '''
+        Convert the segmentations of anns missing from rles, the annotations are not modified.
+        The RLEs are taken from (and added to) coco.rleCache, as converted by coco.annToRLE.
+        :param anns (list)      : annotations of coco
+        :param coco (COCO)      : dataset of anns
+        :param rles (dict)      : ann id -> RLE, updated in place
+        :param processes (int)  : number of worker processes converting polygons, None for the cpu count
+        :return: None
+        '''
+        todo, args = [], []
+        for ann in anns:
+            if ann['id'] in rles:
+                continue
+            segm = ann['segmentation']
+            if type(segm) != list and type(segm['counts']) != list:
+                # already an encoded RLE
+                rles[ann['id']] = segm
+                continue
+            rle = coco.rleCache.get(ann['id'], tag=segm)
+            if rle is not None:
+                # converted for another evaluation of coco
+                rles[ann['id']] = rle
+                continue
+            img = coco.imgs[ann['image_id']]
+            todo.append(ann)
+            args.append((segm, img['height'], img['width']))
+        processes = min(processes or multiprocessing.cpu_count(), len(args) // MIN_ANNS_PER_PROCESS)
+        if multiprocessing.current_process().daemon:
+            # a pool worker itself (e.g. evaluating in a pool), which cannot start processes
+            processes = 1
+        if processes > 1:
+            # a few chunks per process to balance images of different sizes
+            n = processes * 4
+            chunks = [args[i * len(args) // n:(i+1) * len(args) // n] for i in range(n)]
+            pool = multiprocessing.Pool(processes)
+            try:
+                converted = [rle for chunk in pool.map(_segmToRLE, chunks) for rle in chunk]
+            finally:
+                pool.close()
+                pool.join()
+            for ann, rle in zip(todo, converted):
+                coco.rleCache.put(ann['id'], rle, tag=ann['segmentation'])
+        else:
+            converted = [coco.annToRLE(ann) for ann in todo]
+        rles.update((ann['id'], rle) for ann, rle in zip(todo, converted))
+
+    def _prepare(self, processes=1):
         '''
         Prepare ._gts and ._dts for evaluation based on params
+        :param processes (int) : number of worker processes converting polygons to RLEs for 'segm', None for the cpu count
         :return: None
         '''
-        def _toMask(anns, coco):
-            # modify ann['segmentation'] by reference
-            for ann in anns:
-                rle = coco.annToRLE(ann)
-                ann['segmentation'] = rle
         p = self.params
         if p.useCats:
             gts=self.cocoGt.loadAnns(self.cocoGt.getAnnIds(imgIds=p.imgIds, catIds=p.catIds))
@@ -101,28 +167,36 @@ class COCOeval:
             gts=self.cocoGt.loadAnns(self.cocoGt.getAnnIds(imgIds=p.imgIds))
             dts=self.cocoDt.loadAnns(self.cocoDt.getAnnIds(imgIds=p.imgIds))
 
-        # convert ground truth to mask if iouType == 'segm'
+        # convert ground truth to mask if iouType == 'segm', the RLEs of earlier calls are reused
         if p.iouType == 'segm':
-            _toMask(gts, self.cocoGt)
-            _toMask(dts, self.cocoDt)
-        # set ignore flag
-        for gt in gts:
-            gt['ignore'] = gt['ignore'] if 'ignore' in gt else 0
-            gt['ignore'] = 'iscrowd' in gt and gt['iscrowd']
-            if p.iouType == 'keypoints':
-                gt['ignore'] = (gt['num_keypoints'] == 0) or gt['ignore']
+            self._toRLE(gts, self.cocoGt, self._gtRles, processes)
+            self._toRLE(dts, self.cocoDt, self._dtRles, processes)
         self._gts = defaultdict(list)       # gt for evaluation
         self._dts = defaultdict(list)       # dt for evaluation
         for gt in gts:
             self._gts[gt['image_id'], gt['category_id']].append(gt)
+        # set ignore flag, kept here aligned with self._gts so that cocoGt is never modified
+        self._gtIgnore = {}
+        for key, g in self._gts.items():
+            ignore = np.array([bool('iscrowd' in gt and gt['iscrowd']) for gt in g])
+            if p.iouType == 'keypoints':
+                ignore |= np.array([gt['num_keypoints'] == 0 for gt in g])
+            self._gtIgnore[key] = ignore
         for dt in dts:
             self._dts[dt['image_id'], dt['category_id']].append(dt)
         self.evalImgs = defaultdict(list)   # per-image per-category evaluation results
         self.eval     = {}                  # accumulated evaluation results
 
-    def evaluate(self, check_scores=False):
+    def evaluate(self, check_scores=False, threads=1, processes=1, sparse=None):
         '''
         Run per image evaluation on given images and store results (a list of dict) in self.evalImgs
+        :param threads (int): number of threads computing the ious of different images at the same time
+                              (the mask api releases the GIL, so this scales for 'segm' and 'bbox';
+                              'bbox' ious are computed in one mask api call, threaded if built with OpenMP)
+        :param processes (int): number of worker processes converting polygons to RLEs for 'segm', None for the cpu count
+                                (only used outside of daemonic processes such as pool workers)
+        :param sparse (float): keep the ious of each image as a SparseIous of the pairs with an iou above this value
+                               (0 keeps the overlapping pairs, e.g. 1e-4 for keypoints), None for dense matrices
         :return: None
         '''
         tic = time.time()
@@ -140,6 +214,12 @@ class COCOeval:
         # raise exception if checking scores and not using keypoints
         if check_scores and p.iouType != 'keypoints':
             raise Exception('<{}:{}>This function works only for *keypoints* eval.'.format(__author__,__version__))
+        # the optimal scores are computed on dense ious
+        if check_scores and sparse is not None:
+            raise Exception('<{}:{}>*optimal score* evaluation needs dense ious.'.format(__author__,__version__))
+        # a dropped pair must not be able to match
+        if sparse is not None and sparse >= min(p.iouThrs):
+            raise Exception('<{}:{}>sparse threshold must be below the iou thresholds.'.format(__author__,__version__))
 
         print('<{}:{}>Evaluate annotation type *{}*'.format(__author__,__version__,p.iouType))
         p.imgIds = list(np.unique(p.imgIds))
@@ -148,17 +228,35 @@ class COCOeval:
         p.maxDets = sorted(p.maxDets)
         self.params=p
 
-        self._prepare()
+        self._prepare(processes)
         # loop through images, area range, max detection number
         catIds = p.catIds if p.useCats else [-1]
 
-        if p.iouType == 'segm' or p.iouType == 'bbox':
-            computeIoU = self.computeIoU
-        elif p.iouType == 'keypoints':
-            computeIoU = self.computeOks
-        self.ious = {(imgId, catId): computeIoU(imgId, catId) \
-                        for imgId in p.imgIds
-                        for catId in catIds}
+        computeIoU = self.computeIoU
+        if sparse is not None:
+            # 'segm': the dense matrix of each image is dropped as soon as it is converted
+            computeIoU = lambda imgId, catId: SparseIous.fromDense(self.computeIoU(imgId, catId), sparse)
+        keys = [(imgId, catId) for imgId in p.imgIds for catId in catIds]
+        if p.iouType == 'bbox' or p.iouType == 'keypoints':
+            # the ious stay in the flat buffers of the batch, evaluateImg reads them through
+            # self.ious[key]. When sparse, the pairs are dropped chunk by chunk in the batch
+            if p.iouType == 'bbox':
+                # all the box ious in a single call to the mask api
+                self.ious = self.computeIoUBatch(keys, threads, sparse)
+            else:
+                # all the oks in a few passes over the dt/gt pairs of all the images
+                self.ious = self.computeOksBatch(keys, sparse=sparse)
+        else:
+            if threads > 1:
+                pool = ThreadPool(threads)
+                try:
+                    ious = pool.map(lambda key: computeIoU(*key), keys)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                ious = [computeIoU(imgId, catId) for imgId, catId in keys]
+            self.ious = dict(zip(keys, ious))
 
         maxDet = p.maxDets[-1]
         evaluateImg = self.evaluateImg
@@ -171,7 +269,26 @@ class COCOeval:
         toc = time.time()
         print('<{}:{}>DONE (t={:0.2f}s).'.format(__author__,__version__,toc-tic))
 
-    def computeIoU(self, imgId, catId):
+    def shareIous(self):
+        '''
+        Copy the ious computed by evaluate into shared memory.
+        :return: shared (SharedArrays) : owner of the shared memory, send shared.handle to the workers
+                                         and close it once they are done, see COCO.share
+        '''
+        ious = self.ious if isinstance(self.ious, BatchIous) else BatchIous.fromDict(self.ious)
+        return SharedArrays(ious.arrays(), {'order': ious.order})
+
+    def attachIous(self, handle):
+        '''
+        Use the ious shared by COCOeval.shareIous (in another process) without copying them.
+        :param handle (dict) : shared.handle returned by shareIous
+        :return: None
+        '''
+        self._sharedIous = SharedArrays.attach(handle)
+        self.ious = BatchIous.fromArrays(self._sharedIous.arrays, self._sharedIous.meta['order'])
+
+    def _iouAnns(self, imgId, catId):
+        # gts and dts (by decreasing score, up to maxDets) of an image the ious are computed for
         p = self.params
         if p.useCats:
             gt = self._gts[imgId,catId]
@@ -180,15 +297,22 @@ class COCOeval:
             gt = [_ for cId in p.catIds for _ in self._gts[imgId,cId]]
             dt = [_ for cId in p.catIds for _ in self._dts[imgId,cId]]
         if len(gt) == 0 and len(dt) ==0:
-            return []
+            return [], []
         inds = np.argsort([-d['score'] for d in dt], kind='mergesort')
         dt = [dt[i] for i in inds]
         if len(dt) > p.maxDets[-1]:
             dt=dt[0:p.maxDets[-1]]
+        return gt, dt
+
+    def computeIoU(self, imgId, catId):
+        p = self.params
+        gt, dt = self._iouAnns(imgId, catId)
+        if len(gt) == 0 and len(dt) ==0:
+            return []
 
         if p.iouType == 'segm':
-            g = [g['segmentation'] for g in gt]
-            d = [d['segmentation'] for d in dt]
+            g = [self._gtRles[g['id']] for g in gt]
+            d = [self._dtRles[d['id']] for d in dt]
         elif p.iouType == 'bbox':
             g = [g['bbox'] for g in gt]
             d = [d['bbox'] for d in dt]
@@ -200,6 +324,51 @@ class COCOeval:
         ious = maskUtils.iou(d,g,iscrowd)
         return ious
 
+    def computeIoUBatch(self, keys, threads=1, sparse=None, chunk=1<<20):
+        '''
+        Box ious of many images, computed in a single call to the mask api (one call per chunk if sparse).
+        :param keys (list)    : (imgId, catId) of the images
+        :param threads (int)  : number of threads of the mask api (when it is built with OpenMP)
+        :param sparse (float) : keep only the pairs with an iou above sparse, None for dense matrices
+        :param chunk (int)    : number of pairs per call to the mask api when sparse, bounds the dense buffer
+        :return: ious (BatchIous) : computeIoU(imgId, catId) of each key, in the flat buffer of the mask api
+        '''
+        d, g, iscrowd, dtOffsets, gtOffsets = [], [], [], [0], [0]
+        for imgId, catId in keys:
+            gt, dt = self._iouAnns(imgId, catId)
+            d += [o['bbox'] for o in dt]
+            g += [o['bbox'] for o in gt]
+            iscrowd += [int(o['iscrowd']) for o in gt]
+            dtOffsets.append(len(d))
+            gtOffsets.append(len(g))
+        d = np.array(d, dtype=np.double).reshape((len(d), 4))
+        g = np.array(g, dtype=np.double).reshape((len(g), 4))
+        dtOffsets = np.array(dtOffsets, dtype=np.int64)
+        gtOffsets = np.array(gtOffsets, dtype=np.int64)
+        shapes = np.stack([np.diff(dtOffsets), np.diff(gtOffsets)], axis=1)
+        # images without dts or without gts have no ious
+        shapes[(shapes == 0).any(axis=1)] = 0
+        offsets = np.zeros((len(keys)+1,), dtype=np.int64)
+        offsets[1:] = np.cumsum(shapes[:,0] * shapes[:,1])
+
+        def iou(b0, b1):
+            # column major ious of the images b0 to b1-1, in one flat buffer
+            d0, d1, g0, g1 = dtOffsets[b0], dtOffsets[b1], gtOffsets[b0], gtOffsets[b1]
+            if offsets[b1] == offsets[b0]:
+                return np.zeros((0,))
+            if maskUtils.iou_batch is None:
+                # older extension: one call to the mask api per image, same flat layout
+                o = [np.asarray(maskUtils.iou(d[dtOffsets[k]:dtOffsets[k+1]], g[gtOffsets[k]:gtOffsets[k+1]],
+                                              iscrowd[gtOffsets[k]:gtOffsets[k+1]])).reshape(-1, order='F')
+                     for k in range(b0, b1)]
+                return np.concatenate([np.zeros((0,))] + o)
+            return maskUtils.iou_batch(d[d0:d1], g[g0:g1], iscrowd[g0:g1],
+                                       dtOffsets[b0:b1+1] - d0, gtOffsets[b0:b1+1] - g0, threads)[0]
+        if sparse is None:
+            return BatchIous(keys, shapes, offsets, iou(0, len(keys)), order='F')
+        chunks = ((b0, b1, iou(b0, b1)) for b0, b1 in imageRanges(offsets, chunk))
+        return BatchIous.fromChunks(keys, shapes, chunks, order='F', eps=sparse)
+
     def computeOks(self, imgId, catId):
         p = self.params
         # dimention here should be Nxm
@@ -212,37 +381,114 @@ class COCOeval:
 
         if len(gts) == 0 or len(dts) == 0:
             return []
-        ious = np.zeros((len(dts), len(gts)))
-        sigmas = np.array([.26, .25, .25, .35, .35, .79, .79, .72, .72, .62,.62, 1.07, 1.07, .87, .87, .89, .89])/10.0
-        vars = (sigmas * 2)**2
-        k = len(sigmas)
-
-        # compute oks between each detection and ground truth object
-        for j, gt in enumerate(gts):
-            # create bounds for ignore regions(double the gt bbox)
-            g = np.array(gt['keypoints'])
-            xg = g[0::3]; yg = g[1::3]; vg = g[2::3]
-            k1 = np.count_nonzero(vg > 0)
-            bb = gt['bbox']
-            x0 = bb[0] - bb[2]; x1 = bb[0] + bb[2] * 2
-            y0 = bb[1] - bb[3]; y1 = bb[1] + bb[3] * 2
-            for i, dt in enumerate(dts):
-                d = np.array(dt['keypoints'])
-                xd = d[0::3]; yd = d[1::3]
-                if k1>0:
-                    # measure the per-keypoint distance if keypoints visible
-                    dx = xd - xg
-                    dy = yd - yg
-                else:
-                    # measure minimum distance to keypoints in (x0,y0) & (x1,y1)
-                    z = np.zeros((k))
-                    dx = np.max((z, x0-xd),axis=0)+np.max((z, xd-x1),axis=0)
-                    dy = np.max((z, y0-yd),axis=0)+np.max((z, yd-y1),axis=0)
-                e = (dx**2 + dy**2) / vars / (gt['area']+np.spacing(1)) / 2
-                if k1 > 0:
-                    e=e[vg > 0]
-                ious[i, j] = np.sum(np.exp(-e)) / e.shape[0]
-        return ious
+        g = self.cocoGt.getKeypoints(gts).reshape((len(gts), -1, 3))
+        d = np.array([dt['keypoints'] for dt in dts], dtype=np.float64).reshape((len(dts), -1, 3))
+        gbb = np.array([gt['bbox'] for gt in gts], dtype=np.float64).reshape((len(gts), 4))
+        garea = np.array([gt['area'] for gt in gts], dtype=np.float64)
+        # every (dt, gt) pair, row major
+        dind = np.repeat(np.arange(len(dts)), len(gts))
+        gind = np.tile(np.arange(len(gts)), len(dts))
+        return self._oks(d, g, gbb, garea, dind, gind).reshape((len(dts), len(gts)))
+
+    def _oks(self, d, g, gbb, garea, dind, gind):
+        '''
+        Oks of a list of dt/gt pairs, computed for all the pairs at once.
+        :param d (float array)     : [DxKx3] dt keypoints
+        :param g (float array)     : [GxKx3] gt keypoints
+        :param gbb (float array)   : [Gx4] gt boxes
+        :param garea (float array) : [G] gt areas
+        :param dind (int array)    : [P] dt of each pair
+        :param gind (int array)    : [P] gt of each pair
+        :return: oks (float array) : [P] oks of each pair
+        '''
+        vars = (self.params.kpt_oks_sigmas * 2)**2
+        k = len(self.params.kpt_oks_sigmas)
+        visible = g[:,:,2] > 0
+        k1 = np.count_nonzero(visible, axis=1)
+        out = k1 == 0
+
+        # [PxK] distances of the dt keypoints to the gt keypoints if the gt has visible keypoints
+        xd = d[dind,:,0]; yd = d[dind,:,1]
+        dx = xd - g[gind,:,0]
+        dy = yd - g[gind,:,1]
+        # else minimum distance to keypoints in (x0,y0) & (x1,y1), the doubled gt bbox
+        pout = out[gind]
+        if pout.any():
+            bb = gbb[gind[pout]]
+            x0 = bb[:,0,None] - bb[:,2,None]; x1 = bb[:,0,None] + bb[:,2,None] * 2
+            y0 = bb[:,1,None] - bb[:,3,None]; y1 = bb[:,1,None] + bb[:,3,None] * 2
+            dx[pout] = np.maximum(0, x0-xd[pout]) + np.maximum(0, xd[pout]-x1)
+            dy[pout] = np.maximum(0, y0-yd[pout]) + np.maximum(0, yd[pout]-y1)
+        e = (dx**2 + dy**2) / vars / (garea + np.spacing(1))[gind,None] / 2
+        oks = np.exp(-e)
+
+        # average over the visible keypoints of each gt (all of them if none is visible). The pairs
+        # are grouped by number of averaged keypoints, and the keypoints of each pair are summed
+        # as one contiguous row, so that the sums are exactly those of a per pair computation
+        res = np.zeros((len(dind),))
+        n = np.where(out, k, k1)[gind]
+        used = visible | out[:,None]
+        for c in np.unique(n):
+            pairs = np.nonzero(n == c)[0]
+            kpts = np.nonzero(used[gind[pairs]])[1].reshape((len(pairs), c))
+            res[pairs] = np.sum(oks[pairs[:,None], kpts], axis=1) / c
+        return res
+
+    def computeOksBatch(self, keys, chunk=1<<16, sparse=None):
+        '''
+        Oks of many images, computed in a few passes over the dt/gt pairs of all of them.
+        :param keys (list)    : (imgId, catId) of the images
+        :param chunk (int)    : number of pairs per pass, bounds the size of the temporary arrays
+        :param sparse (float) : keep only the pairs with an oks above sparse (dropped after each pass),
+                                None for dense matrices
+        :return: oks (BatchIous) : computeOks(imgId, catId) of each key, in one flat buffer of the
+                                   [m_k x n_k] row major oks matrices of the images
+        '''
+        p = self.params
+        gts, dts, gtCount, dtCount = [], [], [], []
+        for key in keys:
+            gts += self._gts[key]
+            dts += self._dts[key]
+            gtCount.append(len(self._gts[key]))
+            dtCount.append(len(self._dts[key]))
+        gtCount = np.array(gtCount, dtype=np.int64)
+        dtCount = np.array(dtCount, dtype=np.int64)
+
+        # dts of each image by decreasing score (stable, as in computeOks) up to maxDets
+        dtKey = np.repeat(np.arange(len(keys)), dtCount)
+        order = np.lexsort((-np.array([dt['score'] for dt in dts], dtype=np.float64), dtKey))
+        dtStart = np.cumsum(dtCount) - dtCount
+        rank = np.arange(len(order)) - dtStart[dtKey[order]]
+        order = order[rank < p.maxDets[-1]]
+        dtCount = np.minimum(dtCount, p.maxDets[-1])
+        # images without dts or without gts have no oks
+        empty = (dtCount == 0) | (gtCount == 0)
+        shapes = np.stack([np.where(empty, 0, dtCount), np.where(empty, 0, gtCount)], axis=1)
+        offsets = np.zeros((len(keys)+1,), dtype=np.int64)
+        offsets[1:] = np.cumsum(shapes[:,0] * shapes[:,1])
+        if offsets[-1] == 0:
+            return BatchIous.fromChunks(keys, shapes, [], eps=sparse)
+
+        dts = [dts[i] for i in order]
+        g = self.cocoGt.getKeypoints(gts).reshape((len(gts), -1, 3))
+        d = np.array([dt['keypoints'] for dt in dts], dtype=np.float64).reshape((len(dts), -1, 3))
+        gbb = np.array([gt['bbox'] for gt in gts], dtype=np.float64).reshape((len(gts), 4))
+        garea = np.array([gt['area'] for gt in gts], dtype=np.float64)
+        dtOffsets = np.cumsum(dtCount) - dtCount
+        gtOffsets = np.cumsum(gtCount) - gtCount
+
+        def chunks():
+            # the pairs of consecutive images are processed together, chunk pairs at a time
+            for b0, b1 in imageRanges(offsets, chunk):
+                blocks = np.arange(b0, b1)
+                size = shapes[blocks,0] * shapes[blocks,1]
+                block = np.repeat(blocks, size)
+                local = np.arange(offsets[b0], offsets[b1]) - offsets[block]
+                # row major pairs of every image
+                dind = dtOffsets[block] + local // shapes[block,1]
+                gind = gtOffsets[block] + local % shapes[block,1]
+                yield b0, b1, self._oks(d, g, gbb, garea, dind, gind)
+        return BatchIous.fromChunks(keys, shapes, chunks(), eps=sparse)
 
     def evaluateImg(self, imgId, catId, aRng, maxDet, check_scores):
         '''
@@ -250,33 +496,40 @@ class COCOeval:
         :return: dict (single image results)
         '''
         p = self.params
+        empty = np.zeros((0,), dtype=bool)
         if p.useCats:
             gt = self._gts[imgId,catId]
             dt = self._dts[imgId,catId]
+            gtIgnore = self._gtIgnore.get((imgId,catId), empty)
         else:
             gt = [_ for cId in p.catIds for _ in self._gts[imgId,cId]]
             dt = [_ for cId in p.catIds for _ in self._dts[imgId,cId]]
+            gtIgnore = np.concatenate([empty] + [self._gtIgnore.get((imgId,cId), empty) for cId in p.catIds])
         if len(gt) == 0 and len(dt) == 0:
             return None
 
-        for g in gt:
-            if g['ignore'] or (g['area']<aRng[0] or g['area']>aRng[1]):
-                g['_ignore'] = 1
-            else:
-                g['_ignore'] = 0
-            # allow to set any gtId to be ignored
-            if p.useGtIgnore == 1:
-                if g['id'] in p.gtIgnoreIds:
-                    g['_ignore'] = 1
+        gtArea = np.array([g['area'] for g in gt], dtype=np.float64)
+        _ignore = gtIgnore | (gtArea<aRng[0]) | (gtArea>aRng[1])
+        # allow to set any gtId to be ignored
+        if p.useGtIgnore == 1:
+            _ignore |= np.array([g['id'] in p.gtIgnoreIds for g in gt], dtype=bool)
+        _ignore = _ignore.astype(np.int64)
 
         # sort dt highest score first, sort gt ignore last
-        gtind = np.argsort([g['_ignore'] for g in gt], kind='mergesort')
+        gtind = np.argsort(_ignore, kind='mergesort')
         gt = [gt[i] for i in gtind]
         dtind = np.argsort([-d['score'] for d in dt], kind='mergesort')
         dt = [dt[i] for i in dtind[0:maxDet]]
-        iscrowd = [int(o['iscrowd']) for o in gt]
-        # load computed ious
-        ious = self.ious[imgId, catId][:, gtind] if len(self.ious[imgId, catId]) > 0 else self.ious[imgId, catId]
+        iscrowd = np.array([int(o['iscrowd']) for o in gt], dtype=bool)
+        # load computed ious: a dense [DxG] matrix is reordered to the order of the gts, a
+        # SparseIous is read as it is, through the position of its gt columns in that order
+        ious = self.ious[imgId, catId]
+        sparse = isinstance(ious, SparseIous)
+        if sparse and check_scores:
+            # the optimal scores are computed on dense ious
+            ious, sparse = ious.toarray(), False
+        if not sparse:
+            ious = ious[:, gtind] if len(ious) > 0 else ious
 
         T = len(p.iouThrs)
         G = len(gt)
@@ -285,52 +538,50 @@ class COCOeval:
         dtm  = np.zeros((T,D))
         gtIous = np.zeros((T,G))
         dtIous = np.zeros((T,D))
-        gtIg = np.array([g['_ignore'] for g in gt])
+        gtIg = _ignore[gtind]
         dtIg = np.zeros((T,D))
         if not len(ious)==0:
-            for tind, t in enumerate(p.iouThrs):
-                for dind, d in enumerate(dt):
-                    # information about best match so far (m=-1 -> unmatched)
-                    iou = min([t,1-1e-10])
-                    m   = -1
-                    for gind, g in enumerate(gt):
-                        # if this gt already matched, and not a crowd, continue
-                        if gtm[tind,gind]>0 and not iscrowd[gind]:
-                            # this ground truth is matched to a previous detection
-                            # and is not a crowd so only 1 match allowed
-                            # continue to next gt when looking for a match
-                            continue
-                        # if dt matched to reg gt, and on ignore gt, stop
-                        if m>-1 and gtIg[m]==0 and gtIg[gind]==1:
-                            # if the last match for this detection (stored in m)
-                            # was done with a non-ignore gt and this current gt
-                            # has ignore flag to 1 then stop looking for matches
-                            # as gts are ordered so that all the following gts are
-                            # with ignore flag == 1 and none of them can "steal"
-                            # a match from a gt with ignore flag == 0
-                            break
-                        # continue to next gt unless better match made
-                        if ious[dind,gind] < iou:
-                            # the iou between this detection and this ground truth
-                            # is lower than a previous match or than the minimum
-                            # iou threshold considered so analyze next gt
-                            continue
-                        # if match successful and best so far, store appropriately
-                        # the iou between this detection and this ground truth is
-                        # the highest so far, so store this as the new match
-                        iou=ious[dind,gind]
-                        m=gind
-                    # if match made store id of match for both dt and gt
-                    if m ==-1:
-                        # looked at all the ground truths and no match was made
-                        # this detection is a false positive, look at next detection
-                        continue
-
-                    dtIg[tind,dind] = gtIg[m]
-                    dtm[tind,dind]  = gt[m]['id']
-                    gtm[tind,m]     = d['id']
-                    dtIous[tind,dind]  = iou
-                    gtIous[tind,m]     = iou
+            # the detections are matched in score order for all the thresholds at once. A detection
+            # is matched to the last of the gts with its best iou among the gts that are not
+            # already matched (unless crowd) and whose iou is at least the threshold. The gts
+            # are ordered so that the ignore gts come last: they are only looked at when no
+            # regular gt can be matched, as the loop over the gts stops at the first ignore gt
+            # once the detection is matched to a regular gt
+            gtIds = np.array([g['id'] for g in gt])
+            regular = gtIg == 0
+            thrs = np.minimum(p.iouThrs, 1-1e-10)
+            # detections without any pair above the lowest threshold are never matched
+            if sparse:
+                pos = np.zeros((G,), dtype=np.int64)
+                pos[gtind] = np.arange(G)
+                rows = np.repeat(np.arange(len(ious)), np.diff(ious.indptr))
+                active = np.unique(rows[ious.data >= thrs.min()])
+            else:
+                allCols = np.arange(G)
+                active = np.nonzero((ious >= thrs.min()).any(axis=1))[0]
+            for dind in active[active < D].tolist():
+                # the gts paired with the detection (all of them if dense) and their ious
+                if sparse:
+                    i0, i1 = ious.indptr[dind], ious.indptr[dind+1]
+                    cols, vals = pos[ious.indices[i0:i1]], ious.data[i0:i1]
+                else:
+                    cols, vals = allCols, ious[dind]
+                # a matched gt that is not a crowd allows a single match
+                cand = (vals[None,:] >= thrs[:,None]) & ((gtm[:,cols] <= 0) | iscrowd[cols])
+                reg = regular[cols]
+                sel = cand & (reg == cand[:,reg].any(axis=1)[:,None])
+                tind = np.nonzero(sel.any(axis=1))[0]
+                if len(tind) == 0:
+                    continue
+                # last gt (in the order of the gts) with the best iou of each threshold
+                row = np.where(sel[tind], vals, -np.inf)
+                iou = row.max(axis=1)
+                m = np.where(row == iou[:,None], cols, -1).max(axis=1)
+                dtIg[tind,dind] = gtIg[m]
+                dtm[tind,dind]  = gtIds[m]
+                gtm[tind,m]     = dt[dind]['id']
+                dtIous[tind,dind]  = iou
+                gtIous[tind,m]     = iou
 
         # set unmatched detections outside of area range to ignore
         a = np.array([d['area']<aRng[0] or d['area']>aRng[1] for d in dt]).reshape((1, len(dt)))
@@ -341,7 +592,7 @@ class COCOeval:
         dtIousMax    = [0. for d in dt] if check_scores else []
         gtIousMax    = [0. for g in gt] if check_scores else []
 
-        gtNotIgnore = len([g for g in gt if g['_ignore']==0])
+        gtNotIgnore = int(np.sum(gtIg==0))
         # compute the optimal scores
         if check_scores and len(dt) != 0 and gtNotIgnore != 0:
             # there are both detections and ground truth annotations so an
@@ -625,6 +876,7 @@ class Params:
         # use gt ignores flag to discard any gt_id from evaluation
         self.useGtIgnore = 0
         self.gtIgnoreIds = set()
+        self.kpt_oks_sigmas = np.array([.26, .25, .25, .35, .35, .79, .79, .72, .72, .62,.62, 1.07, 1.07, .87, .87, .89, .89])/10.0
 
     def __init__(self, iouType='segm'):
         if iouType == 'segm' or iouType == 'bbox':
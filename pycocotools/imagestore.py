@@ -0,0 +1,192 @@
+import os
+import sys
+import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
+PYTHON_VERSION = sys.version_info[0]
+if PYTHON_VERSION == 2:
+    from urllib import urlretrieve
+elif PYTHON_VERSION == 3:
+    from urllib.request import urlretrieve
+
+# Source of the images of a COCO dataset.
+#
+# The images are read either from a local image root (a directory holding
+# the files named by img['file_name']), or from a url base (the same names
+# appended to it, e.g. a local http server in front of an image folder), or
+# by default from img['coco_url']. Remote images are downloaded once into an
+# on-disk cache; when the total size of the cache goes over cache_size the
+# least recently used files are deleted.
+#
+# prefetch starts loading a list of images in a thread pool and returns at
+# once, so that the images are downloaded (and decoded, if a reader is
+# given) while the caller is busy with the previous ones; read then returns
+# the prefetched image, or loads it on the spot if it was not prefetched.
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'coco_images')
+
+class ImageStore:
+    def __init__(self, root=None, url_base=None, cache_dir=None, cache_size=2<<30, reader=None, threads=8):
+        '''
+        :param root (str)       : local directory of the images, None to read them from url_base or img['coco_url']
+        :param url_base (str)   : url the file names of the images are appended to, None to use img['coco_url']
+        :param cache_dir (str)  : directory the remote images are downloaded to
+        :param cache_size (int) : size cap of cache_dir in bytes, None for no cap
+        :param reader (fn)      : function decoding an image file (e.g. skimage.io.imread), None to return file names
+        :param threads (int)    : number of threads used by prefetch and fetch
+        '''
+        self.root = root
+        self.url_base = url_base
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.cache_size = cache_size
+        self.reader = reader
+        self.threads = threads
+        self._pool = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._inUse = {}
+        self._cacheBytes = None
+
+    def name(self, img):
+        '''
+        File name of an image, relative to the image root or the cache directory.
+        :param img (dict) : image info
+        :return: name (str)
+        '''
+        if 'file_name' in img:
+            return img['file_name']
+        return img['coco_url'].rstrip('/').split('/')[-1]
+
+    def url(self, img):
+        if self.url_base is not None:
+            return self.url_base.rstrip('/') + '/' + self.name(img)
+        return img['coco_url']
+
+    def path(self, img):
+        '''
+        Local file of an image, downloading it into the cache if needed.
+        :param img (dict) : image info
+        :return: path (str)
+        '''
+        if self.root is not None:
+            return os.path.join(self.root, self.name(img))
+        name = self.name(img)
+        fname = os.path.join(self.cache_dir, name)
+        if os.path.exists(fname):
+            # mark the file as recently used
+            os.utime(fname, None)
+            return fname
+        if not os.path.exists(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                # created by another thread in the meantime
+                pass
+        # download to a temporary name so that an interrupted download is never taken as cached
+        tmp = '{}.{}.{}.part'.format(fname, os.getpid(), threading.current_thread().ident)
+        urlretrieve(self.url(img), tmp)
+        os.rename(tmp, fname)
+        self._added(fname)
+        return fname
+
+    def _load(self, img):
+        name = self.name(img)
+        with self._lock:
+            self._inUse[name] = self._inUse.get(name, 0) + 1
+        try:
+            fname = self.path(img)
+            return self.reader(fname) if self.reader is not None else fname
+        finally:
+            with self._lock:
+                self._inUse[name] -= 1
+                if self._inUse[name] == 0:
+                    del self._inUse[name]
+                self._trim()
+
+    def _added(self, fname):
+        # account for a new file of the cache
+        if self.cache_size is None:
+            return
+        with self._lock:
+            if self._cacheBytes is None:
+                self._cacheBytes = sum(os.path.getsize(f) for f, _ in self._cacheFiles())
+            else:
+                self._cacheBytes += os.path.getsize(fname)
+
+    def _trim(self):
+        # evict the least recently used files over the cap, files being loaded are kept
+        if self.cache_size is None or self._cacheBytes is None or self._cacheBytes <= self.cache_size:
+            return
+        for f, _ in sorted(self._cacheFiles(), key=lambda f: f[1]):
+            if self._cacheBytes <= self.cache_size:
+                break
+            if os.path.relpath(f, self.cache_dir) in self._inUse:
+                continue
+            size = os.path.getsize(f)
+            try:
+                os.remove(f)
+            except OSError:
+                continue
+            self._cacheBytes -= size
+
+    def _cacheFiles(self):
+        # (file name, last use) of the complete files of the cache
+        files = []
+        for dirpath, _, names in os.walk(self.cache_dir):
+            for n in names:
+                if not n.endswith('.part'):
+                    f = os.path.join(dirpath, n)
+                    files.append((f, os.path.getmtime(f)))
+        return files
+
+    def _getPool(self):
+        if self._pool is None:
+            self._pool = ThreadPool(self.threads)
+        return self._pool
+
+    def prefetch(self, imgs):
+        '''
+        Start loading images in the background.
+        :param imgs (list of dict) : image infos, in the order they will be read
+        :return:
+        '''
+        pool = self._getPool()
+        for img in imgs:
+            # an image listed several times is loaded once and kept until it is read as many times
+            key = self.name(img)
+            if key in self._pending:
+                self._pending[key][1] += 1
+            else:
+                self._pending[key] = [pool.apply_async(self._load, (img,)), 1]
+
+    def read(self, img):
+        '''
+        Get an image, waiting for it if it is being prefetched.
+        :param img (dict) : image info
+        :return: image (obj) : output of the reader, or the local file name if there is no reader
+        '''
+        key = self.name(img)
+        if key not in self._pending:
+            return self._load(img)
+        res = self._pending[key]
+        res[1] -= 1
+        if res[1] == 0:
+            del self._pending[key]
+        return res[0].get()
+
+    def fetch(self, imgs):
+        '''
+        Load images in the thread pool.
+        :param imgs (list of dict) : image infos
+        :return: iterator over (img, image) in the order of imgs, as soon as each one is loaded
+        '''
+        images = self._getPool().imap(self._load, imgs)
+        for img in imgs:
+            yield img, next(images)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self._pending = {}
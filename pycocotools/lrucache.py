@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+
+# Size capped least recently used cache.
+#
+# COCO keeps the RLEs computed by annToRLE (and optionally the masks
+# decoded by annToMask) in such caches, keyed by annotation id, so that
+# showing or evaluating the same annotations again does not rasterize their
+# polygons again. An id alone does not tell two annotations apart (another
+# dict, or a copy with an edited segmentation), so each entry can carry a
+# tag, the segmentation it was computed from, and get only returns it for
+# that same object. Each entry is charged sizeof(value) bytes; when the
+# total goes over max_bytes the least recently used entries are dropped.
+
+def rleBytes(rle):
+    return len(rle['counts']) + 64
+
+def maskBytes(m):
+    return m.nbytes
+
+class LRUCache:
+    def __init__(self, max_bytes, sizeof):
+        '''
+        :param max_bytes (int) : size cap of the cache in bytes, 0 disables the cache
+        :param sizeof (fn)     : size in bytes of a value
+        '''
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None, tag=None):
+        '''
+        :param key          : key of the entry
+        :param default      : returned when there is no entry for key, or it was put with another tag
+        :param tag (object) : tag the entry was put with, compared by identity
+        :return: value of the entry
+        '''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            # reinsert as the most recently used entry
+            self._entries[key] = entry
+            return entry[0] if entry[2] is tag else default
+
+    def put(self, key, value, tag=None):
+        '''
+        :param key          : key of the entry, an entry with the same key is replaced
+        :param value        : value of the entry
+        :param tag (object) : the object the value was computed from, see get
+        :return: None
+        '''
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self._entries[key] = (value, size, tag)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, size, _) = self._entries.popitem(last=False)
+                self.nbytes -= size
+
+    def __getstate__(self):
+        # pickled empty: the entries are only a cache and the lock cannot be pickled
+        return {'max_bytes': self.max_bytes, 'sizeof': self.sizeof}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_bytes'], state['sizeof'])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
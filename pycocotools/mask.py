@@ -32,18 +32,22 @@ import pycocotools._mask as _mask
 #  decode         - Decode binary masks encoded via RLE.
 #  merge          - Compute union or intersection of encoded masks.
 #  iou            - Compute intersection over union between masks.
+#  iou_batch      - Compute iou between the masks of many images in one call.
 #  area           - Compute area of encoded masks.
 #  toBbox         - Get bounding boxes surrounding encoded masks.
 #  frPyObjects    - Convert polygon, bbox, and uncompressed RLE to encoded RLE mask.
+#  segmToRLE      - Convert the segmentation of an annotation to a single encoded RLE mask.
 #
 # Usage:
 #  Rs     = encode( masks )
 #  masks  = decode( Rs )
 #  R      = merge( Rs, intersect=false )
 #  o      = iou( dt, gt, iscrowd )
+#  os,ofs = iou_batch( dt, gt, iscrowd, dtOffsets, gtOffsets, num_threads=1 )
 #  a      = area( Rs )
 #  bbs    = toBbox( Rs )
 #  Rs     = frPyObjects( [pyObjects], h, w )
+#  R      = segmToRLE( segm, h, w )
 #
 # In the API the following formats are used:
 #  Rs      - [dict] Run-length encoding of binary masks
@@ -53,6 +57,9 @@ import pycocotools._mask as _mask
 #  bbs     - [nx4] Bounding box(es) stored as [x y w h]
 #  poly    - Polygon stored as [[x1 y1 x2 y2...],[x1 y1 ...],...] (2D list)
 #  dt,gt   - May be either bounding boxes or encoded masks
+#  offsets - [K+1] the masks of image k are dt[dtOffsets[k]:dtOffsets[k+1]] (same for gt)
+#  os,ofs  - flat buffer of the ious of the K images, the ious of image k are
+#            os[ofs[k]:ofs[k+1]].reshape((m_k, n_k), order='F')
 # Both poly and bbs are 0-indexed (bbox=[0 0 1 1] encloses first pixel).
 #
 # Finally, a note about the intersection over union (iou) computation.
@@ -74,6 +81,8 @@ import pycocotools._mask as _mask
 # Licensed under the Simplified BSD License [see coco/license.txt]
 
 iou         = _mask.iou
+# None if the extension was built from a _mask.pyx without iou_batch
+iou_batch   = getattr(_mask, 'iou_batch', None)
 merge       = _mask.merge
 frPyObjects = _mask.frPyObjects
 
@@ -100,4 +109,17 @@ def toBbox(rleObjs):
     if type(rleObjs) == list:
         return _mask.toBbox(rleObjs)
     else:
-        return _mask.toBbox([rleObjs])[0]
\ No newline at end of file
+        return _mask.toBbox([rleObjs])[0]
+
+def segmToRLE(segm, h, w):
+    if type(segm) == list:
+        # polygon -- a single object might consist of multiple parts
+        # we merge all parts into one mask rle code
+        rles = _mask.frPyObjects(segm, h, w)
+        return _mask.merge(rles)
+    elif type(segm['counts']) == list:
+        # uncompressed RLE
+        return _mask.frPyObjects(segm, h, w)
+    else:
+        # rle
+        return segm
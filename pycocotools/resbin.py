@@ -0,0 +1,175 @@
+import sys
+import struct
+import numpy as np
+from .annstore import AnnStore
+from .resstream import loadResStream, _kptBoxes
+
+# Binary container for detection results.
+#
+# Parsing a large json result file dominates the start of an evaluation.
+# This container stores the same results as fixed size records that are
+# memory mapped when loaded: opening a file of any size takes constant time
+# and the columns of the AnnStore given to COCO.loadRes are views of the
+# mapped file.
+#
+# Layout (all values little endian):
+#  bytes 0-7    magic b'COCORES\0'
+#  bytes 8-11   uint32 format version (1)
+#  bytes 12-15  uint32 K, number of keypoints per result (0 for box results)
+#  bytes 16-23  uint64 N, number of results
+#  bytes 24-27  uint32 flags, bit 0: all keypoint values are integers
+#  bytes 28-63  zero padding
+#  bytes 64-    N records, each one:
+#                 image_id    int64
+#                 category_id int64
+#                 score       float64
+#                 keypoints   float64 [Kx3] (x, y, v) if K > 0, else
+#                 bbox        float64 [4]   (x, y, w, h)
+# The derived fields (area, bbox of keypoint results, ...) are computed on
+# load exactly as COCO.loadRes computes them for json results. Fields other
+# than the ones above are not stored.
+#
+# ResWriter writes results in batches as they are produced (e.g. by an
+# inference job), jsonToResBin converts a json result file. From the shell:
+#  python -m pycocotools.resbin results.json results.bin
+
+MAGIC = b'COCORES\0'
+VERSION = 1
+HEADER = 64
+FLAG_KPT_INTEGRAL = 1
+
+def recordDtype(numKeypoints):
+    '''
+    :param numKeypoints (int) : number of keypoints per result, 0 for box results
+    :return: dtype (np.dtype) : dtype of the records of the container
+    '''
+    fields = [('image_id', '<i8'), ('category_id', '<i8'), ('score', '<f8')]
+    if numKeypoints > 0:
+        fields.append(('keypoints', '<f8', (numKeypoints, 3)))
+    else:
+        fields.append(('bbox', '<f8', (4,)))
+    return np.dtype(fields)
+
+def _header(numKeypoints, N, flags=0):
+    head = MAGIC + struct.pack('<IIQI', VERSION, numKeypoints, N, flags)
+    return head + b'\0' * (HEADER - len(head))
+
+def isResBin(path):
+    '''
+    :param path (str)  : file name
+    :return: isbin (bool) : the file is a binary result container
+    '''
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except (IOError, OSError):
+        return False
+
+class ResWriter:
+    def __init__(self, path, numKeypoints=17):
+        '''
+        Open a binary result container for writing, results are appended with write.
+        :param path (str)         : file name
+        :param numKeypoints (int) : number of keypoints per result, 0 for box results
+        :return: None
+        '''
+        self.dtype = recordDtype(numKeypoints)
+        self.numKeypoints = numKeypoints
+        self.N = 0
+        self.kpt_integral = True
+        self._f = open(path, 'wb')
+        self._f.write(_header(numKeypoints, 0))
+
+    def write(self, image_id, category_id, score, keypoints=None, bbox=None):
+        '''
+        Append one result or a batch of results.
+        :param image_id (int array)      : [n] image ids (or a single id)
+        :param category_id (int array)   : [n] category ids
+        :param score (float array)       : [n] scores
+        :param keypoints (float array)   : [nx3K] or [nxKx3] keypoints of keypoint results
+        :param bbox (float array)        : [nx4] boxes [x y w h] of box results
+        :return: None
+        '''
+        image_id = np.atleast_1d(image_id)
+        n = len(image_id)
+        records = np.zeros((n,), dtype=self.dtype)
+        records['image_id'] = image_id
+        records['category_id'] = category_id
+        records['score'] = score
+        if self.numKeypoints > 0:
+            assert keypoints is not None, 'keypoint container needs keypoints'
+            records['keypoints'] = np.reshape(keypoints, (n, self.numKeypoints, 3))
+            self.kpt_integral &= bool(np.all(records['keypoints'] == np.round(records['keypoints'])))
+        else:
+            assert bbox is not None, 'box container needs boxes'
+            records['bbox'] = np.reshape(bbox, (n, 4))
+        self._f.write(records.tobytes())
+        self.N += n
+
+    def close(self):
+        if self._f is None:
+            return
+        # the number of results is only known now
+        self._f.seek(0)
+        flags = FLAG_KPT_INTEGRAL if self.numKeypoints > 0 and self.kpt_integral else 0
+        self._f.write(_header(self.numKeypoints, self.N, flags))
+        self._f.close()
+        self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def loadResBin(path, mmap_mode='r'):
+    '''
+    Load a binary result container into an AnnStore, mapping the file instead of reading it.
+    :param path (str)         : file name
+    :param mmap_mode (str)    : mode used to map the file, None reads it in memory
+    :return: store (AnnStore) : results with ids 1..N
+    '''
+    with open(path, 'rb') as f:
+        head = f.read(HEADER)
+    assert head[:len(MAGIC)] == MAGIC, '{} is not a binary result file'.format(path)
+    version, K, N, flags = struct.unpack('<IIQI', head[len(MAGIC):len(MAGIC)+20])
+    assert version == VERSION, 'unsupported binary result version {}'.format(version)
+    dtype = recordDtype(K)
+    if N == 0:
+        records = np.zeros((0,), dtype=dtype)
+    elif mmap_mode is None:
+        with open(path, 'rb') as f:
+            f.seek(HEADER)
+            records = np.fromfile(f, dtype=dtype, count=N)
+    else:
+        records = np.memmap(path, dtype=dtype, mode=mmap_mode, offset=HEADER, shape=(N,))
+    columns = {'image_id': records['image_id'], 'category_id': records['category_id'], 'score': records['score']}
+    if K > 0:
+        columns['keypoints'] = records['keypoints']
+        _kptBoxes(columns)
+    else:
+        columns['bbox'] = records['bbox']
+        columns['area'] = records['bbox'][:, 2] * records['bbox'][:, 3]
+        columns['iscrowd'] = np.zeros((N,), dtype=np.uint8)
+    return AnnStore(np.arange(1, N+1), columns, kpt_integral=bool(flags & FLAG_KPT_INTEGRAL), bbox_segm=K == 0)
+
+def jsonToResBin(jsonFile, path):
+    '''
+    Convert a json result file with keypoint or box results to a binary result container.
+    :param jsonFile (str) : file name of the json results
+    :param path (str)     : file name of the binary container
+    :return: N (int)      : number of results written
+    '''
+    store, kind = loadResStream(jsonFile, None)
+    assert kind in ['keypoints', 'bbox', None], '{} results cannot be stored in a binary result file'.format(kind)
+    K = store.keypoints.shape[1] if kind == 'keypoints' else 0
+    with ResWriter(path, K) as writer:
+        if len(store) > 0:
+            writer.write(store.image_id, store.category_id, store.score,
+                         keypoints=store.keypoints, bbox=store.bbox)
+    return len(store)
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        raise ValueError('Please specify args: $> python -m pycocotools.resbin [results_json] [results_bin]')
+    print('wrote {} results to {}'.format(jsonToResBin(sys.argv[1], sys.argv[2]), sys.argv[2]))
@@ -0,0 +1,350 @@
+import json
+import glob
+import os
+import multiprocessing
+import numpy as np
+from . import mask as maskUtils
+from .annstore import AnnStore
+
+# Loaders that turn COCO results directly into an AnnStore.
+#
+# json.load on a result file builds one Python dict (and one list of floats
+# per keypoint / bbox) for every detection before anything else happens, and
+# COCO.loadRes then walks that list several times. loadResStream instead
+# reads the top level array one object at a time, checks the image id and
+# copies the numeric fields into typed columns as soon as each object is
+# parsed, so only one detection exists as Python objects at any time and the
+# peak memory stays close to the size of the final AnnStore.
+#
+# storeFromRes does the same for results that are already a list of dicts:
+# the fields of all results are stacked into arrays once and the derived
+# fields are computed for the whole array instead of per result.
+# loadResShards loads results split over several files (one per worker of
+# the detector) in a process pool and concatenates them in file order.
+# storeFromNumpy takes results that are already one numpy matrix and uses
+# views of its columns as the columns of the store, without copying them.
+# selectRes is the ingestion step of an analysis: it keeps the top scoring
+# results of every image of the ground truth and checks them, returning a
+# store that COCO.loadRes takes as is.
+#
+# The derived fields are the same as in COCO.loadRes:
+#  bbox results         - area = w*h, iscrowd = 0, box polygon as segmentation
+#                         (built when the annotation is materialized)
+#  segmentation results - area and (if missing) bbox of the RLE, iscrowd = 0
+#  keypoint results     - bbox and area of the keypoints extent
+
+class _Column:
+    # Growable typed array, doubles its capacity when full.
+    def __init__(self, dtype, shape=()):
+        self.data = np.empty((1024,) + shape, dtype=dtype)
+        self.n = 0
+
+    def append(self, value):
+        if self.n == len(self.data):
+            data = np.empty((2 * len(self.data),) + self.data.shape[1:], dtype=self.data.dtype)
+            data[:self.n] = self.data
+            self.data = data
+        self.data[self.n] = value
+        self.n += 1
+
+    def array(self):
+        return self.data[:self.n].copy()
+
+def iterJsonArray(f, chunk_size=1<<20):
+    '''
+    Iterate over the elements of the top level json array of a file without reading it all.
+    :param f (file)         : file object opened for reading
+    :param chunk_size (int) : number of characters read at a time
+    :return: iterator over the decoded elements
+    '''
+    decoder = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+    started = False
+    while True:
+        # skip whitespace and separators, reading more input when the buffer runs out
+        while pos < len(buf) and buf[pos] in ' \t\r\n' + (',' if started else ''):
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                raise ValueError('unexpected end of json array')
+            buf, pos = f.read(chunk_size), 0
+            eof = len(buf) < chunk_size
+            continue
+        if not started:
+            if buf[pos] != '[':
+                raise ValueError('results in not an array of objects')
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == ']':
+            return
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            # the element continues in the next chunk
+            if eof:
+                raise
+            more = f.read(chunk_size)
+            eof = len(more) < chunk_size
+            buf, pos = buf[pos:] + more, 0
+            continue
+        pos = end
+        yield obj
+
+def _kind(ann):
+    # same precedence as COCO.loadRes
+    if 'caption' in ann:
+        return 'caption'
+    elif 'bbox' in ann and not ann['bbox'] == []:
+        return 'bbox'
+    elif 'segmentation' in ann:
+        return 'segmentation'
+    elif 'keypoints' in ann:
+        return 'keypoints'
+    return None
+
+def loadResStream(resFile, imgIds, chunk_size=1<<20, drop=False):
+    '''
+    Load a result file into an AnnStore in a single pass over the file.
+    :param resFile (str)    : file name of result file
+    :param imgIds (set)     : ids of the images of the ground truth, None to skip the check
+    :param chunk_size (int) : number of characters read at a time
+    :param drop (bool)      : skip the results on other images instead of failing
+    :return: store (AnnStore), kind (str) : results and their type ('bbox', 'segmentation', 'keypoints' or 'caption')
+    '''
+    kind = None
+    cols, extras = {}, []
+    with open(resFile, 'r') as f:
+        for ann in iterJsonArray(f, chunk_size):
+            if kind is None:
+                kind = _kind(ann)
+                cols['image_id'] = _Column(np.int64)
+                if kind != 'caption':
+                    for name in ['category_id', 'score']:
+                        if name in ann:
+                            cols[name] = _Column(np.float64 if name == 'score' else np.int64)
+                if kind == 'bbox' or kind == 'segmentation':
+                    cols['bbox'] = _Column(np.float64, (4,))
+                    cols['area'] = _Column(np.float64)
+                    cols['iscrowd'] = _Column(np.uint8)
+                elif kind == 'keypoints':
+                    cols['keypoints'] = _Column(np.float64, (len(ann['keypoints']) // 3, 3))
+            if drop and not ann['image_id'] in imgIds:
+                continue
+            assert imgIds is None or ann['image_id'] in imgIds, 'Results do not correspond to current coco set'
+            for name, col in cols.items():
+                if name == 'area' or name == 'iscrowd':
+                    continue
+                if name == 'bbox' and kind == 'segmentation' and not ann.get('bbox'):
+                    ann.pop(name, None)
+                    col.append(maskUtils.toBbox(ann['segmentation']))
+                elif name == 'keypoints':
+                    col.append(np.reshape(ann.pop(name), (-1, 3)))
+                else:
+                    col.append(ann.pop(name))
+            if kind == 'bbox':
+                bb = cols['bbox'].data[cols['bbox'].n - 1]
+                cols['area'].append(bb[2]*bb[3])
+                cols['iscrowd'].append(0)
+            elif kind == 'segmentation':
+                # now only support compressed RLE format as segmentation results
+                cols['area'].append(maskUtils.area(ann['segmentation']))
+                cols['iscrowd'].append(0)
+            ann.pop('id', None)
+            extras.append(ann)
+    columns = dict((name, col.array()) for name, col in cols.items())
+    if kind == 'keypoints':
+        _kptBoxes(columns)
+    ids = np.arange(1, len(extras) + 1)
+    if not any(extras):
+        extras = None
+    return AnnStore(ids, columns, extras, bbox_segm=kind == 'bbox'), kind
+
+def _kptBoxes(columns):
+    # bbox and area of the extent of the keypoints of every result
+    x, y = columns['keypoints'][:, :, 0], columns['keypoints'][:, :, 1]
+    x0, x1, y0, y1 = x.min(axis=1), x.max(axis=1), y.min(axis=1), y.max(axis=1)
+    columns['area'] = (x1-x0)*(y1-y0)
+    columns['bbox'] = np.stack([x0, y0, x1-x0, y1-y0], axis=1)
+
+def storeFromRes(anns):
+    '''
+    Build the AnnStore of a list of results, computing the derived fields for all results at once.
+    :param anns (object array) : bbox, segmentation or keypoint results (caption results are not supported)
+    :return: store (AnnStore)  : results with ids 1..N, or None if they cannot be stored in columns
+                                 (e.g. results with different numbers of keypoints)
+    '''
+    kind = _kind(anns[0])
+    if kind not in ['bbox', 'segmentation', 'keypoints']:
+        return None
+    N = len(anns)
+    store = AnnStore.fromAnns(anns, kpt_dtype=np.float64, ids=np.arange(1, N+1))
+    columns = dict((name, getattr(store, name)) for name in store.fields)
+    if kind == 'bbox':
+        if store.bbox is None:
+            return None
+        columns['area'] = store.bbox[:, 2] * store.bbox[:, 3]
+    elif kind == 'segmentation':
+        if store.bbox is None and any('bbox' in ann for ann in anns):
+            return None
+        # now only support compressed RLE format as segmentation results
+        segm = [ann['segmentation'] for ann in anns]
+        columns['area'] = maskUtils.area(segm).astype(np.float64)
+        if store.bbox is None:
+            columns['bbox'] = maskUtils.toBbox(segm)
+    elif kind == 'keypoints':
+        if store.keypoints is None:
+            return None
+        _kptBoxes(columns)
+    if kind != 'keypoints':
+        columns['iscrowd'] = np.zeros((N,), dtype=np.uint8)
+    extras = store.extras
+    if extras is not None:
+        # fields replaced by a column must not come back from the extras
+        for extra in extras:
+            for name in columns:
+                extra.pop(name, None)
+    return AnnStore(store.ids, columns, extras, store.kpt_integral, bbox_segm=kind == 'bbox')
+
+def storeFromNumpy(data):
+    '''
+    Build the AnnStore of results given as a numpy matrix, the columns of the store are views of data.
+    :param data (numpy.ndarray) : [Nx7] box results, each row is {imageID,x1,y1,w,h,score,class}, or
+                                  [Nx(3K+3)] keypoint results, each row is {imageID,class,x1,y1,v1,...,xK,yK,vK,score}
+    :return: store (AnnStore)   : results with ids 1..N
+    '''
+    assert(type(data) == np.ndarray and data.ndim == 2)
+    N = data.shape[0]
+    if data.shape[1] == 7:
+        columns = {'image_id': data[:, 0].astype(np.int64), 'bbox': data[:, 1:5], 'score': data[:, 5],
+                   'category_id': data[:, 6].astype(np.int64)}
+        columns['area'] = data[:, 3] * data[:, 4]
+        columns['iscrowd'] = np.zeros((N,), dtype=np.uint8)
+    else:
+        assert data.shape[1] % 3 == 0 and data.shape[1] >= 6, \
+               'numpy results must be [Nx7] boxes or [Nx(3K+3)] keypoints'
+        columns = {'image_id': data[:, 0].astype(np.int64), 'category_id': data[:, 1].astype(np.int64),
+                   'keypoints': data[:, 2:-1].reshape((N, -1, 3)), 'score': data[:, -1]}
+        _kptBoxes(columns)
+    return AnnStore(np.arange(1, N+1), columns, bbox_segm=data.shape[1] == 7)
+
+def selectRes(resFile, imgIds=None, maxDets=None, numKeypoints=None):
+    '''
+    Load results and keep the maxDets highest scoring results of every image, as a store ready for COCO.loadRes.
+    The selection and the checks are done on the columns of all results at once.
+    :param resFile (obj)      : file name of result file, list of results, numpy array (see storeFromNumpy) or AnnStore
+    :param imgIds (list)      : drop the results on other images (e.g. outside a subset of the ground truth), None for all
+    :param maxDets (int)      : number of results kept per image, None for all
+    :param numKeypoints (int) : number of keypoints every keypoint result must have, None to skip the check
+    :return: store (AnnStore) : selected results with ids 1..M, grouped by image in order of first appearance
+                                and by decreasing score within an image (ties keep their order)
+    '''
+    if isinstance(resFile, AnnStore):
+        store = resFile
+    elif type(resFile) == np.ndarray:
+        store = storeFromNumpy(resFile)
+    elif type(resFile) == list:
+        store = storeFromRes(resFile) if len(resFile) > 0 else None
+    else:
+        store, kind = loadResStream(resFile, set(imgIds) if imgIds is not None else None, drop=imgIds is not None)
+        if kind == 'caption':
+            store = None
+    if store is None:
+        raise ValueError('results do not fit in columns (caption results, or ragged boxes / keypoints)')
+    # checks
+    for name in ['keypoints', 'bbox', 'score']:
+        col = getattr(store, name)
+        if col is not None and not np.all(np.isfinite(col)):
+            raise ValueError('results with non finite {}'.format(name))
+    if numKeypoints is not None and store.keypoints is not None and store.keypoints.shape[1] != numKeypoints:
+        raise ValueError('results with {} keypoints instead of {}'.format(store.keypoints.shape[1], numKeypoints))
+    # selection
+    rows = np.arange(len(store))
+    if imgIds is not None:
+        rows = rows[np.isin(store.image_id, imgIds)]
+    image_id = store.image_id[rows]
+    _, first, inv = np.unique(image_id, return_index=True, return_inverse=True)
+    # rank of the image of every result by first appearance
+    group = np.argsort(np.argsort(first, kind='mergesort'), kind='mergesort')[inv]
+    if store.score is not None:
+        order = np.lexsort((rows, -store.score[rows], group))
+    else:
+        assert maxDets is None, 'results without scores cannot be ranked'
+        order = np.lexsort((rows, group))
+    rows, group = rows[order], group[order]
+    if maxDets is not None:
+        # position of every result inside its image
+        rank = np.arange(len(rows)) - np.searchsorted(group, group)
+        rows = rows[rank < maxDets]
+    columns = dict((name, getattr(store, name)[rows]) for name in store.fields)
+    extras = None if store.extras is None else [store.extras[row] for row in rows]
+    return AnnStore(np.arange(1, len(rows)+1), columns, extras, store.kpt_integral, bbox_segm=store.bbox_segm)
+
+def resFiles(resFile):
+    '''
+    Get the result shard files named by resFile.
+    :param resFile (str)  : glob pattern, or list of file names
+    :return: files (list) : sorted matches of the pattern or the given file names, None if resFile
+                            is a list of results or the name of a single file
+    '''
+    isStr = lambda f: isinstance(f, (str, type(u'')))
+    if type(resFile) == list:
+        return resFile if len(resFile) > 0 and all(isStr(f) for f in resFile) else None
+    if not isStr(resFile) or os.path.exists(resFile) or not glob.has_magic(resFile):
+        return None
+    files = sorted(glob.glob(resFile))
+    if len(files) == 0:
+        raise IOError('no result files match {}'.format(resFile))
+    return files
+
+def _loadShard(args):
+    # runs in a worker process: parse one shard into an AnnStore, or a list
+    # of result dicts when the results do not fit in columns
+    path, imgIds = args
+    if imgIds is not None:
+        store, kind = loadResStream(path, imgIds)
+        if kind in ['bbox', 'segmentation', 'keypoints']:
+            return store
+    anns = _loadJson(path)
+    store = storeFromRes(anns) if len(anns) > 0 else None
+    return store if store is not None else anns
+
+def _loadJson(path):
+    with open(path, 'r') as f:
+        anns = json.load(f)
+    assert type(anns) == list, 'results in not an array of objects'
+    return anns
+
+def loadResShards(files, imgIds=None, processes=None):
+    '''
+    Load result files in parallel and merge them as if they were a single file.
+    :param files (list)     : result file names, the results are concatenated in this order
+    :param imgIds (set)     : stream the files and check their image ids (see loadResStream), None to json.load them
+    :param processes (int)  : number of worker processes, by default one per file up to the number of cpus
+    :return: anns (obj)     : AnnStore with ids 1..N, or the list of result dicts if the shards do not fit in columns
+    '''
+    processes = processes or min(len(files), multiprocessing.cpu_count())
+    args = [(f, imgIds) for f in files]
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            shards = pool.map(_loadShard, args)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        shards = [_loadShard(arg) for arg in args]
+    stores = [shard for shard in shards if len(shard) > 0]
+    if len(stores) > 0 and all(isinstance(shard, AnnStore) for shard in stores):
+        try:
+            return AnnStore.concat(stores, np.arange(1, sum(len(shard) for shard in stores)+1))
+        except ValueError:
+            # e.g. different number of keypoints in different shards
+            pass
+    # the shards are merged as plain results, the ones already turned into
+    # stores are read again (stores hold derived fields that loadRes would
+    # mistake for given ones)
+    anns = []
+    for f, shard in zip(files, shards):
+        anns += _loadJson(f) if isinstance(shard, AnnStore) else shard
+    return anns
@@ -0,0 +1,217 @@
+import os
+import uuid
+import pickle
+import tempfile
+import numpy as np
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # python < 3.8
+    shared_memory = None
+
+# Numpy arrays shared between the processes of a pool.
+#
+# Handing a COCO object (or the ious of an evaluation) to pool workers
+# pickles it into every worker, and relying on fork does not help for long:
+# refcount updates touch the pages of every Python object the workers read,
+# so each worker ends up with its own copy. SharedArrays instead copies a
+# set of numpy arrays once into a single shared memory segment. The handle
+# of the segment is a small picklable dict (name and layout of the arrays)
+# and SharedArrays.attach(handle) in a worker gives read-only views of the
+# same memory: N workers use one copy of the arrays.
+#
+# The segment is a multiprocessing.shared_memory block when available
+# (python >= 3.8), otherwise a file in /dev/shm (or the temp directory)
+# mapped with np.memmap. The process that created the segment owns it and
+# removes it in close(); workers only close their mapping. SharedArrays is a
+# context manager (the with block closes it), and an owner that is garbage
+# collected without being closed removes its segment then, so that an
+# exception does not leave the segment behind.
+#
+# packObjects / PackedObjects place a list of picklable objects (e.g. the
+# segmentations of the annotations or the image dicts) in a segment: each
+# one is pickled into a flat byte buffer with offsets, and workers unpickle
+# only the objects they read instead of receiving all of them with the
+# handle.
+
+ALIGN = 64
+SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+class SharedArrays:
+    def __init__(self, arrays=None, meta=None, handle=None):
+        '''
+        Copy arrays into a new shared memory segment owned by this process, or attach to
+        the segment of a handle created by another process (see SharedArrays.attach).
+        :param arrays (dict) : name -> numpy array (no object arrays)
+        :param meta (obj)    : small picklable data sent along with the handle
+        :param handle (dict) : handle of an existing segment, arrays and meta are then ignored
+        :return: None
+        '''
+        if handle is not None:
+            self._attach(handle)
+            return
+        layout, size = {}, 0
+        for name in sorted(arrays):
+            a = np.asarray(arrays[name])
+            assert a.dtype != object, 'cannot share object array {}'.format(name)
+            size = (size + ALIGN - 1) // ALIGN * ALIGN
+            layout[name] = (size, a.dtype.str, a.shape)
+            size += a.nbytes
+        size = max(size, 1)
+        if shared_memory is not None:
+            self._segment = shared_memory.SharedMemory(create=True, size=size)
+            self.handle = {'shm': self._segment.name, 'size': size, 'layout': layout, 'meta': meta}
+        else:
+            path = os.path.join(SHM_DIR, 'pycocotools_{}_{}'.format(os.getpid(), uuid.uuid4().hex))
+            self._segment = np.memmap(path, dtype=np.uint8, mode='w+', shape=(size,))
+            self.handle = {'file': path, 'size': size, 'layout': layout, 'meta': meta}
+        self.owner = True
+        self.arrays = self._views()
+        for name in arrays:
+            self.arrays[name][...] = arrays[name]
+
+    @classmethod
+    def attach(cls, handle):
+        '''
+        Map the segment of a handle created by another process, nothing is copied.
+        :param handle (dict)           : SharedArrays.handle
+        :return: shared (SharedArrays) : read-only views of the arrays in shared.arrays
+        '''
+        return cls(handle=handle)
+
+    def _attach(self, handle):
+        self.handle = handle
+        self.owner = False
+        if 'shm' in handle:
+            self._segment = shared_memory.SharedMemory(name=handle['shm'])
+        else:
+            self._segment = np.memmap(handle['file'], dtype=np.uint8, mode='r', shape=(handle['size'],))
+        self.arrays = self._views()
+        for a in self.arrays.values():
+            a.flags.writeable = False
+
+    @property
+    def meta(self):
+        return self.handle['meta']
+
+    def _views(self):
+        buf = self._segment.buf if 'shm' in self.handle else self._segment
+        views = {}
+        for name, (offset, dtype, shape) in self.handle['layout'].items():
+            views[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=buf, offset=offset)
+        return views
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        # the owner frees its segment, attached objects leave their mapping to the views still using it
+        if getattr(self, 'owner', False):
+            try:
+                self.close()
+            except Exception:
+                # e.g. at interpreter exit, when the modules used by close are gone
+                pass
+
+    def close(self):
+        '''
+        Drop the views of this process, and free the segment if this process created it.
+        Views of the arrays kept elsewhere must not be used after close. Closing again does nothing.
+        :return: None
+        '''
+        if getattr(self, '_segment', None) is None:
+            return
+        self.arrays = {}
+        if 'shm' in self.handle:
+            try:
+                self._segment.close()
+            except BufferError:
+                # views still referenced elsewhere, the mapping goes away with them
+                pass
+            if self.owner:
+                self._segment.unlink()
+        else:
+            self._segment = None
+            if self.owner:
+                os.remove(self.handle['file'])
+        self._segment = None
+
+def packObjects(objs):
+    '''
+    Pickle a list of objects into a flat byte buffer that can be shared.
+    :param objs (list)     : picklable objects
+    :return: packed (dict) : 'data' uint8 buffer of the pickled objects, 'offsets' [N+1] int64
+    '''
+    blobs = [pickle.dumps(obj, 2) for obj in objs]
+    offsets = np.zeros((len(blobs) + 1,), dtype=np.int64)
+    offsets[1:] = np.cumsum([len(blob) for blob in blobs])
+    data = np.frombuffer(b''.join(blobs), dtype=np.uint8) if offsets[-1] > 0 else np.zeros((0,), dtype=np.uint8)
+    return {'data': data, 'offsets': offsets}
+
+class PackedObjects:
+    # Read-only list over the output of packObjects (or views of it). Objects
+    # are unpickled when they are read; the last one is kept, as the fields of
+    # an annotation are read one after the other.
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+        self._last = (None, None)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        last = self._last
+        if last[0] is not None and last[0] == i:
+            return last[1]
+        n = len(self)
+        if not -n <= i < n:
+            raise IndexError(i)
+        i = int(i) % n
+        obj = pickle.loads(self.data[self.offsets[i]:self.offsets[i+1]].tobytes())
+        self._last = (i, obj)
+        return obj
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+class PackedMap:
+    # Read-only dict {key: object} over a PackedObjects, objects are unpickled
+    # on first access and kept so that every read gives the same object.
+    def __init__(self, keys, objs):
+        self._keys = list(keys)
+        self._rows = dict((key, i) for i, key in enumerate(self._keys))
+        self._objs = objs
+        self._cache = {}
+
+    def __getitem__(self, key):
+        obj = self._cache.get(key)
+        if obj is None:
+            obj = self._objs[self._rows[key]]
+            self._cache[key] = obj
+        return obj
+
+    def get(self, key, default=None):
+        return self[key] if key in self._rows else default
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def keys(self):
+        return list(self._keys)
+
+    def values(self):
+        return [self[key] for key in self._keys]
+
+    def items(self):
+        return [(key, self[key]) for key in self._keys]
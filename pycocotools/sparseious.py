@@ -0,0 +1,57 @@
+import numpy as np
+
+# Sparse ious (or oks) of the dts and gts of one image.
+#
+# In crowded images most dt/gt pairs do not overlap at all, yet a dense
+# [DxG] matrix stores every pair and evaluateImg copies it again for every
+# area range. SparseIous keeps only the pairs above eps in compressed sparse
+# row (CSR) format: the gts paired with dt i are the columns
+# indices[indptr[i]:indptr[i+1]] (increasing), their ious are the matching
+# entries of data. For 'segm' and 'bbox' eps=0 keeps exactly the pairs
+# whose masks or boxes overlap. A pair below the lowest iou threshold can
+# never be matched, so evaluateImg matches each dt against the gts stored
+# in its row only, without densifying the matrix.
+
+class SparseIous:
+    def __init__(self, shape, indptr, indices, data):
+        '''
+        :param shape (tuple)       : (D, G) shape of the dense matrix
+        :param indptr (int array)  : [D+1] offsets of the pairs of each dt
+        :param indices (int array) : [nnz] gt column of each pair
+        :param data (float array)  : [nnz] iou of each pair
+        '''
+        self.shape = shape
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+    @staticmethod
+    def fromDense(ious, eps=0):
+        '''
+        :param ious (float array) : [DxG] ious, or [] when there are no dts or no gts
+        :param eps (float)        : pairs with an iou <= eps are dropped
+        :return: sparse (SparseIous) : the pairs above eps, or ious itself if it is empty
+        '''
+        if len(ious) == 0:
+            return ious
+        ious = np.asarray(ious)
+        rows, cols = np.nonzero(ious > eps)
+        indptr = np.zeros((ious.shape[0]+1,), dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(rows, minlength=ious.shape[0]))
+        return SparseIous(ious.shape, indptr, cols.astype(np.int64), ious[rows, cols])
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def toarray(self):
+        '''
+        :return: ious (float array) : [DxG] dense ious, 0 for the pairs that are not stored
+        '''
+        dense = np.zeros(self.shape)
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        dense[rows, self.indices] = self.data
+        return dense
@@ -4,7 +4,9 @@ from jinja2 import Template
 
 ## COCO imports
 from pycocotools.coco import COCO
-from pycocotoolsbak.cocoanalyze import COCOanalyze
+from pycocotools.cocoanalyze import COCOanalyze
+from pycocotools.resstream import selectRes
+from pycocotools.resbin import isResBin, loadResBin
 
 ## Analysis API imports
 from analysisAPI.errorsAPImpact import errorsAPImpact
@@ -14,10 +16,11 @@ from analysisAPI.backgroundFalsePosErrors import backgroundFalsePosErrors
 from analysisAPI.backgroundFalseNegErrors import backgroundFalseNegErrors
 from analysisAPI.occlusionAndCrowdingSensitivity import occlusionAndCrowdingSensitivity
 from analysisAPI.sizeSensitivity import sizeSensitivity
+from analysisAPI import utilities
 
 def main():
-    if len(sys.argv) != 6:
-        raise ValueError("Please specify args: $> python run_analysis.py [annotations_path] [detections_path] [save_dir] [team_name] [version_name]")
+    if len(sys.argv) not in [6, 7]:
+        raise ValueError("Please specify args: $> python run_analysis.py [annotations_path] [detections_path] [save_dir] [team_name] [version_name] ([images_dir_or_url])")
 
     latex_jinja_env = jinja2.Environment(
         block_start_string    = '\BLOCK{',
@@ -43,53 +46,55 @@ def main():
         os.makedirs(saveDir)
     teamName    = sys.argv[4]
     versionName = sys.argv[5]
+    ## images of the example figures: local folder or url base (default: coco_url of each image)
+    if len(sys.argv) == 7:
+        imgSource = sys.argv[6]
+        if imgSource.startswith('http://') or imgSource.startswith('https://'):
+            utilities.set_image_source(url_base=imgSource)
+        else:
+            utilities.set_image_source(root=imgSource)
+
+    ## load ground truth annotations (parsed once, cached in binary form next to annFile)
+    coco_gt = COCO( annFile, records=True, cache=True )
+
+    ## initialize list of image IDs
+    imgIds_file = open('./coco-minival500_images.txt')
+    imgIds_str = imgIds_file.readline()
+    if imgIds_str[-1] == '\n':
+    	imgIds_str = imgIds_str[:-1]
+    imgIds_str = imgIds_str.split(',')
+    imgIds = []
+    for x in imgIds_str:
+    	imgIds.append(int(x))
+    print("The length of list is: %d"%(len(imgIds)))
+    ## restrict the ground truth (and so every stage of the analysis) to these images
+    coco_gt = coco_gt.subset(imgIds)
 
     ## create dictionary with all images info
-    gt_data   = json.load(open(annFile,'rb'))
     imgs_info = {i['id']:{'id'      :i['id'] ,
                           'width'   :i['width'],
                           'height'  :i['height'],
+                          'file_name':i['file_name'],
                           'coco_url':i['coco_url']}
-                 for i in gt_data['images']}
-
-    ## load team detections
-    dt_data  = json.load(open(resFile,'rb'))
-    team_dts = {}
-    for d in dt_data:
-        if d['image_id'] in team_dts: team_dts[d['image_id']].append(d)
-        else: team_dts[d['image_id']] = [d]
-    team_split_dts = []
-    for img_id in team_dts:
-        if img_id in imgs_info:
-            team_split_dts.extend(sorted(team_dts[img_id], key=lambda k: -k['score'])[:20])
+                 for i in coco_gt.dataset['images']}
+
+    ## load team detections: top 20 detections of every image of the split, checked for the number of keypoints
+    num_kpts = len(coco_gt.loadCats(coco_gt.getCatIds())[0]['keypoints'])
+    team_dts = loadResBin(resFile) if isResBin(resFile) else resFile
+    team_split_dts = selectRes(team_dts, imgIds=coco_gt.getImgIds(), maxDets=20, numKeypoints=num_kpts)
     print("Loaded [{}] detections from [{}] images.".format(len(team_split_dts),len(imgs_info)))
     template_vars['team_name']    = teamName
     template_vars['version_name'] = versionName
     template_vars['split_name']   = splitName
     template_vars['num_dts']      = len(team_split_dts)
-    template_vars['num_imgs_dts'] = len(set([d['image_id'] for d in team_split_dts]))
+    template_vars['num_imgs_dts'] = len(set(team_split_dts.image_id.tolist()))
     template_vars['num_imgs']     = len(imgs_info)
 
-    ## load ground truth annotations
-    coco_gt = COCO( annFile )
-
     ## initialize COCO detections api
     coco_dt   = coco_gt.loadRes( team_split_dts )
 
     ## initialize COCO analyze api
     coco_analyze = COCOanalyze(coco_gt, coco_dt, 'keypoints')
-    
-    ## initialize list of image IDs
-    imgIds_file = open('./coco-minival500_images.txt')
-    imgIds_str = imgIds_file.readline()
-    if imgIds_str[-1] == '\n':
-    	imgIds_str = imgIds_str[:-1]
-    imgIds_str = imgIds_str.split(',')
-    imgIds = []
-    for x in imgIds_str:
-    	imgIds.append(int(x))
-    print("The length of list is: %d"%(len(imgIds)))
-    coco_analyze.cocoEval.params.imgIds = imgIds
 
     ## regular evaluation
     coco_analyze.evaluate(verbose=True, makeplots=True, savedir=saveDir, team_name=teamName)
@@ -0,0 +1,109 @@
+# Small synthetic datasets for the tests.
+#
+# dataset() builds a few images of people with keypoints, boxes and polygon
+# segmentations (some crowd, some without visible keypoints); the *Results
+# functions build noisy detections of them, with a few false positives.
+
+import copy
+import numpy as np
+from pycocotools.coco import COCO
+import pycocotools.mask as maskUtils
+
+SKELETON = [[16, 14], [14, 12], [17, 15], [15, 13], [12, 13], [6, 12], [7, 13], [6, 7], [6, 8], [7, 9],
+            [8, 10], [9, 11], [2, 3], [1, 2], [1, 3], [2, 4], [3, 5], [4, 6], [5, 7]]
+
+def dataset(seed=0, numImgs=20):
+    '''
+    :param seed (int)    : seed of the random annotations
+    :param numImgs (int) : number of images
+    :return: dataset (dict) : gt dataset, as loaded from a json annotation file
+    '''
+    rs = np.random.RandomState(seed)
+    images, anns = [], []
+    for i in range(numImgs):
+        imgId = 1000 + 7 * i
+        images.append({'id': imgId, 'width': 320, 'height': 240, 'file_name': '{:012d}.jpg'.format(imgId)})
+        for j in range(rs.randint(0, 8)):
+            cx, cy, s = rs.uniform(30, 290), rs.uniform(30, 210), rs.uniform(10, 120)
+            v = rs.choice([0, 1, 2], size=17, p=[.3, .2, .5])
+            if rs.rand() < .1:
+                v[:] = 0
+            x = np.round(cx + rs.randn(17) * s / 3) * (v > 0)
+            y = np.round(cy + rs.randn(17) * s / 2) * (v > 0)
+            bb = [float(cx - s / 2), float(cy - s / 1.5), float(s), float(s * 1.3)]
+            x0, y0, x1, y1 = bb[0], bb[1], bb[0] + bb[2], bb[1] + bb[3]
+            anns.append({'id': len(anns) + 1, 'image_id': imgId, 'category_id': 1,
+                         'iscrowd': int(rs.rand() < .1), 'num_keypoints': int((v > 0).sum()),
+                         'keypoints': np.stack([x, y, v], 1).reshape(-1).astype(int).tolist(),
+                         'bbox': bb, 'area': float(bb[2] * bb[3] * rs.uniform(.4, .8)),
+                         'segmentation': [[x0, y0, (x0 + x1) / 2, y0 - 5, x1, y0, x1, y1, x0, y1]]})
+    cats = [{'id': 1, 'name': 'person', 'supercategory': 'person',
+             'keypoints': ['k{}'.format(k) for k in range(17)], 'skeleton': SKELETON}]
+    return {'info': {'description': 'synthetic'}, 'images': images, 'annotations': anns, 'categories': cats}
+
+def _detections(ds, rs):
+    # (ann, jitter) of every detection, the false positives get a random box and no keypoints
+    imgIds = [img['id'] for img in ds['images']]
+    dets = []
+    for ann in ds['annotations']:
+        for k in range(rs.randint(0, 4)):
+            dets.append((ann, rs.uniform(1, 20)))
+    for k in range(len(imgIds)):
+        dets.append(({'image_id': imgIds[rs.randint(len(imgIds))], 'category_id': 1,
+                      'bbox': [rs.uniform(0, 250), rs.uniform(0, 180), rs.uniform(5, 60), rs.uniform(5, 60)],
+                      'keypoints': None}, 0))
+    return dets
+
+def keypointResults(ds, seed=0):
+    '''
+    :return: results (list) : keypoint detections of the annotations of ds
+    '''
+    rs = np.random.RandomState(seed)
+    res = []
+    for ann, jitter in _detections(ds, rs):
+        if ann['keypoints'] is None:
+            bb = ann['bbox']
+            kp = np.stack([bb[0] + rs.rand(17) * bb[2], bb[1] + rs.rand(17) * bb[3]], 1)
+        else:
+            kp = np.array(ann['keypoints'], dtype=np.float64).reshape((17, 3))[:, :2]
+            # keypoints that are not labeled are detected around the center of the box
+            bb = ann['bbox']
+            kp = np.where(kp == 0, [[bb[0] + bb[2] / 2, bb[1] + bb[3] / 2]], kp)
+            kp = kp + rs.randn(17, 2) * jitter
+        kp = np.concatenate([kp, rs.rand(17, 1)], 1)
+        res.append({'image_id': ann['image_id'], 'category_id': 1,
+                    'keypoints': kp.reshape(-1).tolist(), 'score': float(rs.rand())})
+    return res
+
+def boxResults(ds, seed=0, segm=False):
+    '''
+    :param segm (bool) : give the detections an RLE segmentation instead of a box
+    :return: results (list) : box (or segmentation) detections of the annotations of ds
+    '''
+    rs = np.random.RandomState(seed)
+    imgs = dict((img['id'], img) for img in ds['images'])
+    res = []
+    for ann, jitter in _detections(ds, rs):
+        bb = (np.array(ann['bbox']) + rs.randn(4) * jitter / 4).tolist()
+        bb[2], bb[3] = max(bb[2], 1.), max(bb[3], 1.)
+        r = {'image_id': ann['image_id'], 'category_id': 1, 'bbox': bb, 'score': float(rs.rand())}
+        if segm:
+            # a jittered quadrilateral in the box
+            img = imgs[ann['image_id']]
+            x = bb[0] + bb[2] * np.array([0, 1, 1, 0]) + rs.randn(4) * bb[2] / 8
+            y = bb[1] + bb[3] * np.array([0, 0, 1, 1]) + rs.randn(4) * bb[3] / 8
+            poly = np.stack([x, y], 1).reshape(-1).tolist()
+            r['segmentation'] = maskUtils.merge(maskUtils.frPyObjects([poly], img['height'], img['width']))
+            del r['bbox']
+        res.append(r)
+    return res
+
+def coco(ds, **kwargs):
+    '''
+    :param ds (dict) : dataset, it is copied
+    :return: coco (COCO) : api object over ds, kwargs are given to COCO
+    '''
+    c = COCO(**kwargs)
+    c.dataset = copy.deepcopy(ds)
+    c.createIndex()
+    return c
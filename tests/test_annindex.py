@@ -0,0 +1,59 @@
+import itertools
+import unittest
+from pycocotools.annstore import AnnIndex
+import cocodata
+
+def filterAnns(dataset, imgIds=[], catIds=[], areaRng=[], iscrowd=None):
+    # the filters of the original getAnnIds, over the annotation dicts
+    imgIds = imgIds if type(imgIds) == list else [imgIds]
+    catIds = catIds if type(catIds) == list else [catIds]
+    anns = dataset['annotations']
+    if len(imgIds) > 0:
+        anns = list(itertools.chain.from_iterable([[ann for ann in anns if ann['image_id'] == imgId]
+                                                   for imgId in imgIds]))
+    anns = anns if len(catIds) == 0 else [ann for ann in anns if ann['category_id'] in catIds]
+    anns = anns if len(areaRng) == 0 else [ann for ann in anns if ann['area'] > areaRng[0] and ann['area'] < areaRng[1]]
+    return [ann['id'] for ann in anns if iscrowd == None or ann['iscrowd'] == iscrowd]
+
+class TestAnnIndex(unittest.TestCase):
+    def setUp(self):
+        self.ds = cocodata.dataset(14)
+        # a second category on some annotations
+        for ann in self.ds['annotations'][::3]:
+            ann['category_id'] = 2
+        self.ds['categories'].append({'id': 2, 'name': 'other', 'supercategory': 'other'})
+        imgIds = [img['id'] for img in self.ds['images']]
+        self.filters = [{}, {'imgIds': imgIds[3]}, {'imgIds': imgIds[::-2] + [-5, imgIds[0]]},
+                        {'catIds': 2}, {'catIds': [1, 2]}, {'catIds': [3]},
+                        {'areaRng': [0, 3000]}, {'areaRng': [2000, 1e10], 'iscrowd': 0},
+                        {'iscrowd': True}, {'iscrowd': False, 'catIds': [1], 'imgIds': imgIds[:5]}]
+
+    def check(self, coco):
+        for kwargs in self.filters:
+            self.assertEqual(coco.getAnnIds(**kwargs), filterAnns(self.ds, **kwargs), kwargs)
+
+    def test_dict(self):
+        self.check(cocodata.coco(self.ds))
+
+    def test_columnar(self):
+        self.check(cocodata.coco(self.ds, columnar=True))
+
+    def test_rows(self):
+        # annotations of interleaved images, in load order within each image
+        index = AnnIndex.fromAnns([{'id': i + 10, 'image_id': imgId} for i, imgId in enumerate([5, 3, 5, 9, 3, 5])])
+        self.assertEqual(index.rows([5, 9, 3]).tolist(), [0, 2, 5, 3, 1, 4])
+        self.assertEqual(index.rows([3, 4, 3]).tolist(), [1, 4, 1, 4])
+        self.assertEqual(len(index.rows([-1])), 0)
+
+    def test_missing_fields(self):
+        # filters on a field some annotation lacks fall back to the dicts
+        anns = [{'id': 1, 'image_id': 1, 'category_id': 1, 'iscrowd': 0},
+                {'id': 2, 'image_id': 1, 'category_id': 2, 'iscrowd': 0, 'area': 4.}]
+        index = AnnIndex.fromAnns(anns)
+        self.assertTrue(index.getAnnIds(areaRng=[0, 10]) is None)
+        self.assertEqual(index.getAnnIds(catIds=[2]), [2])
+        self.assertTrue(AnnIndex.fromAnns([{'id': 1, 'image_id': 'a'}]) is None)
+        self.assertTrue(AnnIndex.fromAnns([{'image_id': 1}]) is None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import copy
+import pickle
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from pycocotools.annstore import AnnStore, AnnRecord
+from pycocotools.cocoeval import COCOeval
+import cocodata
+
+# three annotations written out by hand: integer keypoints, a crowd RLE and a
+# polygon, and a caption like field only some of them have
+ANNS = [{'id': 7, 'image_id': 1, 'category_id': 1, 'iscrowd': 0, 'num_keypoints': 2, 'area': 120.5,
+         'bbox': [1., 2., 10., 12.], 'keypoints': [3, 4, 2, 0, 0, 0, 8, 9, 1],
+         'segmentation': [[1., 2., 11., 2., 11., 14.]]},
+        {'id': 3, 'image_id': 2, 'category_id': 1, 'iscrowd': 1, 'num_keypoints': 0, 'area': 40.,
+         'bbox': [0., 0., 4., 10.], 'keypoints': [0, 0, 0, 0, 0, 0, 0, 0, 0],
+         'segmentation': {'size': [20, 20], 'counts': [0, 10, 390]}, 'note': 'crowd'},
+        {'id': 12, 'image_id': 1, 'category_id': 2, 'iscrowd': 0, 'num_keypoints': 3, 'area': 8.,
+         'bbox': [5., 5., 2., 4.], 'keypoints': [5, 5, 2, 6, 7, 2, 6, 9, 2],
+         'segmentation': [[5., 5., 7., 5., 7., 9.]]}]
+
+class TestAnnStore(unittest.TestCase):
+    def setUp(self):
+        self.store = AnnStore.fromAnns(ANNS)
+
+    def test_round_trip(self):
+        self.assertEqual([self.store.ann(row) for row in range(len(self.store))], ANNS)
+        self.assertTrue(self.store.kpt_integral)
+        self.assertEqual(self.store.keypoints.shape, (3, 3, 3))
+        self.assertEqual(self.store.keypoints.dtype, np.float32)
+        self.assertEqual(self.store.extras[1], {'segmentation': ANNS[1]['segmentation'], 'note': 'crowd'})
+
+    def test_float_keypoints(self):
+        anns = [dict(ann, keypoints=[k + .25 for k in ann['keypoints']]) for ann in ANNS]
+        store = AnnStore.fromAnns(anns, kpt_dtype=np.float64)
+        self.assertFalse(store.kpt_integral)
+        self.assertEqual([store.ann(row)['keypoints'] for row in range(3)], [ann['keypoints'] for ann in anns])
+
+    def test_ragged(self):
+        # keypoints of different lengths are kept in the extras
+        anns = [dict(ann) for ann in ANNS]
+        anns[2]['keypoints'] = anns[2]['keypoints'][:6]
+        store = AnnStore.fromAnns(anns)
+        self.assertTrue(store.keypoints is None)
+        self.assertEqual([store.ann(row) for row in range(3)], anns)
+
+    def test_rows(self):
+        self.assertEqual(self.store.rows([12, 7, 3]).tolist(), [2, 0, 1])
+        self.assertRaises(KeyError, self.store.rows, [7, 8])
+        self.assertEqual(self.store.imgRows(1).tolist(), [0, 2])
+        self.assertEqual(len(self.store.imgRows(5)), 0)
+
+    def test_save_load(self):
+        path = tempfile.mkdtemp()
+        try:
+            self.store.save(path)
+            store = AnnStore.load(path)
+            self.assertEqual([store.ann(row) for row in range(len(store))], ANNS)
+            self.assertTrue(isinstance(store.keypoints, np.memmap))
+        finally:
+            shutil.rmtree(path)
+
+class TestAnnRecord(unittest.TestCase):
+    def setUp(self):
+        self.ds = cocodata.dataset(19)
+        self.coco = cocodata.coco(self.ds, records=True)
+        self.anns = self.coco.loadAnns(self.coco.getAnnIds())
+
+    def test_read(self):
+        self.assertTrue(all(isinstance(ann, AnnRecord) for ann in self.anns))
+        self.assertEqual(self.anns, self.ds['annotations'])
+        ann, ref = self.anns[0], self.ds['annotations'][0]
+        self.assertFalse(hasattr(ann, '__dict__'))
+        self.assertEqual(sorted(ann.keys()), sorted(ref.keys()))
+        self.assertEqual(dict(ann.items()), ref)
+        self.assertEqual(len(ann), len(ref))
+        self.assertTrue('keypoints' in ann and not 'score' in ann)
+        self.assertEqual(ann.get('score', -1), -1)
+        self.assertRaises(KeyError, lambda: ann['score'])
+
+    def test_changes(self):
+        # the same changes on a record and on its dict
+        ann, ref = self.anns[1], copy.deepcopy(self.ds['annotations'][1])
+        for o in [ann, ref]:
+            o['score'] = .5
+            o['keypoints'] = [0] * len(o['keypoints'])
+            del o['area']
+            o.update(iscrowd=1)
+            o.setdefault('num_keypoints', 3)
+            o.pop('segmentation')
+            o.pop('segmentation', None)
+        self.assertEqual(ann, ref)
+        self.assertRaises(KeyError, lambda: ann['area'])
+        self.assertRaises(KeyError, ann.pop, 'area')
+        # the store is unchanged
+        self.assertEqual(self.coco.store.ann(1), self.ds['annotations'][1])
+
+    def test_copy(self):
+        ann = self.anns[2]
+        for o in [copy.copy(ann), copy.deepcopy(ann), pickle.loads(pickle.dumps(ann, 2)), ann.copy()]:
+            self.assertEqual(type(o), dict)
+            self.assertEqual(o, self.ds['annotations'][2])
+
+    def test_evaluate(self):
+        # evaluating records gives the results of evaluating dicts
+        stats = []
+        for records in [False, True]:
+            gt = cocodata.coco(self.ds, records=records)
+            E = COCOeval(gt, gt.loadRes(cocodata.keypointResults(self.ds, 19)), 'keypoints')
+            E.evaluate()
+            E.accumulate()
+            E.summarize()
+            stats.append(E.stats)
+        np.testing.assert_array_equal(stats[0], stats[1])
+
+class TestGetKeypoints(unittest.TestCase):
+    def setUp(self):
+        self.ds = cocodata.dataset(8)
+
+    def check(self, coco, inplace=True):
+        anns = coco.loadAnns(coco.getAnnIds())[::-2]
+        ref = np.array([ann['keypoints'] for ann in anns], dtype=np.float64)
+        np.testing.assert_array_equal(coco.getKeypoints(anns), ref)
+        # keypoints set on a loaded annotation are used
+        anns[0]['keypoints'] = [k + 1 for k in anns[0]['keypoints']]
+        ref[0] += 1
+        if inplace:
+            # the fields of records are built when read, only dicts can be changed in place
+            anns[1]['keypoints'][0] += 1
+            ref[1, 0] += 1
+        np.testing.assert_array_equal(coco.getKeypoints(anns), ref)
+        np.testing.assert_array_equal(coco.getKeypoints(coco.loadAnns([anns[0]['id']])), ref[:1])
+
+    def test_dict(self):
+        self.check(cocodata.coco(self.ds))
+
+    def test_columnar(self):
+        self.check(cocodata.coco(self.ds, columnar=True))
+
+    def test_records(self):
+        self.check(cocodata.coco(self.ds, records=True), inplace=False)
+
+    def test_records_from_store(self):
+        coco = cocodata.coco(self.ds, records=True)
+        anns = coco.loadAnns(coco.getAnnIds())
+        keypoints = coco.store.keypoints
+        try:
+            # a marker in the column shows the records were read from it
+            coco.store.keypoints = keypoints + 1
+            np.testing.assert_array_equal(coco.getKeypoints(anns),
+                                          np.array([ann['keypoints'] for ann in self.ds['annotations']]) + 1)
+        finally:
+            coco.store.keypoints = keypoints
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+import numpy as np
+import pycocotools.mask as maskUtils
+from pycocotools.cocoeval import COCOeval
+from pycocotools.batchious import BatchIous
+from pycocotools.sparseious import SparseIous
+import cocodata
+
+def assertSameSparse(test, sparse, ref, eps):
+    # sparse is the SparseIous of the pairs of ref above eps
+    if len(ref) == 0:
+        test.assertEqual(sparse, [])
+        return
+    ref = SparseIous.fromDense(ref, eps)
+    test.assertEqual(sparse.shape, ref.shape)
+    np.testing.assert_array_equal(sparse.indptr, ref.indptr)
+    np.testing.assert_array_equal(sparse.indices, ref.indices)
+    np.testing.assert_array_equal(sparse.data, ref.data)
+
+class TestBatchIous(unittest.TestCase):
+    def test_from_dict(self):
+        rs = np.random.RandomState(0)
+        ious = {(1, 1): rs.rand(3, 2), (2, 1): [], (3, 1): rs.rand(1, 4)}
+        batch = BatchIous.fromDict(ious)
+        self.assertEqual(sorted(batch.keys()), sorted(ious.keys()))
+        self.assertEqual(batch[2, 1], [])
+        for key in [(1, 1), (3, 1)]:
+            np.testing.assert_array_equal(batch[key], ious[key])
+        self.assertFalse((4, 1) in batch)
+        self.assertEqual(batch.get((4, 1), []), [])
+
+    def test_from_dict_sparse(self):
+        rs = np.random.RandomState(1)
+        dense = {(1, 1): rs.rand(3, 2) * (rs.rand(3, 2) > .5), (2, 1): [], (3, 1): rs.rand(4, 5) * (rs.rand(4, 5) > .5)}
+        batch = BatchIous.fromDict(dict((key, SparseIous.fromDense(o)) for key, o in dense.items()))
+        self.assertTrue(batch.sparse)
+        for key, o in dense.items():
+            assertSameSparse(self, batch[key], o, 0)
+
+class TestOksBatch(unittest.TestCase):
+    def setUp(self):
+        ds = cocodata.dataset(9)
+        gt = cocodata.coco(ds)
+        self.E = COCOeval(gt, gt.loadRes(cocodata.keypointResults(ds, 9)), 'keypoints')
+        self.E.params.maxDets = [3]
+        self.E._prepare()
+        self.keys = [(imgId, 1) for imgId in self.E.params.imgIds]
+
+    def test_oks(self):
+        # the chunks split images apart, or hold one pair, or all of them
+        for chunk in [1, 7, 1<<16]:
+            batch = self.E.computeOksBatch(self.keys, chunk=chunk)
+            self.assertEqual(batch.offsets[-1], len(batch.data))
+            for key in self.keys:
+                ref = self.E.computeOks(*key)
+                if len(ref) == 0:
+                    self.assertEqual(batch[key], [])
+                else:
+                    self.assertTrue(np.shares_memory(batch[key], batch.data))
+                    np.testing.assert_array_equal(batch[key], ref)
+
+    def test_evaluate(self):
+        # self.ious holds the views of the batch, with the values of computeOks
+        self.E.evaluate()
+        for key in self.keys:
+            ref = self.E.computeOks(*key)
+            if len(ref) > 0:
+                np.testing.assert_array_equal(self.E.ious[key], ref)
+            else:
+                self.assertEqual(self.E.ious[key], [])
+
+    def test_sparse(self):
+        for chunk in [1, 7, 1<<16]:
+            batch = self.E.computeOksBatch(self.keys, chunk=chunk, sparse=.05)
+            for key in self.keys:
+                assertSameSparse(self, batch[key], self.E.computeOks(*key), .05)
+
+    def test_share(self):
+        self.E.evaluate()
+        self.checkShare()
+
+    def test_share_sparse(self):
+        self.E.evaluate(sparse=.05)
+        self.checkShare()
+
+    def checkShare(self):
+        shared = self.E.shareIous()
+        try:
+            E = COCOeval(self.E.cocoGt, self.E.cocoDt, 'keypoints')
+            E.attachIous(shared.handle)
+            for key in self.keys:
+                o = E.ious[key]
+                if isinstance(o, SparseIous):
+                    assertSameSparse(self, o, self.E.ious[key].toarray(), 0)
+                else:
+                    np.testing.assert_array_equal(o, self.E.ious[key])
+            E._sharedIous.close()
+        finally:
+            shared.close()
+
+class TestIoUBatchSparse(unittest.TestCase):
+    def setUp(self):
+        ds = cocodata.dataset(10)
+        gt = cocodata.coco(ds)
+        self.E = COCOeval(gt, gt.loadRes(cocodata.boxResults(ds, 10)), 'bbox')
+        self.E._prepare()
+        self.keys = [(imgId, 1) for imgId in self.E.params.imgIds]
+
+    def check(self):
+        for chunk in [1, 10, 1<<20]:
+            batch = self.E.computeIoUBatch(self.keys, sparse=0, chunk=chunk)
+            for key in self.keys:
+                assertSameSparse(self, batch[key], self.E.computeIoU(*key), 0)
+
+    def test_sparse(self):
+        self.check()
+
+    def test_without_iou_batch(self):
+        iou_batch = maskUtils.iou_batch
+        maskUtils.iou_batch = None
+        try:
+            self.check()
+        finally:
+            maskUtils.iou_batch = iou_batch
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+from analysisAPI import utilities
+import cocodata
+
+def pairwiseIous(anns):
+    # compute_iou on every pair, as the original compute_ious did
+    ious = np.zeros((len(anns), len(anns)))
+    for i in range(len(anns)):
+        for j in range(i, len(anns)):
+            ious[i,j] = utilities.compute_iou(anns[i]['bbox'], anns[j]['bbox'])
+            if i != j:
+                ious[j,i] = ious[i,j]
+    return ious
+
+class TestBoxIous(unittest.TestCase):
+    def setUp(self):
+        ds = cocodata.dataset(22)
+        anns = ds['annotations']
+        # boxes without area, and the same box twice
+        anns[0]['bbox'] = [10., 10., 0., 0.]
+        anns[1]['bbox'] = [anns[1]['bbox'][0], anns[1]['bbox'][1], 0., 5.]
+        anns[3]['bbox'] = list(anns[2]['bbox'])
+        self.imgs = []
+        for img in ds['images']:
+            self.imgs.append([ann for ann in anns if ann['image_id'] == img['id']])
+
+    def test_compute_ious(self):
+        for anns in self.imgs:
+            np.testing.assert_array_equal(utilities.compute_ious(anns), pairwiseIous(anns))
+
+    def test_batch(self):
+        offsets = np.cumsum([0] + [len(anns) for anns in self.imgs])
+        bboxes = [ann['bbox'] for anns in self.imgs for ann in anns]
+        ious, ious_offsets, rows, cols = utilities.compute_ious_batch(bboxes, offsets)
+        self.assertEqual(len(ious_offsets), len(self.imgs) + 1)
+        for k, anns in enumerate(self.imgs):
+            ref = pairwiseIous(anns)
+            o = ious[ious_offsets[k]:ious_offsets[k+1]].reshape(ref.shape)
+            np.testing.assert_array_equal(o, ref)
+            n = len(anns)
+            np.testing.assert_array_equal(rows[ious_offsets[k]:ious_offsets[k+1]],
+                                          offsets[k] + np.repeat(np.arange(n), n))
+            np.testing.assert_array_equal(cols[ious_offsets[k]:ious_offsets[k+1]],
+                                          offsets[k] + np.tile(np.arange(n), n))
+
+    def test_empty(self):
+        ious, ious_offsets, rows, cols = utilities.compute_ious_batch(np.zeros((0, 4)), [0, 0])
+        self.assertEqual(len(ious), 0)
+        self.assertEqual(ious_offsets.tolist(), [0, 0])
+        self.assertEqual(utilities.compute_ious([]).shape, (0, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from pycocotools.coco import COCO
+import cocodata
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.file = os.path.join(self.dir, 'person_keypoints.json')
+        with open(self.file, 'w') as f:
+            json.dump(cocodata.dataset(6), f)
+        with open(self.file, 'r') as f:
+            self.ref = json.load(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def check(self, coco):
+        self.assertEqual(sorted(coco.dataset.keys()), sorted(self.ref.keys()))
+        self.assertEqual(list(coco.dataset['annotations']), self.ref['annotations'])
+        self.assertEqual(coco.dataset['images'], self.ref['images'])
+        self.assertEqual(coco.getAnnIds(), [ann['id'] for ann in self.ref['annotations']])
+
+    def loaded(self, **kwargs):
+        # True if a coco object with these arguments reads the cache
+        return COCO(**kwargs)._loadCache(self.file, kwargs.get('cache_dir'))
+
+    def test_dict(self):
+        self.assertFalse(self.loaded())
+        self.check(COCO(self.file, cache=True))
+        self.assertTrue(self.loaded())
+        self.check(COCO(self.file, cache=True))
+
+    def test_columnar(self):
+        self.check(COCO(self.file, cache=True, columnar=True))
+        self.assertTrue(self.loaded(columnar=True))
+        self.check(COCO(self.file, cache=True, columnar=True))
+
+    def test_both_modes(self):
+        # the second mode adds its annotations to the cache of the first one
+        COCO(self.file, cache=True)
+        self.assertFalse(self.loaded(columnar=True))
+        COCO(self.file, cache=True, columnar=True)
+        self.assertTrue(self.loaded(columnar=True))
+        self.assertTrue(self.loaded())
+
+    def test_cache_dir(self):
+        cacheDir = os.path.join(self.dir, 'cache')
+        COCO(self.file, cache=True, cache_dir=cacheDir)
+        self.assertEqual(len(os.listdir(cacheDir)), 1)
+        self.check(COCO(self.file, cache=True, cache_dir=cacheDir))
+
+    def test_stale(self):
+        COCO(self.file, cache=True)
+        self.ref['annotations'] = self.ref['annotations'][1:]
+        with open(self.file, 'w') as f:
+            json.dump(self.ref, f)
+        self.assertFalse(self.loaded())
+        self.check(COCO(self.file, cache=True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+from pycocotools.coco import COCO
+from pycocotools.imagestore import ImageStore
+if sys.version_info[0] == 2:
+    from BaseHTTPServer import HTTPServer
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+else:
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def readBytes(fname):
+    with open(fname, 'rb') as f:
+        return f.read()
+
+class TestImageStore(unittest.TestCase):
+    def setUp(self):
+        # an image folder behind a local http server
+        self.dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.dir, 'images')
+        os.makedirs(self.root)
+        self.imgs = [{'id': i, 'file_name': 'COCO_val2014_{:012d}.jpg'.format(i)} for i in range(6)]
+        for i, img in enumerate(self.imgs):
+            with open(os.path.join(self.root, img['file_name']), 'wb') as f:
+                f.write(os.urandom(100 * (i+1)))
+        self.requests = []
+        root, requests = self.root, self.requests
+        class Handler(SimpleHTTPRequestHandler):
+            def translate_path(self, path):
+                requests.append(path)
+                return os.path.join(root, path.lstrip('/'))
+            def log_message(self, *args):
+                pass
+        self.server = _Server(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        for img in self.imgs:
+            img['coco_url'] = self.url + '/' + img['file_name']
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def expected(self, img):
+        return readBytes(os.path.join(self.root, img['file_name']))
+
+    def test_root(self):
+        store = ImageStore(root=self.root, reader=readBytes)
+        for img in self.imgs:
+            self.assertEqual(store.read(img), self.expected(img))
+        self.assertEqual(self.requests, [])
+
+    def test_url(self):
+        for url_base in [self.url, None]:
+            cache = os.path.join(self.dir, 'cache{}'.format(url_base is None))
+            store = ImageStore(url_base=url_base, cache_dir=cache, reader=readBytes, threads=3)
+            try:
+                # the images prefetched (one of them twice) and read in order, then read again from the cache
+                imgs = self.imgs + self.imgs[:1]
+                store.prefetch(imgs)
+                for img in imgs:
+                    self.assertEqual(store.read(img), self.expected(img))
+                for img, image in store.fetch(self.imgs):
+                    self.assertEqual(image, self.expected(img))
+            finally:
+                store.close()
+            self.assertEqual(sorted(os.listdir(cache)), sorted(img['file_name'] for img in self.imgs))
+        self.assertEqual(len(self.requests), 2 * len(self.imgs))
+
+    def test_cache_size(self):
+        # room for the two largest images
+        sizes = [len(self.expected(img)) for img in self.imgs]
+        cache = os.path.join(self.dir, 'cache')
+        store = ImageStore(url_base=self.url, cache_dir=cache, cache_size=sizes[-1] + sizes[-2], threads=1)
+        for img in self.imgs:
+            self.assertEqual(readBytes(store.read(img)), self.expected(img))
+        names = os.listdir(cache)
+        self.assertTrue(self.imgs[-1]['file_name'] in names)
+        self.assertTrue(sum(os.path.getsize(os.path.join(cache, n)) for n in names) <= sizes[-1] + sizes[-2])
+        store.close()
+
+    def test_download(self):
+        gt = COCO()
+        gt.dataset = {'images': self.imgs, 'annotations': [], 'categories': []}
+        gt.createIndex()
+        tarDir = os.path.join(self.dir, 'download')
+        gt.download(tarDir, [img['id'] for img in self.imgs[:3]], threads=2)
+        for img in self.imgs[:3]:
+            self.assertEqual(readBytes(os.path.join(tarDir, img['file_name'])), self.expected(img))
+        self.assertEqual(len(os.listdir(tarDir)), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from collections import defaultdict
+import cocodata
+
+INDEXES = ['anns', 'imgToAnns', 'catToImgs', 'imgs', 'cats']
+
+def eagerIndex(dataset):
+    # the indexes as built by the original createIndex, all at once
+    anns, cats, imgs = {}, {}, {}
+    imgToAnns, catToImgs = defaultdict(list), defaultdict(list)
+    for ann in dataset['annotations']:
+        imgToAnns[ann['image_id']].append(ann)
+        anns[ann['id']] = ann
+    for img in dataset['images']:
+        imgs[img['id']] = img
+    for cat in dataset['categories']:
+        cats[cat['id']] = cat
+    for ann in dataset['annotations']:
+        catToImgs[ann['category_id']].append(ann['image_id'])
+    return {'anns': anns, 'imgToAnns': imgToAnns, 'catToImgs': catToImgs, 'imgs': imgs, 'cats': cats}
+
+class TestLazyIndex(unittest.TestCase):
+    def setUp(self):
+        self.ds = cocodata.dataset(15)
+
+    def check(self, coco):
+        ref = eagerIndex(self.ds)
+        for name in INDEXES:
+            index = getattr(coco, name)
+            self.assertEqual(sorted(index.keys()), sorted(ref[name].keys()), name)
+            for key in ref[name]:
+                self.assertEqual(index[key], ref[name][key], name)
+
+    def test_lazy(self):
+        coco = cocodata.coco(self.ds)
+        self.assertFalse(any(name in coco.__dict__ for name in INDEXES))
+        coco.getImgIds()
+        self.assertEqual([name for name in INDEXES if name in coco.__dict__], ['imgs'])
+        coco.loadAnns(1)
+        self.assertFalse('imgToAnns' in coco.__dict__ or 'catToImgs' in coco.__dict__)
+        self.check(coco)
+
+    def test_dict(self):
+        self.check(cocodata.coco(self.ds))
+
+    def test_columnar(self):
+        self.check(cocodata.coco(self.ds, columnar=True))
+
+    def test_reindex(self):
+        coco = cocodata.coco(self.ds)
+        self.check(coco)
+        del self.ds['annotations'][0]
+        coco.dataset['annotations'] = self.ds['annotations']
+        coco.createIndex()
+        self.assertFalse(1 in coco.anns)
+        self.check(coco)
+
+    def test_result(self):
+        gt = cocodata.coco(self.ds)
+        res = gt.loadRes(cocodata.keypointResults(self.ds, 15))
+        self.assertFalse(any(name in res.__dict__ for name in ['imgToAnns', 'catToImgs']))
+        self.assertEqual(sorted(res.getAnnIds()), list(range(1, len(res.dataset['annotations'])+1)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import numpy as np
+import pycocotools.mask as maskUtils
+from pycocotools.cocoeval import COCOeval
+import cocodata
+
+def _blocks(rs, rle):
+    # random images of boxes (or masks of boxes), some without dts or gts
+    blocks = []
+    for k in range(30):
+        m, n = rs.randint(0, 6), rs.randint(0, 6)
+        d = np.column_stack([rs.uniform(0, 40, (m, 2)), rs.uniform(1, 20, (m, 2))])
+        g = np.column_stack([rs.uniform(0, 40, (n, 2)), rs.uniform(1, 20, (n, 2))])
+        if rle:
+            d = maskUtils.frPyObjects(d, 64, 64) if m > 0 else []
+            g = maskUtils.frPyObjects(g, 64, 64) if n > 0 else []
+        blocks.append((d, g, (rs.rand(n) < .3).astype(np.uint8).tolist()))
+    return blocks
+
+class TestIouBatch(unittest.TestCase):
+    def check(self, blocks, stack):
+        d = stack([b[0] for b in blocks])
+        g = stack([b[1] for b in blocks])
+        iscrowd = [c for b in blocks for c in b[2]]
+        dtOffsets = np.cumsum([0] + [len(b[0]) for b in blocks])
+        gtOffsets = np.cumsum([0] + [len(b[1]) for b in blocks])
+        for threads in [1, 4]:
+            ious, offsets = maskUtils.iou_batch(d, g, iscrowd, dtOffsets, gtOffsets, threads)
+            self.assertEqual(len(offsets), len(blocks) + 1)
+            for k, (dk, gk, ck) in enumerate(blocks):
+                ref = maskUtils.iou(dk, gk, ck)
+                got = ious[offsets[k]:offsets[k+1]]
+                if len(dk) == 0 or len(gk) == 0:
+                    self.assertEqual(len(got), 0)
+                else:
+                    np.testing.assert_array_equal(got.reshape((len(dk), len(gk)), order='F'), ref)
+
+    def test_boxes(self):
+        self.check(_blocks(np.random.RandomState(0), False),
+                   lambda bbs: np.concatenate(bbs).reshape((-1, 4)))
+
+    def test_rles(self):
+        self.check(_blocks(np.random.RandomState(1), True),
+                   lambda rles: [r for rs in rles for r in rs])
+
+class TestComputeIoUBatch(unittest.TestCase):
+    def setUp(self):
+        ds = cocodata.dataset(2)
+        gt = cocodata.coco(ds)
+        self.E = COCOeval(gt, gt.loadRes(cocodata.boxResults(ds, 2)), 'bbox')
+        self.E.params.maxDets = [1, 3, 5]
+        self.E._prepare()
+        self.keys = [(imgId, 1) for imgId in self.E.params.imgIds]
+
+    def check(self):
+        batch = self.E.computeIoUBatch(self.keys)
+        self.assertEqual(batch.keys(), self.keys)
+        for key in self.keys:
+            ious = batch[key]
+            ref = self.E.computeIoU(*key)
+            if len(ref) == 0:
+                self.assertEqual(len(ious), 0)
+            else:
+                np.testing.assert_array_equal(ious, ref)
+
+    def test_batch(self):
+        self.check()
+
+    def test_without_iou_batch(self):
+        # extension built before iou_batch: one mask api call per image
+        iou_batch = maskUtils.iou_batch
+        maskUtils.iou_batch = None
+        try:
+            self.check()
+        finally:
+            maskUtils.iou_batch = iou_batch
+
+if __name__ == '__main__':
+    unittest.main()
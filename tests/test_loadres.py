@@ -0,0 +1,238 @@
+import os
+import copy
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pycocotools.coco as coco
+from pycocotools.resstream import iterJsonArray, selectRes
+from pycocotools.resbin import HEADER, ResWriter, isResBin, jsonToResBin, loadResBin, recordDtype
+import cocodata
+
+def normalize(ann):
+    # plain python values, so that annotations built from arrays compare equal to the dicts
+    value = lambda v: v.tolist() if isinstance(v, (np.ndarray, np.generic)) else v
+    return dict((k, [value(x) for x in v] if isinstance(v, list) else value(v)) for k, v in ann.items())
+
+def annotations(res):
+    return [normalize(ann) for ann in res.loadAnns(res.getAnnIds())]
+
+def topResults(results, imgIds, maxDets):
+    # the selection loop of run_analysis: group by image, keep the maxDets highest scores of every image
+    groups, order = {}, []
+    for r in results:
+        if not r['image_id'] in groups:
+            groups[r['image_id']] = []
+            order.append(r['image_id'])
+        groups[r['image_id']].append(r)
+    top = []
+    for imgId in order:
+        if imgId in imgIds:
+            top.extend(sorted(groups[imgId], key=lambda k: -k['score'])[:maxDets])
+    return top
+
+class LoadResTest(unittest.TestCase):
+    def setUp(self):
+        self.ds = cocodata.dataset(13)
+        self.gt = cocodata.coco(self.ds)
+        self.dir = tempfile.mkdtemp()
+        self.results = {'keypoints': cocodata.keypointResults(self.ds, 13),
+                        'bbox': cocodata.boxResults(self.ds, 13),
+                        'segm': cocodata.boxResults(self.ds, 13, segm=True)}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def reference(self, results):
+        # the results as loaded by the per result loop of loadRes
+        storeFromRes = coco.storeFromRes
+        coco.storeFromRes = lambda anns: None
+        try:
+            res = self.gt.loadRes(copy.deepcopy(results))
+        finally:
+            coco.storeFromRes = storeFromRes
+        self.assertTrue(res.store is None)
+        return annotations(res)
+
+    def write(self, results, name='results.json'):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            json.dump(results, f)
+        return path
+
+class TestLoadRes(LoadResTest):
+    def test_list(self):
+        for kind in self.results:
+            res = self.gt.loadRes(copy.deepcopy(self.results[kind]))
+            self.assertTrue(res.store is not None)
+            self.assertEqual(annotations(res), self.reference(self.results[kind]))
+
+    def test_file(self):
+        for kind in self.results:
+            res = self.gt.loadRes(self.write(self.results[kind]))
+            self.assertEqual(annotations(res), self.reference(self.results[kind]))
+
+    def test_ragged(self):
+        # keypoint results of different lengths stay dicts
+        results = copy.deepcopy(self.results['keypoints'])
+        results[0]['keypoints'] = results[0]['keypoints'][:-3]
+        res = self.gt.loadRes(results)
+        self.assertTrue(res.store is None)
+        self.assertEqual(res.loadAnns(1)[0]['keypoints'], results[0]['keypoints'])
+        self.assertEqual(len(res.getAnnIds()), len(results))
+
+class TestLoadNumpy(LoadResTest):
+    def test_boxes(self):
+        data = np.array([[r['image_id']] + r['bbox'] + [r['score'], r['category_id']] for r in self.results['bbox']])
+        res = self.gt.loadRes(data)
+        # the rows converted to dicts one at a time
+        ref = [{'image_id': int(row[0]), 'bbox': [row[1], row[2], row[3], row[4]], 'score': row[5],
+                'category_id': int(row[6])} for row in data]
+        self.assertEqual(annotations(res), self.reference(ref))
+        self.assertTrue(np.shares_memory(res.store.bbox, data))
+
+    def test_keypoints(self):
+        data = np.array([[r['image_id'], r['category_id']] + r['keypoints'] + [r['score']]
+                         for r in self.results['keypoints']])
+        res = self.gt.loadRes(data)
+        self.assertEqual(annotations(res), self.reference(self.results['keypoints']))
+        self.assertTrue(np.shares_memory(res.store.keypoints, data))
+        self.assertTrue(np.shares_memory(res.store.score, data))
+
+    def test_num_keypoints(self):
+        # any number of keypoints per row
+        results = [dict(r, keypoints=r['keypoints'][:15]) for r in self.results['keypoints']]
+        data = np.array([[r['image_id'], r['category_id']] + r['keypoints'] + [r['score']] for r in results])
+        self.assertEqual(annotations(self.gt.loadRes(data)), self.reference(results))
+        self.assertRaises(AssertionError, self.gt.loadRes, np.zeros((3, 8)))
+
+class TestLoadResShards(LoadResTest):
+    def shards(self, results):
+        # the results split into 3 files, one of them empty
+        n = len(results) // 2
+        return [self.write(results[:n], 'shard0.json'), self.write([], 'shard1.json'),
+                self.write(results[n:], 'shard2.json')]
+
+    def test_shards(self):
+        for kind in self.results:
+            files = self.shards(self.results[kind])
+            ref = annotations(self.gt.loadRes(self.write(self.results[kind])))
+            for processes in [1, 2]:
+                for stream in [False, True]:
+                    res = self.gt.loadRes(files, stream=stream, processes=processes)
+                    self.assertEqual(annotations(res), ref)
+
+    def test_glob(self):
+        self.shards(self.results['bbox'])
+        res = self.gt.loadRes(os.path.join(self.dir, 'shard*.json'))
+        self.assertEqual(annotations(res), self.reference(self.results['bbox']))
+        self.assertRaises(IOError, self.gt.loadRes, os.path.join(self.dir, 'other*.json'))
+
+    def test_ragged(self):
+        # shards with different numbers of keypoints are merged as dicts
+        results = copy.deepcopy(self.results['keypoints'])
+        for r in results[len(results) // 2:]:
+            r['keypoints'] = r['keypoints'][:-3]
+        res = self.gt.loadRes(self.shards(results), processes=2)
+        self.assertTrue(res.store is None)
+        self.assertEqual(annotations(res), self.reference(results))
+
+class TestSelectRes(LoadResTest):
+    def setUp(self):
+        LoadResTest.setUp(self)
+        # results on the same image with the same score keep their order
+        for r in self.results['keypoints'][::4]:
+            r['score'] = .5
+        self.imgIds = self.gt.getImgIds()[::2]
+
+    def test_select(self):
+        ref = self.reference(topResults(self.results['keypoints'], set(self.imgIds), 3))
+        for resFile in [copy.deepcopy(self.results['keypoints']), self.write(self.results['keypoints'])]:
+            store = selectRes(resFile, imgIds=self.imgIds, maxDets=3, numKeypoints=17)
+            self.assertEqual(annotations(self.gt.loadRes(store)), ref)
+
+    def test_all(self):
+        store = selectRes(copy.deepcopy(self.results['bbox']))
+        ref = topResults(self.results['bbox'], set(self.gt.getImgIds()), len(self.results['bbox']))
+        self.assertEqual(annotations(self.gt.loadRes(store)), self.reference(ref))
+
+    def test_checks(self):
+        results = copy.deepcopy(self.results['keypoints'])
+        self.assertRaises(ValueError, selectRes, results, numKeypoints=18)
+        results[3]['keypoints'][4] = float('nan')
+        self.assertRaises(ValueError, selectRes, results)
+
+class TestResBin(LoadResTest):
+    def test_convert(self):
+        for kind in ['keypoints', 'bbox']:
+            path = os.path.join(self.dir, kind + '.bin')
+            jsonFile = self.write(self.results[kind])
+            self.assertEqual(jsonToResBin(jsonFile, path), len(self.results[kind]))
+            self.assertTrue(isResBin(path))
+            self.assertFalse(isResBin(jsonFile))
+            res = self.gt.loadRes(path)
+            self.assertTrue(isinstance(res.store.score, np.memmap))
+            self.assertEqual(annotations(res), self.reference(self.results[kind]))
+        self.assertRaises(AssertionError, jsonToResBin, self.write(self.results['segm']), path)
+
+    def test_writer(self):
+        # results written in batches, read in memory
+        results = self.results['keypoints']
+        path = os.path.join(self.dir, 'results.bin')
+        with ResWriter(path, 17) as writer:
+            for i in range(0, len(results), 10):
+                batch = results[i:i+10]
+                writer.write([r['image_id'] for r in batch], [r['category_id'] for r in batch],
+                             [r['score'] for r in batch], keypoints=[r['keypoints'] for r in batch])
+        store = loadResBin(path, mmap_mode=None)
+        self.assertFalse(isinstance(store.score, np.memmap))
+        self.assertEqual(annotations(self.gt.loadRes(store)), self.reference(results))
+
+    def test_layout(self):
+        # fixed size records after the header, the count is written on close
+        path = os.path.join(self.dir, 'boxes.bin')
+        writer = ResWriter(path, 0)
+        writer.write(5, 1, .5, bbox=[1., 2., 3., 4.])
+        writer.write([6, 7], [1, 1], [.25, .75], bbox=[[0., 0., 1., 1.], [2., 2., 2., 2.]])
+        writer.close()
+        self.assertEqual(os.path.getsize(path), HEADER + 3 * recordDtype(0).itemsize)
+        store = loadResBin(path)
+        self.assertEqual(store.image_id.tolist(), [5, 6, 7])
+        self.assertEqual(store.area.tolist(), [12., 1., 4.])
+        self.assertEqual(store.ann(0)['segmentation'], [[1., 2., 1., 6., 4., 6., 4., 2.]])
+
+    def test_empty(self):
+        path = os.path.join(self.dir, 'empty.bin')
+        ResWriter(path, 17).close()
+        self.assertEqual(len(loadResBin(path)), 0)
+
+class TestLoadResStream(LoadResTest):
+    def test_stream(self):
+        for kind in self.results:
+            res = self.gt.loadRes(self.write(self.results[kind]), stream=True)
+            self.assertTrue(res.store is not None)
+            self.assertEqual(annotations(res), self.reference(self.results[kind]))
+
+    def test_captions(self):
+        imgIds = self.gt.getImgIds()
+        captions = [{'image_id': imgIds[i % 3], 'caption': u'a person number {}'.format(i)} for i in range(5)]
+        res = self.gt.loadRes(self.write(captions), stream=True)
+        self.assertEqual(annotations(res), self.reference(captions))
+        self.assertEqual(sorted(res.getImgIds()), sorted(imgIds[:3]))
+
+    def test_small_chunks(self):
+        # objects and strings split across reads
+        path = self.write(self.results['keypoints'] + [{'image_id': 1, 'caption': u'a "quoted" [caption], {x}'}])
+        with open(path, 'r') as f:
+            anns = list(iterJsonArray(f, chunk_size=7))
+        self.assertEqual(anns[:-1], self.results['keypoints'])
+        self.assertEqual(anns[-1]['caption'], u'a "quoted" [caption], {x}')
+
+    def test_other_image(self):
+        results = copy.deepcopy(self.results['bbox'])
+        results[-1]['image_id'] = -1
+        self.assertRaises(AssertionError, self.gt.loadRes, self.write(results), stream=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import copy
+import pickle
+import unittest
+import numpy as np
+import pycocotools.mask as maskUtils
+import pycocotools.cocoeval as cocoeval
+from pycocotools.lrucache import LRUCache
+from pycocotools.cocoeval import COCOeval
+import cocodata
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(10, len)
+        cache.put(1, 'aaaa')
+        cache.put(2, 'bbbb')
+        self.assertEqual(cache.get(1), 'aaaa')
+        cache.put(3, 'cccc')
+        self.assertFalse(2 in cache)
+        self.assertEqual(cache.get(1), 'aaaa')
+        self.assertEqual(cache.nbytes, 8)
+        cache.put(1, 'a')
+        self.assertEqual(cache.nbytes, 5)
+
+    def test_disabled(self):
+        cache = LRUCache(0, len)
+        cache.put(1, 'a')
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get(1, 'x'), 'x')
+
+    def test_tag(self):
+        cache = LRUCache(10, len)
+        a, b = ['x'], ['x']
+        cache.put(1, 'aaaa', tag=a)
+        self.assertEqual(cache.get(1, tag=a), 'aaaa')
+        # an equal object is not the same object
+        self.assertEqual(cache.get(1, 'y', tag=b), 'y')
+        self.assertEqual(cache.get(1), None)
+
+    def test_pickled_empty(self):
+        cache = LRUCache(10, len)
+        cache.put(1, 'a')
+        cache = pickle.loads(pickle.dumps(cache))
+        self.assertEqual((len(cache), cache.max_bytes), (0, 10))
+
+class TestRLECache(unittest.TestCase):
+    def setUp(self):
+        self.ds = cocodata.dataset(4)
+        self.gt = cocodata.coco(self.ds)
+        self.converted = []
+        self.segmToRLE = maskUtils.segmToRLE
+        def count(segm, h, w):
+            self.converted.append(segm)
+            return self.segmToRLE(segm, h, w)
+        maskUtils.segmToRLE = count
+
+    def tearDown(self):
+        maskUtils.segmToRLE = self.segmToRLE
+
+    def test_ann_to_rle(self):
+        ann = self.gt.dataset['annotations'][0]
+        rle = self.gt.annToRLE(ann)
+        self.assertTrue(self.gt.annToRLE(ann) is rle)
+        self.assertEqual(len(self.converted), 1)
+        img = self.gt.imgs[ann['image_id']]
+        np.testing.assert_array_equal(maskUtils.decode(rle),
+                                      maskUtils.decode(self.segmToRLE(ann['segmentation'], img['height'], img['width'])))
+
+    def test_ann_to_mask(self):
+        gt = cocodata.coco(self.ds)
+        gt.maskCache = LRUCache(1 << 20, lambda m: m.nbytes)
+        ann = gt.dataset['annotations'][1]
+        m = gt.annToMask(ann)
+        self.assertTrue(gt.annToMask(ann) is m)
+        self.assertFalse(m.flags.writeable)
+        np.testing.assert_array_equal(m, maskUtils.decode(gt.annToRLE(ann)))
+        # without a mask cache every call decodes a new mask
+        self.assertFalse(self.gt.annToMask(ann) is self.gt.annToMask(ann))
+
+    def test_other_annotation(self):
+        # annotations with the id of a cached one, but another segmentation
+        gt = cocodata.coco(self.ds, mask_cache=1 << 20)
+        ann = gt.dataset['annotations'][0]
+        rle, m = gt.annToRLE(ann), gt.annToMask(ann)
+        other = dict(self.ds['annotations'][1], id=ann['id'])
+        edited = copy.deepcopy(ann)
+        edited['segmentation'][0] = [v + 3 for v in edited['segmentation'][0]]
+        for o in [other, edited]:
+            img = gt.imgs[o['image_id']]
+            ref = maskUtils.decode(self.segmToRLE(o['segmentation'], img['height'], img['width']))
+            self.assertFalse(np.array_equal(ref, m))
+            np.testing.assert_array_equal(maskUtils.decode(gt.annToRLE(o)), ref)
+            np.testing.assert_array_equal(gt.annToMask(o), ref)
+        self.assertEqual(len(self.converted), 3)
+        # the entries of the original annotation were replaced
+        np.testing.assert_array_equal(gt.annToMask(ann), m)
+        self.assertEqual(len(self.converted), 4)
+
+    def test_subset(self):
+        ann = self.gt.dataset['annotations'][0]
+        rle = self.gt.annToRLE(ann)
+        sub = self.gt.subset([ann['image_id']])
+        self.assertTrue(sub.annToRLE(sub.anns[ann['id']]) is rle)
+        self.assertEqual(len(self.converted), 1)
+
+    def test_subset_reindex(self):
+        ann = self.gt.dataset['annotations'][0]
+        self.gt.annToRLE(ann)
+        sub = self.gt.subset([ann['image_id']])
+        self.assertTrue(ann['id'] in sub.rleCache)
+        sub.createIndex()
+        self.assertFalse(ann['id'] in sub.rleCache)
+        self.assertTrue(ann['id'] in self.gt.rleCache)
+
+    def test_evaluators_share_rles(self):
+        dt = self.gt.loadRes(cocodata.boxResults(self.ds, 4, segm=True))
+        # the detections are RLEs already
+        del self.converted[:]
+        results = []
+        for k in range(2):
+            E = COCOeval(self.gt, dt, 'segm')
+            E.params.useGtIgnore = 0
+            E.evaluate()
+            results.append(E.ious)
+            if k == 0:
+                self.assertEqual(len(self.converted), len(self.ds['annotations']))
+        # the second evaluator converts nothing
+        self.assertEqual(len(self.converted), len(self.ds['annotations']))
+        for key, ious in results[0].items():
+            np.testing.assert_array_equal(ious, results[1][key])
+
+    def test_worker_rles_cached(self):
+        dt = self.gt.loadRes(cocodata.boxResults(self.ds, 4, segm=True))
+        minAnns = cocoeval.MIN_ANNS_PER_PROCESS
+        cocoeval.MIN_ANNS_PER_PROCESS = 1
+        try:
+            E = COCOeval(self.gt, dt, 'segm')
+            E._prepare(processes=2)
+        finally:
+            cocoeval.MIN_ANNS_PER_PROCESS = minAnns
+        for ann in self.gt.dataset['annotations']:
+            self.assertTrue(self.gt.rleCache.get(ann['id'], tag=ann['segmentation']) is E._gtRles[ann['id']])
+
+if __name__ == '__main__':
+    unittest.main()
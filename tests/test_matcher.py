@@ -0,0 +1,97 @@
+import unittest
+import numpy as np
+from pycocotools.cocoeval import COCOeval
+from pycocotools.sparseious import SparseIous
+import cocodata
+
+def greedyMatch(ious, gtIds, dtIds, gtIg, iscrowd, iouThrs):
+    # the matching loop of the original evaluateImg, one threshold and one detection at a time
+    T, D, G = len(iouThrs), len(dtIds), len(gtIds)
+    gtm, dtm, dtIg = np.zeros((T,G)), np.zeros((T,D)), np.zeros((T,D))
+    dtIous, gtIous = np.zeros((T,D)), np.zeros((T,G))
+    for tind, t in enumerate(iouThrs):
+        for dind in range(D):
+            iou = min([t,1-1e-10])
+            m = -1
+            for gind in range(G):
+                if gtm[tind,gind]>0 and not iscrowd[gind]:
+                    continue
+                if m>-1 and gtIg[m]==0 and gtIg[gind]==1:
+                    break
+                if ious[dind,gind] < iou:
+                    continue
+                iou = ious[dind,gind]
+                m = gind
+            if m == -1:
+                continue
+            dtIg[tind,dind] = gtIg[m]
+            dtm[tind,dind] = gtIds[m]
+            gtm[tind,m] = dtIds[dind]
+            dtIous[tind,dind] = iou
+            gtIous[tind,m] = iou
+    return dtm, gtm, dtIg, dtIous, gtIous
+
+class TestMatcher(unittest.TestCase):
+    def check(self, E, **kwargs):
+        E.evaluate(**kwargs)
+        crowd = dict((ann['id'], ann['iscrowd']) for ann in E.cocoGt.dataset['annotations'])
+        matched = 0
+        for e in E.evalImgs:
+            if e is None or len(e['dtIds']) == 0 or len(e['gtIds']) == 0:
+                continue
+            # the ious of the evaluation, in the order of the ids of the result
+            gt, dt = E._iouAnns(e['image_id'], e['category_id'])
+            ious = E.ious[e['image_id'], e['category_id']]
+            ious = ious.toarray() if isinstance(ious, SparseIous) else ious
+            dtRows = dict((d['id'], i) for i, d in enumerate(dt))
+            gtCols = dict((g['id'], j) for j, g in enumerate(gt))
+            ious = ious[[dtRows[i] for i in e['dtIds']]][:, [gtCols[i] for i in e['gtIds']]]
+            ref = greedyMatch(ious, e['gtIds'], e['dtIds'], e['gtIgnore'], [crowd[i] for i in e['gtIds']],
+                            E.params.iouThrs)
+            np.testing.assert_array_equal(e['dtMatches'], ref[0])
+            np.testing.assert_array_equal(e['gtMatches'], ref[1])
+            # unmatched detections outside of the area range are ignored as well
+            np.testing.assert_array_equal(e['dtIgnore'][e['dtMatches'] > 0], ref[2][ref[0] > 0])
+            np.testing.assert_array_equal(e['dtIous'], ref[3])
+            np.testing.assert_array_equal(e['gtIous'], ref[4])
+            matched += int(np.count_nonzero(ref[0]))
+        self.assertTrue(matched > 0)
+
+    def keypoints(self):
+        ds = cocodata.dataset(11)
+        gt = cocodata.coco(ds)
+        return COCOeval(gt, gt.loadRes(cocodata.keypointResults(ds, 11)), 'keypoints')
+
+    def boxes(self):
+        ds = cocodata.dataset(12)
+        gt = cocodata.coco(ds)
+        E = COCOeval(gt, gt.loadRes(cocodata.boxResults(ds, 12)), 'bbox')
+        E.params.useGtIgnore = 0
+        return E
+
+    def test_keypoints(self):
+        self.check(self.keypoints())
+
+    def test_keypoints_sparse(self):
+        self.check(self.keypoints(), sparse=.1)
+
+    def test_boxes(self):
+        self.check(self.boxes())
+
+    def test_boxes_sparse(self):
+        self.check(self.boxes(), sparse=0)
+
+    def test_not_densified(self):
+        E = self.keypoints()
+        toarray = SparseIous.toarray
+        def fail(ious):
+            raise AssertionError('sparse ious densified')
+        SparseIous.toarray = fail
+        try:
+            E.evaluate(sparse=.1)
+        finally:
+            SparseIous.toarray = toarray
+        self.assertTrue(any(isinstance(o, SparseIous) for o in E.ious.values()))
+
+if __name__ == '__main__':
+    unittest.main()
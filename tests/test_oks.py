@@ -0,0 +1,74 @@
+import unittest
+import numpy as np
+from pycocotools.cocoeval import COCOeval
+import cocodata
+
+def pairOks(E, imgId, catId):
+    # the oks of one dt/gt pair at a time, as in the original computeOks
+    p = E.params
+    gts = E._gts[imgId, catId]
+    dts = E._dts[imgId, catId]
+    inds = np.argsort([-d['score'] for d in dts], kind='mergesort')
+    dts = [dts[i] for i in inds][:p.maxDets[-1]]
+    if len(gts) == 0 or len(dts) == 0:
+        return []
+    ious = np.zeros((len(dts), len(gts)))
+    vars = (p.kpt_oks_sigmas * 2)**2
+    k = len(p.kpt_oks_sigmas)
+    for j, gt in enumerate(gts):
+        g = np.array(gt['keypoints'])
+        xg = g[0::3]; yg = g[1::3]; vg = g[2::3]
+        k1 = np.count_nonzero(vg > 0)
+        bb = gt['bbox']
+        x0 = bb[0] - bb[2]; x1 = bb[0] + bb[2] * 2
+        y0 = bb[1] - bb[3]; y1 = bb[1] + bb[3] * 2
+        for i, dt in enumerate(dts):
+            d = np.array(dt['keypoints'])
+            xd = d[0::3]; yd = d[1::3]
+            if k1 > 0:
+                dx = xd - xg
+                dy = yd - yg
+            else:
+                z = np.zeros((k))
+                dx = np.max((z, x0-xd), axis=0) + np.max((z, xd-x1), axis=0)
+                dy = np.max((z, y0-yd), axis=0) + np.max((z, yd-y1), axis=0)
+            e = (dx**2 + dy**2) / vars / (gt['area'] + np.spacing(1)) / 2
+            if k1 > 0:
+                e = e[vg > 0]
+            ious[i, j] = np.sum(np.exp(-e)) / e.shape[0]
+    return ious
+
+class TestOks(unittest.TestCase):
+    def check(self, columnar=False, maxDets=20):
+        ds = cocodata.dataset(23)
+        # results with the same score are taken in order
+        res = cocodata.keypointResults(ds, 23)
+        for r in res[::5]:
+            r['score'] = .5
+        gt = cocodata.coco(ds, columnar=columnar)
+        E = COCOeval(gt, gt.loadRes(res), 'keypoints')
+        E.params.maxDets = [maxDets]
+        E._prepare()
+        invisible = 0
+        for imgId in E.params.imgIds:
+            ref = pairOks(E, imgId, 1)
+            oks = E.computeOks(imgId, 1)
+            if len(ref) == 0:
+                self.assertEqual(len(oks), 0)
+                continue
+            np.testing.assert_array_equal(oks, ref)
+            invisible += sum(gt['num_keypoints'] == 0 for gt in E._gts[imgId, 1])
+        # both the visible keypoint and the doubled box branches are covered
+        self.assertTrue(invisible > 0)
+
+    def test_oks(self):
+        self.check()
+
+    def test_max_dets(self):
+        self.check(maxDets=2)
+
+    def test_columnar(self):
+        self.check(columnar=True)
+
+if __name__ == '__main__':
+    unittest.main()
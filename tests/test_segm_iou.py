@@ -0,0 +1,38 @@
+import unittest
+import numpy as np
+import pycocotools.mask as maskUtils
+from pycocotools.cocoeval import COCOeval
+import cocodata
+
+def maskIous(dms, gms, iscrowd):
+    # ious of decoded masks, a crowd gt counts the dt area as the union
+    ious = np.zeros((len(dms), len(gms)))
+    for i, dm in enumerate(dms):
+        for j, gm in enumerate(gms):
+            inter = np.logical_and(dm, gm).sum()
+            union = dm.sum() if iscrowd[j] else np.logical_or(dm, gm).sum()
+            ious[i, j] = float(inter) / union if union > 0 else 0
+    return ious
+
+class TestSegmIoU(unittest.TestCase):
+    def test_ious(self):
+        ds = cocodata.dataset(3)
+        gt = cocodata.coco(ds)
+        E = COCOeval(gt, gt.loadRes(cocodata.boxResults(ds, 3, segm=True)), 'segm')
+        E._prepare()
+        disjoint = 0
+        for imgId in E.params.imgIds:
+            g, d = E._iouAnns(imgId, 1)
+            ious = E.computeIoU(imgId, 1)
+            if len(g) == 0 or len(d) == 0:
+                self.assertEqual(len(ious), 0)
+                continue
+            ref = maskIous([maskUtils.decode(E._dtRles[o['id']]) for o in d],
+                           [maskUtils.decode(E._gtRles[o['id']]) for o in g], [o['iscrowd'] for o in g])
+            np.testing.assert_allclose(ious, ref, rtol=1e-12)
+            disjoint += np.count_nonzero(ref == 0)
+        # pairs of masks that do not overlap are covered
+        self.assertTrue(disjoint > 0)
+
+if __name__ == '__main__':
+    unittest.main()
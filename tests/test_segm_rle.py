@@ -0,0 +1,102 @@
+import unittest
+import multiprocessing
+import numpy as np
+import pycocotools.mask as maskUtils
+import pycocotools.cocoeval as cocoeval
+from pycocotools.cocoeval import COCOeval
+import cocodata
+
+def polygonRLE(segm, h, w):
+    # the conversion of the original _prepare, one annotation at a time
+    if type(segm) == list:
+        return maskUtils.merge(maskUtils.frPyObjects(segm, h, w))
+    if type(segm['counts']) == list:
+        return maskUtils.frPyObjects(segm, h, w)
+    return segm
+
+def _evaluated(ds):
+    # runs in a pool worker, which cannot start processes of its own
+    cocoeval.MIN_ANNS_PER_PROCESS = 1
+    gt = cocodata.coco(ds)
+    E = COCOeval(gt, gt.loadRes(cocodata.boxResults(ds, 21, segm=True)), 'segm')
+    E.params.useGtIgnore = 0
+    E.evaluate(processes=2)
+    E.accumulate()
+    E.summarize()
+    return E.stats
+
+class TestSegmRLE(unittest.TestCase):
+    def setUp(self):
+        self.ds = cocodata.dataset(21)
+        self.gt = cocodata.coco(self.ds)
+        self.dt = self.gt.loadRes(cocodata.boxResults(self.ds, 21, segm=True))
+        self.minAnns = cocoeval.MIN_ANNS_PER_PROCESS
+        cocoeval.MIN_ANNS_PER_PROCESS = 1
+
+    def tearDown(self):
+        cocoeval.MIN_ANNS_PER_PROCESS = self.minAnns
+
+    def evaluate(self, processes):
+        E = COCOeval(cocodata.coco(self.ds), self.dt, 'segm')
+        E.params.useGtIgnore = 0
+        E.evaluate(processes=processes)
+        E.accumulate()
+        E.summarize()
+        return E
+
+    def test_workers(self):
+        ref = self.evaluate(1)
+        E = self.evaluate(2)
+        for ann in self.ds['annotations']:
+            img = E.cocoGt.imgs[ann['image_id']]
+            rle = polygonRLE(ann['segmentation'], img['height'], img['width'])
+            np.testing.assert_array_equal(maskUtils.decode(E._gtRles[ann['id']]), maskUtils.decode(rle))
+            self.assertEqual(E._gtRles[ann['id']], ref._gtRles[ann['id']])
+        np.testing.assert_array_equal(E.stats, ref.stats)
+        # the polygons of the annotations are kept
+        self.assertEqual(E.cocoGt.dataset['annotations'], self.ds['annotations'])
+
+    def test_reused(self):
+        E = self.evaluate(2)
+        converted = []
+        segmToRLE = maskUtils.segmToRLE
+        def count(segm, h, w):
+            converted.append(segm)
+            return segmToRLE(segm, h, w)
+        maskUtils.segmToRLE = count
+        try:
+            stats = E.stats
+            # in this process, so that a conversion would be counted
+            E.evaluate(processes=1)
+            E.accumulate()
+            E.summarize()
+        finally:
+            maskUtils.segmToRLE = segmToRLE
+        self.assertEqual(converted, [])
+        np.testing.assert_array_equal(E.stats, stats)
+
+    def test_serial_by_default(self):
+        Pool, cpu_count = multiprocessing.Pool, multiprocessing.cpu_count
+        def fail(*args, **kwargs):
+            raise AssertionError('pool started')
+        multiprocessing.Pool = fail
+        multiprocessing.cpu_count = lambda: 4
+        try:
+            E = COCOeval(self.gt, self.dt, 'segm')
+            E.params.useGtIgnore = 0
+            E.evaluate()
+        finally:
+            multiprocessing.Pool, multiprocessing.cpu_count = Pool, cpu_count
+        self.assertEqual(len(E._gtRles), len(self.ds['annotations']))
+
+    def test_in_pool_worker(self):
+        pool = multiprocessing.Pool(1)
+        try:
+            stats = pool.apply(_evaluated, (self.ds,))
+        finally:
+            pool.close()
+            pool.join()
+        np.testing.assert_array_equal(stats, self.evaluate(1).stats)
+
+if __name__ == '__main__':
+    unittest.main()
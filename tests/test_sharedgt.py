@@ -0,0 +1,53 @@
+import copy
+import threading
+import unittest
+import numpy as np
+from pycocotools.cocoeval import COCOeval
+from pycocotools.cocoanalyze import COCOanalyze
+import cocodata
+
+def stats(gt, results, iouType):
+    E = COCOeval(gt, gt.loadRes(copy.deepcopy(results)), iouType)
+    # only the keypoint params set it
+    E.params.useGtIgnore = 0
+    E.evaluate()
+    E.accumulate()
+    E.summarize()
+    return E.stats
+
+class TestSharedGt(unittest.TestCase):
+    def setUp(self):
+        self.ds = cocodata.dataset(16)
+        self.gt = cocodata.coco(self.ds)
+        self.results = [('keypoints', cocodata.keypointResults(self.ds, 1)),
+                        ('keypoints', cocodata.keypointResults(self.ds, 2)),
+                        ('bbox', cocodata.boxResults(self.ds, 3))]
+
+    def test_unmodified(self):
+        for iouType, results in self.results:
+            stats(self.gt, results, iouType)
+        self.assertEqual(self.gt.dataset, self.ds)
+
+    def test_analyze(self):
+        analyze = COCOanalyze(self.gt, self.gt.loadRes(copy.deepcopy(self.results[0][1])))
+        analyze.evaluate()
+        analyze.analyze(check_kpts=True, check_scores=True, check_bckgd=True)
+        self.assertEqual(self.gt.dataset, self.ds)
+
+    def test_threads(self):
+        # every evaluation on its own gt, then all of them at once on the same gt
+        ref = [stats(cocodata.coco(self.ds), results, iouType) for iouType, results in self.results]
+        out = [None] * len(self.results)
+        def run(i):
+            out[i] = stats(self.gt, self.results[i][1], self.results[i][0])
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(self.results))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for s, r in zip(out, ref):
+            np.testing.assert_array_equal(s, r)
+        self.assertEqual(self.gt.dataset, self.ds)
+
+if __name__ == '__main__':
+    unittest.main()
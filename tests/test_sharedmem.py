@@ -0,0 +1,134 @@
+import os
+import gc
+import pickle
+import unittest
+import multiprocessing
+import numpy as np
+from pycocotools.coco import COCO
+from pycocotools.cocoeval import COCOeval
+from pycocotools import sharedmem
+from pycocotools.sharedmem import SharedArrays, packObjects, PackedObjects
+import cocodata
+
+def _attached(args):
+    # worker: everything read through the handle
+    handle, annIds = args
+    coco = COCO.attach(handle)
+    anns = coco.loadAnns(annIds)
+    imgs = coco.loadImgs(coco.getImgIds())
+    return anns, imgs, coco.dataset['categories'], len(coco.store.extras)
+
+def _attachedIous(handle):
+    E = COCOeval(iouType='keypoints')
+    E.attachIous(handle)
+    return dict((key, np.array(o)) for key, o in E.ious.items())
+
+def exists(handle):
+    # whether the segment of handle can still be attached to
+    if 'file' in handle:
+        return os.path.exists(handle['file'])
+    try:
+        sharedmem.shared_memory.SharedMemory(name=handle['shm']).close()
+    except OSError:
+        return False
+    return True
+
+class TestSharedArrays(unittest.TestCase):
+    def test_round_trip(self):
+        arrays = {'a': np.arange(10, dtype=np.int64), 'b': np.random.RandomState(0).rand(3, 4), 'c': np.zeros((0,))}
+        shared = SharedArrays(arrays, meta={'x': 1})
+        try:
+            attached = SharedArrays.attach(pickle.loads(pickle.dumps(shared.handle)))
+            for name in arrays:
+                np.testing.assert_array_equal(attached.arrays[name], arrays[name])
+            self.assertEqual(attached.meta, {'x': 1})
+            self.assertFalse(attached.arrays['a'].flags.writeable)
+            attached.close()
+        finally:
+            shared.close()
+
+    def test_with(self):
+        try:
+            with SharedArrays({'a': np.arange(3)}) as shared:
+                handle = shared.handle
+                self.assertTrue(exists(handle))
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertFalse(exists(handle))
+        # closing again does nothing
+        shared.close()
+
+    def test_collected(self):
+        # an owner frees the segment when it is collected, an attached object does not
+        shared = SharedArrays({'a': np.arange(3)})
+        handle = shared.handle
+        attached = SharedArrays.attach(handle)
+        del attached
+        gc.collect()
+        self.assertTrue(exists(handle))
+        del shared
+        gc.collect()
+        self.assertFalse(exists(handle))
+
+    def test_pack_objects(self):
+        objs = [{'segmentation': [[1., 2., 3.]]}, {}, None, u'caption']
+        packed = PackedObjects(**packObjects(objs))
+        self.assertEqual(list(packed), objs)
+        self.assertEqual(packed[-1], objs[-1])
+        self.assertRaises(IndexError, lambda: packed[4])
+        self.assertEqual(len(PackedObjects(**packObjects([]))), 0)
+
+class TestShareCOCO(unittest.TestCase):
+    def setUp(self):
+        self.ds = cocodata.dataset(5)
+        self.annIds = [ann['id'] for ann in self.ds['annotations']]
+
+    def check(self, gt, skip=()):
+        with gt.share(skip) as shared:
+            # the large fields are in the segment, not in the pickled handle
+            handle = pickle.dumps(shared.handle, 2)
+            self.assertFalse(b'segmentation' in handle)
+            self.assertFalse(b'file_name' in handle)
+            pool = multiprocessing.Pool(2)
+            try:
+                results = pool.map(_attached, [(shared.handle, self.annIds)] * 2)
+            finally:
+                pool.close()
+                pool.join()
+        for anns, imgs, cats, numExtras in results:
+            ref = [dict((k, v) for k, v in ann.items() if not k in skip) for ann in self.ds['annotations']]
+            self.assertEqual(anns, ref)
+            self.assertEqual(sorted(imgs, key=lambda img: img['id']), self.ds['images'])
+            self.assertEqual(cats, self.ds['categories'])
+            self.assertEqual(numExtras, len(self.annIds))
+
+    def test_dict(self):
+        self.check(cocodata.coco(self.ds))
+
+    def test_columnar(self):
+        self.check(cocodata.coco(self.ds, columnar=True))
+
+    def test_skip(self):
+        self.check(cocodata.coco(self.ds, columnar=True), skip=('segmentation',))
+
+    def test_ious(self):
+        gt = cocodata.coco(self.ds)
+        E = COCOeval(gt, gt.loadRes(cocodata.keypointResults(self.ds, 5)), 'keypoints')
+        E.evaluate()
+        shared = E.shareIous()
+        try:
+            pool = multiprocessing.Pool(1)
+            try:
+                ious = pool.apply(_attachedIous, (shared.handle,))
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            shared.close()
+        self.assertEqual(sorted(ious.keys()), sorted(E.ious.keys()))
+        for key in E.ious:
+            np.testing.assert_array_equal(ious[key].reshape(np.shape(E.ious[key])), E.ious[key])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import numpy as np
+from pycocotools.cocoeval import COCOeval
+from pycocotools.sparseious import SparseIous
+import cocodata
+
+class TestSparseIous(unittest.TestCase):
+    def setUp(self):
+        self.ious = np.array([[0., .5, 0., .2],
+                              [0., 0., 0., 0.],
+                              [.9, 0., .05, .3]])
+
+    def test_from_dense(self):
+        sparse = SparseIous.fromDense(self.ious)
+        self.assertEqual((len(sparse), sparse.nnz), (3, 5))
+        self.assertEqual(sparse.indptr.tolist(), [0, 2, 2, 5])
+        self.assertEqual(sparse.indices.tolist(), [1, 3, 0, 2, 3])
+        np.testing.assert_array_equal(sparse.toarray(), self.ious)
+        above = SparseIous.fromDense(self.ious, .1)
+        self.assertEqual(above.nnz, 4)
+        np.testing.assert_array_equal(above.toarray(), np.where(self.ious > .1, self.ious, 0))
+        self.assertEqual(SparseIous.fromDense([]), [])
+
+class TestEvaluateSparse(unittest.TestCase):
+    def evaluate(self, iouType, sparse):
+        ds = cocodata.dataset(24)
+        gt = cocodata.coco(ds)
+        if iouType == 'keypoints':
+            res = cocodata.keypointResults(ds, 24)
+        else:
+            res = cocodata.boxResults(ds, 24, segm=iouType == 'segm')
+        E = COCOeval(gt, gt.loadRes(res), iouType)
+        E.params.useGtIgnore = 0
+        E.evaluate(sparse=sparse)
+        E.accumulate()
+        E.summarize()
+        return E
+
+    def check(self, iouType, sparse):
+        ref = self.evaluate(iouType, None)
+        E = self.evaluate(iouType, sparse)
+        stored = 0
+        for key, o in E.ious.items():
+            if len(o) > 0:
+                self.assertTrue(isinstance(o, SparseIous))
+                np.testing.assert_array_equal(o.toarray(), np.where(ref.ious[key] > sparse, ref.ious[key], 0))
+                stored += o.nnz
+        self.assertTrue(stored > 0)
+        for e, r in zip(E.evalImgs, ref.evalImgs):
+            if r is None:
+                self.assertTrue(e is None)
+                continue
+            np.testing.assert_array_equal(e['dtMatches'], r['dtMatches'])
+            np.testing.assert_array_equal(e['gtMatches'], r['gtMatches'])
+        np.testing.assert_array_equal(E.stats, ref.stats)
+
+    def test_bbox(self):
+        self.check('bbox', 0)
+
+    def test_segm(self):
+        self.check('segm', 0)
+
+    def test_keypoints(self):
+        self.check('keypoints', .1)
+
+    def test_threshold(self):
+        E = COCOeval(iouType='keypoints')
+        self.assertRaises(Exception, E.evaluate, sparse=.5)
+        self.assertRaises(Exception, E.evaluate, check_scores=True, sparse=.1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import copy
+import unittest
+import numpy as np
+from pycocotools.cocoeval import COCOeval
+import cocodata
+
+class TestSubset(unittest.TestCase):
+    def setUp(self):
+        self.ds = cocodata.dataset(17)
+        self.imgIds = [img['id'] for img in self.ds['images']][1::3] + [-1]
+        self.results = cocodata.keypointResults(self.ds, 17)
+
+    def check(self, gt):
+        sub = gt.subset(self.imgIds)
+        imgIds = set(self.imgIds)
+        anns = [ann for ann in self.ds['annotations'] if ann['image_id'] in imgIds]
+        self.assertEqual(sorted(sub.getImgIds()), sorted(imgIds - set([-1])))
+        self.assertEqual(sub.loadAnns(sub.getAnnIds()), anns)
+        self.assertEqual(sub.getAnnIds(catIds=[1], iscrowd=False),
+                         gt.getAnnIds(imgIds=sorted(imgIds), catIds=[1], iscrowd=False))
+        self.assertEqual(sub.loadImgs(self.imgIds[0]), gt.loadImgs(self.imgIds[0]))
+        # the subset shares the annotations of gt
+        self.assertTrue(sub.loadAnns(anns[0]['id'])[0] is gt.loadAnns(anns[0]['id'])[0])
+
+    def test_dict(self):
+        self.check(cocodata.coco(self.ds))
+
+    def test_columnar(self):
+        self.check(cocodata.coco(self.ds, columnar=True))
+
+    def test_evaluate(self):
+        # evaluating the subset views matches restricting params.imgIds
+        gt = cocodata.coco(self.ds)
+        dt = gt.loadRes(copy.deepcopy(self.results))
+        ref = COCOeval(gt, dt, 'keypoints')
+        ref.params.imgIds = sorted(self.imgIds[:-1])
+        E = COCOeval(gt, dt, 'keypoints', imgIds=self.imgIds)
+        self.assertEqual(E.params.imgIds, ref.params.imgIds)
+        for e in [ref, E]:
+            e.evaluate()
+            e.accumulate()
+            e.summarize()
+        self.assertEqual(len(E.evalImgs), len(ref.evalImgs))
+        for e, r in zip(E.evalImgs, ref.evalImgs):
+            if r is None:
+                self.assertTrue(e is None)
+                continue
+            self.assertEqual(e['dtIds'], r['dtIds'])
+            np.testing.assert_array_equal(e['dtMatches'], r['dtMatches'])
+        np.testing.assert_array_equal(E.stats, ref.stats)
+
+if __name__ == '__main__':
+    unittest.main()
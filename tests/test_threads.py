@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+from multiprocessing.pool import ThreadPool
+import pycocotools.mask as maskUtils
+from pycocotools.cocoeval import COCOeval
+import cocodata
+
+class TestThreads(unittest.TestCase):
+    def evaluate(self, iouType, threads):
+        ds = cocodata.dataset(20)
+        gt = cocodata.coco(ds)
+        E = COCOeval(gt, gt.loadRes(cocodata.boxResults(ds, 20, segm=iouType == 'segm')), iouType)
+        E.params.useGtIgnore = 0
+        E.evaluate(threads=threads)
+        E.accumulate()
+        E.summarize()
+        return E
+
+    def check(self, iouType):
+        ref = self.evaluate(iouType, 1)
+        E = self.evaluate(iouType, 4)
+        for key in ref.ious:
+            np.testing.assert_array_equal(E.ious[key], ref.ious[key])
+        for e, r in zip(E.evalImgs, ref.evalImgs):
+            if r is None:
+                self.assertTrue(e is None)
+                continue
+            np.testing.assert_array_equal(e['dtMatches'], r['dtMatches'])
+        np.testing.assert_array_equal(E.stats, ref.stats)
+
+    def test_segm(self):
+        self.check('segm')
+
+    def test_bbox(self):
+        self.check('bbox')
+
+    def test_mask_api(self):
+        # the mask api called from several threads at once
+        rs = np.random.RandomState(20)
+        masks = [np.asfortranarray(rs.rand(60, 80, 5) > .7).astype(np.uint8) for i in range(8)]
+        rles = [maskUtils.encode(m) for m in masks]
+        def run(rle):
+            return maskUtils.iou(rle, rle, [0] * len(rle)), maskUtils.area(rle), maskUtils.decode(rle), \
+                   maskUtils.decode(maskUtils.merge(rle))
+        ref = [run(rle) for rle in rles]
+        pool = ThreadPool(4)
+        try:
+            out = pool.map(run, rles)
+        finally:
+            pool.close()
+            pool.join()
+        for o, r, m in zip(out, ref, masks):
+            for a, b in zip(o, r):
+                np.testing.assert_array_equal(a, b)
+            np.testing.assert_array_equal(o[2], m)
+
+if __name__ == '__main__':
+    unittest.main()